@@ -0,0 +1,178 @@
+"""Concurrency benchmark for seat booking.
+
+Creates --flights flights with --seats seats each in the configured database (DATABASE_* environment variables)
+and fires --bookings passenger creations at them, spread round robin over the flights, from --concurrency
+connections at once. With the default of one flight every booking contends for the same row lock, with many
+flights the row locks do not collide and any remaining queueing is on locks shared by all bookings, such as the
+one Postgres takes for commits that NOTIFY. While the bookings run, pg_stat_activity is sampled to count the
+sessions waiting on a lock, by lock type. Afterwards the benchmark checks that every flight got exactly
+min(seats, its bookings) passengers and that the inventories match, then reports the latency percentiles of
+booked and rejected requests.
+
+--strategy naive runs the same load through a read-then-write booking (SELECT the seat count, then INSERT and
+UPDATE) to show the overbooking the conditional UPDATE prevents.
+
+The flight and its passengers are deleted again unless --keep is given.
+
+Usage:
+    python -m benchmarks.booking_contention --seats 100 --bookings 5000 --concurrency 64
+    python -m benchmarks.booking_contention --flights 1000 --seats 10 --bookings 10000 --concurrency 64
+    python -m benchmarks.booking_contention --strategy naive --output booking.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import statistics
+import sys
+import time
+from collections import Counter
+
+from sqlalchemy import select, text, insert, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from benchmarks.common import percentiles, write_results
+from flightapi import async_crud
+from flightapi.database import ASYNC_SQLALCHEMY_DATABASE_URL
+from flightapi.models import Flights, Passengers
+from flightapi.schemas.passengers import PassengersCreate
+from flightapi.seats import SeatsUnavailableError
+
+
+async def book_naive(db: AsyncSession, passenger: PassengersCreate):
+    # The check and the write are separate statements, concurrent bookings all see the same count
+    seats = await db.scalar(select(Flights.available_seats).where(Flights.id == passenger.flight_id))
+    if seats is not None and seats <= 0:
+        raise SeatsUnavailableError(f"Flight with id {passenger.flight_id} is sold out")
+    await db.execute(insert(Passengers.__table__).values(**passenger.model_dump()))
+    await db.execute(text("UPDATE flights SET available_seats = :seats WHERE id = :id"),
+                     {"seats": None if seats is None else seats - 1, "id": passenger.flight_id})
+    await db.commit()
+
+
+async def sample_lock_waits(engine, stop: asyncio.Event) -> tuple[list[int], Counter]:
+    # transactionid and tuple waits are bookings queueing on a flight's row, object waits on pg_database are
+    # notifying commits queueing on the global notify lock
+    samples, by_event = [], Counter()
+    async with engine.connect() as connection:
+        while not stop.is_set():
+            waits = (await connection.execute(text(
+                "SELECT wait_event FROM pg_stat_activity WHERE wait_event_type = 'Lock' "
+                "AND datname = current_database()"
+            ))).scalars().all()
+            samples.append(len(waits))
+            by_event.update(waits)
+            await asyncio.sleep(0.01)
+    return samples, by_event
+
+
+async def run(args) -> dict:
+    engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, pool_size=args.concurrency + 1, max_overflow=0)
+    sessions = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+
+    async with engine.begin() as connection:
+        flight_ids = (await connection.scalars(insert(Flights.__table__).returning(Flights.id), [
+            {"flight_status": "On Time", "flight_number": "BENCH", "available_seats": args.seats,
+             "departure_date": datetime.datetime.now(datetime.timezone.utc), "duration": 60, "fare": 100}
+            for _ in range(args.flights)
+        ])).all()
+
+    book = async_crud.create_passengers if args.strategy == "conditional" else book_naive
+    booked, rejected, failed = [], [], []
+    queue = asyncio.Queue()
+    for index in range(args.bookings):
+        queue.put_nowait(PassengersCreate(flight_id=flight_ids[index % len(flight_ids)], first_name="Bench",
+                                          last_name="Mark", date_of_birth=datetime.date(1990, 1, 1),
+                                          passport_number="BENCH"))
+    start_line = asyncio.Event()
+
+    async def worker():
+        async with sessions() as db:
+            # Connect before the start line so connection setup does not end up in the booking latencies
+            await db.execute(text("SELECT 1"))
+            await db.commit()
+            await start_line.wait()
+            while not queue.empty():
+                passenger = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    await book(db, passenger)
+                    booked.append(time.perf_counter() - start)
+                except SeatsUnavailableError:
+                    rejected.append(time.perf_counter() - start)
+                except Exception as error:
+                    await db.rollback()
+                    failed.append(repr(error))
+
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_lock_waits(engine, stop))
+    workers = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+    await asyncio.sleep(0.5)
+    wall_start = time.perf_counter()
+    start_line.set()
+    await asyncio.gather(*workers)
+    wall = time.perf_counter() - wall_start
+    stop.set()
+    lock_waits, lock_waits_by_event = await sampler
+
+    async with engine.begin() as connection:
+        passengers = dict((await connection.execute(
+            select(Passengers.flight_id, func.count()).where(Passengers.flight_id.in_(flight_ids))
+            .group_by(Passengers.flight_id)
+        )).all())
+        seats_left = dict((await connection.execute(
+            select(Flights.id, Flights.available_seats).where(Flights.id.in_(flight_ids))
+        )).all())
+        if not args.keep:
+            await connection.execute(Passengers.__table__.delete().where(Passengers.flight_id.in_(flight_ids)))
+            await connection.execute(Flights.__table__.delete().where(Flights.id.in_(flight_ids)))
+    await engine.dispose()
+
+    requested = Counter(flight_ids[index % len(flight_ids)] for index in range(args.bookings))
+    expected = {flight_id: min(args.seats, requested[flight_id]) for flight_id in flight_ids}
+    return {
+        "strategy": args.strategy,
+        "flights": args.flights,
+        "seats": args.seats,
+        "bookings": args.bookings,
+        "concurrency": args.concurrency,
+        "wall_s": round(wall, 3),
+        "bookings_per_s": round(args.bookings / wall, 1),
+        "booked": percentiles(booked),
+        "rejected": percentiles(rejected),
+        "errors": len(failed),
+        "error_samples": failed[:5],
+        "passengers_created": sum(passengers.values()),
+        "seats_left": sum(seats_left.values()),
+        "lock_waiters_max": max(lock_waits, default=0),
+        "lock_waiters_mean": round(statistics.fmean(lock_waits), 2) if lock_waits else 0,
+        "lock_wait_samples_by_event": dict(lock_waits_by_event.most_common()),
+        "consistent": len(booked) == sum(expected.values()) and all(
+            passengers.get(flight_id, 0) == expected[flight_id]
+            and seats_left[flight_id] == args.seats - expected[flight_id]
+            for flight_id in flight_ids
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flights", type=int, default=1, help="flights the bookings are spread over")
+    parser.add_argument("--seats", type=int, default=100, help="seats per flight")
+    parser.add_argument("--bookings", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64, help="stay below the server's max_connections")
+    parser.add_argument("--strategy", choices=("conditional", "naive"), default="conditional")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark flight and its passengers")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    write_results(results, args.output)
+    if not results["consistent"]:
+        print(f"FAIL: {results['passengers_created']} passengers for {args.flights} x {args.seats} seats, "
+              f"{results['seats_left']} seats left", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Helpers shared by the benchmarks."""
+
+import json
+import statistics
+
+
+def percentiles(samples: list[float]) -> dict:
+    """
+    Summarize latencies.
+
+    Args:
+        samples (list[float]): The latencies in seconds.
+
+    Returns:
+        dict: The count and the p50, p95, p99, max and mean latencies in milliseconds.
+    """
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+
+    def at(fraction):
+        return round(1000 * samples[min(len(samples) - 1, int(fraction * len(samples)))], 3)
+
+    return {"count": len(samples), "p50_ms": at(0.50), "p95_ms": at(0.95), "p99_ms": at(0.99),
+            "max_ms": round(1000 * samples[-1], 3), "mean_ms": round(1000 * statistics.fmean(samples), 3)}
+
+
+def write_results(results: dict, output: str = None):
+    """
+    Print the results and optionally save them as JSON.
+
+    Args:
+        results (dict): The benchmark results.
+        output (str, optional): The file to write the results to. Defaults to None.
+    """
+    print(json.dumps(results, indent=2))
+    if output:
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
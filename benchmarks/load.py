@@ -0,0 +1,432 @@
+"""Repeatable load test of the API against a local Postgres.
+
+Starts a throwaway Postgres cluster with pytest-postgresql's executor (pg_ctl has to be on the PATH or given
+with --pg-ctl, the server needs PostGIS and, like any Postgres, refuses to run as root), migrates it and seeds
+it at one of the flightapi.db_seed SCALES. Then it runs scripted workloads against the ASGI app in process,
+through httpx, each with --concurrency clients firing --requests requests: filtered lists, flight creates,
+updates and deletes and a booking burst on a few nearly sold out flights. Flights are seeded from a fixed
+--start-date and the workloads take their dates from the seeded departures, never from the clock, so a run
+sends the same requests whatever the day.
+
+Throughput and p50/p95/p99 latencies are reported per workload and written as JSON, together with the commit
+and the scale, so runs of different versions can be compared with --compare.
+
+--postgres env uses the database of the DATABASE_* environment variables instead, seeding it on top of what
+it holds unless --skip-seed is given. Only ever point it at a scratch database.
+
+Usage:
+    python -m benchmarks.load --scale 10k
+    python -m benchmarks.load --scale 1m --concurrency 64 --output load-1m.json
+    python -m benchmarks.load --scale 1m --compare load-1m.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from benchmarks.common import percentiles, write_results
+
+# Flights with few seats the booking burst fights over, every one of them gets BURST_SEATS seats
+BURST_FLIGHTS = 4
+BURST_SEATS = 50
+# First departure day of the seeded flights, fixed rather than today so that runs on different days see the same
+# data and send the same requests
+SEED_START_DATE = datetime.date(2026, 1, 1)
+
+
+@contextmanager
+def throwaway_postgres(pg_ctl: str, database: str, user: str, password: str):
+    """
+    Run a temporary Postgres cluster and point the DATABASE_* environment variables at it.
+
+    Args:
+        pg_ctl (str): The pg_ctl executable.
+        database (str): The database to create.
+        user (str): The superuser of the cluster.
+        password (str): The password of the superuser.
+    """
+    from port_for import select_random
+    from pytest_postgresql.executor import PostgreSQLExecutor
+    from pytest_postgresql.janitor import DatabaseJanitor
+
+    directory = tempfile.mkdtemp(prefix="flightapi-load-")
+    port = select_random()
+    executor = PostgreSQLExecutor(
+        executable=pg_ctl, host="127.0.0.1", port=port, datadir=os.path.join(directory, "data"),
+        unixsocketdir=directory, logfile=os.path.join(directory, "postgresql.log"), startparams="-w",
+        dbname=database, user=user, password=password, postgres_options="-c max_connections=200",
+    )
+    try:
+        executor.start()
+        DatabaseJanitor(user, "127.0.0.1", port, database, executor.version, password).init()
+        os.environ.update(DATABASE_HOST="127.0.0.1", DATABASE_PORT=str(port), DATABASE_NAME=database,
+                          DATABASE_USERNAME=user, DATABASE_PASSWORD=password)
+        yield
+    finally:
+        executor.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def table_counts() -> dict:
+    from sqlalchemy import text
+
+    from flightapi.database import engine
+
+    with engine.connect() as connection:
+        return {table: connection.scalar(text(f"SELECT count(*) FROM {table}"))
+                for table in ("airports", "flights", "passengers")}
+
+
+def sample_data() -> dict:
+    """
+    Get what the workloads pick their parameters from, so they fit whatever data the database holds.
+
+    Returns:
+        dict: The airport ids, codes and countries, a sample of passenger last names, the highest passenger id
+            and the departure range of the flights, which defaults to the one of a seed at SEED_START_DATE.
+    """
+    from sqlalchemy import text
+
+    from flightapi.database import engine
+
+    with engine.connect() as connection:
+        airports = connection.execute(text("SELECT id, code, country FROM airports ORDER BY id")).all()
+        return {
+            "airport_ids": [airport.id for airport in airports],
+            "airport_codes": [airport.code for airport in airports],
+            "countries": sorted({airport.country for airport in airports}),
+            "last_names": connection.scalars(text(
+                "SELECT DISTINCT last_name FROM passengers WHERE id <= 100000 ORDER BY last_name LIMIT 1000"
+            )).all(),
+            "max_passenger_id": connection.scalar(text("SELECT coalesce(max(id), 1) FROM passengers")),
+            **connection.execute(text(
+                "SELECT coalesce(min(departure_date), :start) AS first_departure, "
+                "coalesce(max(departure_date), :start + interval '365 days') AS last_departure FROM flights"
+            ), {"start": datetime.datetime.combine(SEED_START_DATE, datetime.time(), datetime.timezone.utc)}
+            ).one()._asdict(),
+        }
+
+
+def check_bookings(flight_ids: list[int], booked: int) -> bool:
+    """
+    Check that the booking burst neither overbooked nor lost a booking.
+
+    Args:
+        flight_ids (list[int]): The flights of the burst.
+        booked (int): The number of bookings that were answered with 200.
+
+    Returns:
+        bool: Whether every flight has its passengers plus its available seats equal to BURST_SEATS, and as many
+            passengers as there were successful bookings.
+    """
+    from sqlalchemy import text
+
+    from flightapi.database import engine
+
+    with engine.connect() as connection:
+        rows = connection.execute(text(
+            "SELECT f.available_seats, (SELECT count(*) FROM passengers p WHERE p.flight_id = f.id) AS passengers "
+            "FROM flights f WHERE f.id = ANY(:ids)"
+        ), {"ids": flight_ids}).all()
+    return (all(row.available_seats >= 0 and row.available_seats + row.passengers == BURST_SEATS for row in rows)
+            and sum(row.passengers for row in rows) == booked)
+
+
+def flight_body(rng: random.Random, airport_ids: list[int], first_departure: datetime.datetime,
+                seats: int = None) -> dict:
+    departure = first_departure + datetime.timedelta(minutes=rng.randrange(365 * 24 * 60))
+    return {
+        "flight_status": "On Time",
+        "flight_number": f"LT{rng.randrange(10000)}",
+        "available_seats": rng.randrange(300) if seats is None else seats,
+        "departure_airport_id": rng.choice(airport_ids),
+        "arrival_airport_id": rng.choice(airport_ids),
+        "departure_date": departure.isoformat(),
+        "arrival_date": (departure + datetime.timedelta(hours=2)).isoformat(),
+        "duration": 120,
+        "fare": round(rng.uniform(50, 1000), 2),
+    }
+
+
+class Workloads:
+    """
+    The scripted workloads, each a function returning the next request as (method, url, json body).
+
+    Args:
+        rng (random.Random): The random generator of the run.
+        airport_ids (list[int]): The ids of the airports.
+        airport_codes (list[str]): The codes of the airports.
+        countries (list[str]): The countries of the airports.
+        last_names (list[str]): Last names of passengers.
+        max_passenger_id (int): The highest passenger id.
+        first_departure (datetime.datetime): The earliest departure of the flights.
+        last_departure (datetime.datetime): The latest departure of the flights.
+    """
+
+    def __init__(self, rng: random.Random, airport_ids: list[int], airport_codes: list[str], countries: list[str],
+                 last_names: list[str], max_passenger_id: int, first_departure: datetime.datetime,
+                 last_departure: datetime.datetime):
+        self.rng = rng
+        self.airport_ids = airport_ids
+        self.airport_codes = airport_codes
+        self.countries = countries
+        self.last_names = last_names
+        self.max_passenger_id = max_passenger_id
+        self.first_departure = first_departure
+        # The week long departure windows of list_flights start on one of these days
+        self.window_days = max((last_departure - first_departure).days - 6, 1)
+        # Flights made by create_flight, then updated by update_flight and removed by delete_flight
+        self.created = []
+        self.burst_flights = []
+
+    def list_flights(self):
+        rng, params = self.rng, [("limit", 50), ("sort", self.rng.choice(("id", "departure_date", "fare")))]
+        kind = rng.randrange(3)
+        if kind == 0:
+            params += [("departure_airport", rng.choice(self.airport_codes)),
+                       ("arrival_airport", rng.choice(self.airport_codes))]
+        if kind == 1:
+            params.append(("departure_airport", rng.choice(self.airport_codes)))
+        start = self.first_departure + datetime.timedelta(days=rng.randrange(self.window_days))
+        params += [("departure_from", start.isoformat()),
+                   ("departure_to", (start + datetime.timedelta(days=7)).isoformat())]
+        return "GET", "/flights/list", None, params
+
+    def list_airports(self):
+        params = [("limit", 100)]
+        if self.rng.random() < 0.5:
+            params.append(("country", self.rng.choice(self.countries)))
+        return "GET", "/airports/list", None, params
+
+    def list_passengers(self):
+        if self.last_names and self.rng.random() < 0.5:
+            params = [("last_name", self.rng.choice(self.last_names))]
+        else:
+            params = [("passenger_id", self.rng.randint(1, self.max_passenger_id)) for _ in range(10)]
+        return "GET", "/passengers/list", None, params + [("limit", 50)]
+
+    def create_flight(self):
+        return "POST", "/flights/create", flight_body(self.rng, self.airport_ids, self.first_departure), None
+
+    def update_flight(self):
+        flight_id = self.rng.choice(self.created)
+        body = flight_body(self.rng, self.airport_ids, self.first_departure)
+        return "PUT", f"/flights/update/{flight_id}", body, None
+
+    def delete_flight(self):
+        return "DELETE", f"/flights/delete/{self.created.pop()}", None, None
+
+    def booking_burst(self):
+        body = {"flight_id": self.rng.choice(self.burst_flights), "first_name": "Load", "last_name": "Test",
+                "date_of_birth": "1990-01-01", "passport_number": f"LT{self.rng.randrange(10 ** 8)}"}
+        return "POST", "/passengers/create", body, None
+
+
+# The workloads in the order they run and the statuses that are not errors
+WORKLOADS = (
+    ("list_flights", {200}),
+    ("list_airports", {200}),
+    ("list_passengers", {200}),
+    ("create_flight", {200}),
+    ("update_flight", {200}),
+    ("delete_flight", {200}),
+    ("booking_burst", {200, 409}),
+)
+
+
+async def run_workload(client, make_request, requests: int, concurrency: int, expected: set,
+                       on_response=None) -> dict:
+    """
+    Fire requests from concurrent clients and measure them.
+
+    Args:
+        client (httpx.AsyncClient): The client bound to the app.
+        make_request: Returns the next (method, url, json, params).
+        requests (int): The number of requests.
+        concurrency (int): The number of requests in flight at once.
+        expected (set): The statuses that are not errors.
+        on_response (optional): Called with every response.
+
+    Returns:
+        dict: The throughput, the latency percentiles, the status counts and samples of unexpected responses.
+    """
+    latencies, statuses, errors = [], {}, []
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            method, url, body, params = make_request()
+            start = time.perf_counter()
+            response = await client.request(method, url, json=body, params=params)
+            latencies.append(time.perf_counter() - start)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            if response.status_code not in expected and len(errors) < 5:
+                errors.append(f"{method} {url} {response.status_code}: {response.text[:200]}")
+            if on_response:
+                on_response(response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(requests / wall, 1),
+        "latency": percentiles(latencies),
+        "statuses": statuses,
+        "unexpected": sum(count for status, count in statuses.items() if int(status) not in expected),
+        "unexpected_samples": errors,
+    }
+
+
+async def run(args) -> dict:
+    import httpx
+
+    from flightapi.main import app
+
+    rng = random.Random(args.seed)
+    workloads = Workloads(rng, **sample_data())
+    selected = [name for name, _ in WORKLOADS if name in args.workloads]
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=None) as client:
+            for _ in range(BURST_FLIGHTS):
+                body = flight_body(rng, workloads.airport_ids, workloads.first_departure, BURST_SEATS)
+                response = await client.post("/flights/create", json=body)
+                workloads.burst_flights.append(response.json()["id"])
+
+            def remember_created(response):
+                if response.status_code == 200:
+                    workloads.created.append(response.json()["id"])
+
+            for name, expected in WORKLOADS:
+                if name not in selected:
+                    continue
+                make_request = getattr(workloads, name)
+                requests = args.requests
+                if name in ("update_flight", "delete_flight"):
+                    if not workloads.created:
+                        print(f"skipping {name}, it needs create_flight to run first", file=sys.stderr)
+                        continue
+                    requests = min(requests, len(workloads.created))
+                warmup = args.warmup if name in ("list_flights", "list_airports", "list_passengers") else 0
+                if warmup:
+                    await run_workload(client, make_request, warmup, args.concurrency, expected)
+                print(f"running {name}", file=sys.stderr)
+                results[name] = await run_workload(
+                    client, make_request, requests, args.concurrency, expected,
+                    remember_created if name == "create_flight" else None,
+                )
+                if name == "booking_burst":
+                    booked = results[name]["statuses"].get("200", 0)
+                    results[name]["consistent"] = check_bookings(workloads.burst_flights, booked)
+    return results
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: dict, baseline: dict):
+    print(f"\ncompared with {baseline['commit']} ({baseline['scale']}):")
+    print(f"{'workload':<16}{'rps':>18}{'p50 ms':>20}{'p95 ms':>20}{'p99 ms':>20}")
+    for name, current in results["workloads"].items():
+        before = baseline["workloads"].get(name)
+        if not before:
+            continue
+        cells = [f"{before['throughput_rps']:>8} -> {current['throughput_rps']:<8}"]
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            cells.append(f"{before['latency'].get(key, 0):>8} -> {current['latency'].get(key, 0):<9}")
+        print(f"{name:<16}" + " ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    # The keys of flightapi.db_seed.SCALES, flightapi is only imported once the DATABASE_* variables are set
+    parser.add_argument("--scale", choices=("small", "10k", "1m", "10m"), default="10k")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per workload")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=100, help="unmeasured requests before each read workload")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start-date", type=datetime.date.fromisoformat, default=SEED_START_DATE,
+                        help=f"first departure day of the seeded flights, {SEED_START_DATE} by default")
+    parser.add_argument("--workloads", default=",".join(name for name, _ in WORKLOADS),
+                        type=lambda value: value.split(","), help="comma separated, all by default")
+    parser.add_argument("--postgres", choices=("throwaway", "env"), default="throwaway")
+    parser.add_argument("--pg-ctl", default=shutil.which("pg_ctl"), help="the pg_ctl of the throwaway cluster")
+    parser.add_argument("--skip-seed", action="store_true", help="with --postgres env, use the data as it is")
+    parser.add_argument("--output", help="defaults to load-<scale>-<commit>.json")
+    parser.add_argument("--compare", help="a previous results file to compare with")
+    args = parser.parse_args()
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    @contextmanager
+    def postgres():
+        if args.postgres == "env":
+            yield
+            return
+        if not args.pg_ctl:
+            parser.error("pg_ctl was not found, give it with --pg-ctl")
+        if os.geteuid() == 0:
+            parser.error("Postgres does not run as root, run the throwaway cluster as another user")
+        with throwaway_postgres(args.pg_ctl, "flight_db", "flight_user", "Password1!"):
+            yield
+
+    with postgres():
+        # The app reads the DATABASE_* environment variables when it is imported, so only from here on
+        from flightapi.db_seed import SCALES, seed
+        from flightapi.migrate import upgrade
+
+        upgrade()
+        if args.postgres == "throwaway" or not args.skip_seed:
+            start = time.perf_counter()
+            seed(*SCALES[args.scale], seed_value=args.seed, start_date=args.start_date,
+                 defer_indexes=args.postgres == "throwaway")
+            print(f"seeded in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+        rows = table_counts()
+        workloads = asyncio.run(run(args))
+
+    results = {
+        "commit": git_commit(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "scale": args.scale,
+        "rows": rows,
+        "seed": args.seed,
+        "concurrency": args.concurrency,
+        "postgres": args.postgres,
+        "workloads": workloads,
+    }
+    write_results(results, args.output or f"load-{args.scale}-{results['commit']}.json")
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+    failed = [name for name, workload in workloads.items()
+              if workload["unexpected"] or not workload.get("consistent", True)]
+    if failed:
+        print(f"FAIL: unexpected responses or overbooking in {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
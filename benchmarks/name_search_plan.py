@@ -0,0 +1,131 @@
+"""Query plan benchmark for prefix and fuzzy passenger name searches on /passengers/list.
+
+Optionally populates the configured database (DATABASE_* environment variables) with synthetic passengers,
+then runs EXPLAIN (ANALYZE, BUFFERS) on the statements /passengers/list builds for name_match=fuzzy and
+name_match=prefix and checks that they use the pg_trgm indexes, never a sequential scan: the GIN indexes of
+passengers (50911a70c1d6 migration) for prefix searches, the GiST indexes of the name dictionaries
+(66c0ba963254 migration) for fuzzy ones. The database needs the pg_trgm extension.
+
+The fuzzy searches look for a passenger's last name with one letter dropped, alone and together with a
+first name, the prefix search for the first five letters of it.
+
+Only ever point this at a scratch database, --populate inserts millions of rows.
+
+Usage:
+    python -m benchmarks.name_search_plan --populate --passengers 1000000
+    python -m benchmarks.name_search_plan --output name_plan.json
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from sqlalchemy import select, text
+
+from flightapi.async_crud import PASSENGERS_LIST_COLUMNS
+from flightapi.database import engine
+from flightapi.filters import filter_passengers, order_by_name_distance
+from flightapi.models import Passengers
+from flightapi.pagination import keyset_segments, page_size
+
+# Names are made of syllables, so they share trigrams the way real names do and misspellings still match
+SYLLABLES = ("an", "ber", "cor", "dan", "el", "fi", "gar", "han", "is", "jo", "kat", "lin", "mar", "nor", "ol",
+             "pet", "quin", "ros", "sam", "tor", "ul", "vic", "wil", "xa", "yor", "zan")
+
+
+def populate(connection, passengers: int, batch_size: int = 1000000):
+    syllables = "ARRAY[" + ", ".join(f"'{syllable}'" for syllable in SYLLABLES) + "]"
+    for start in range(0, passengers, batch_size):
+        count = min(batch_size, passengers - start)
+        connection.execute(text(
+            f"INSERT INTO passengers (first_name, last_name, passport_number, date_of_birth) "
+            f"SELECT initcap(s[1 + g % 26] || s[1 + (g / 26) % 26] "
+            f"               || CASE WHEN g % 3 = 0 THEN s[1 + (g / 676) % 26] ELSE '' END), "
+            f"       initcap(s[1 + (g * 7) % 26] || s[1 + (g / 17) % 26] || s[1 + (g / 451) % 26] "
+            f"               || CASE WHEN g % 2 = 0 THEN 'son' ELSE 'er' END), "
+            f"       'NS' || g, date '1950-01-01' + g % 20000 "
+            f"FROM generate_series(:first, :last) g, (SELECT {syllables} AS s) syllables"
+        ), {"first": start + 1, "last": start + count})
+        connection.commit()
+        print(f"inserted {start + count}/{passengers} passengers", file=sys.stderr)
+    connection.execute(text("ANALYZE passengers"))
+    connection.commit()
+
+
+def plan_nodes(plan: dict) -> list[dict]:
+    nodes = [{key: plan.get(key) for key in ("Node Type", "Relation Name", "Index Name", "Actual Total Time")}]
+    for child in plan.get("Plans", []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+def explain(connection, statement) -> dict:
+    # Bound parameters rather than literal_binds, which renders the ESCAPE '\\' of prefix searches doubled
+    compiled = statement.compile(dialect=connection.dialect)
+    sql = str(compiled)
+    start = time.perf_counter()
+    plan = connection.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", compiled.params).scalar()[0]
+    nodes = plan_nodes(plan["Plan"])
+    # passengers and the passenger_first_names / passenger_last_names dictionaries
+    passenger_scans = [node for node in nodes if (node["Relation Name"] or "").startswith("passenger")
+                       or (node["Index Name"] or "").startswith("ix_passenger")]
+    return {
+        "sql": sql,
+        "params": {key: str(value) for key, value in compiled.params.items()},
+        "wall_ms": round(1000 * (time.perf_counter() - start), 3),
+        "execution_ms": plan["Execution Time"],
+        "planning_ms": plan["Planning Time"],
+        "passenger_scans": passenger_scans,
+        "trigram_index": (all(node["Node Type"] != "Seq Scan" for node in passenger_scans)
+                          and any((node["Index Name"] or "").endswith("_trgm") for node in passenger_scans)),
+    }
+
+
+def fuzzy_statement(first_name: list[str] = None, last_name: list[str] = None, limit: int = 100):
+    # As async_crud.get_passengers builds it for name_match=fuzzy
+    return order_by_name_distance(select(*PASSENGERS_LIST_COLUMNS), first_name, last_name, page_size(limit))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--populate", action="store_true", help="insert synthetic passengers first")
+    parser.add_argument("--passengers", type=int, default=1000000)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        if args.populate:
+            populate(connection, args.passengers)
+        passenger_count = connection.execute(text("SELECT count(*) FROM passengers")).scalar()
+        # A passenger from the middle of the table, so the searched names exist whatever the data
+        first_name, last_name = connection.execute(text(
+            "SELECT first_name, last_name FROM passengers WHERE length(last_name) >= 6 AND length(first_name) >= 3 "
+            "ORDER BY id OFFSET :offset LIMIT 1"
+        ), {"offset": passenger_count // 2}).one()
+        misspelled = last_name[:3] + last_name[4:]
+
+        prefix = filter_passengers(select(*PASSENGERS_LIST_COLUMNS), last_name=[last_name[:5]], name_match="prefix")
+        prefix = keyset_segments(prefix, "id", Passengers.id, Passengers.id, None)[0]
+        statements = {
+            "fuzzy_last_name": fuzzy_statement(last_name=[misspelled]),
+            "fuzzy_first_and_last_name": fuzzy_statement(first_name=[first_name], last_name=[misspelled]),
+            "prefix_last_name": prefix.limit(page_size(100)),
+        }
+        results = {"passengers": passenger_count, "queries": {name: explain(connection, statement)
+                                                              for name, statement in statements.items()}}
+
+    for name, result in results["queries"].items():
+        scans = ", ".join(f"{node['Node Type']} {node['Index Name'] or ''}".strip()
+                          for node in result["passenger_scans"])
+        print(f"{name}: {result['execution_ms']:.2f} ms, passengers read by: {scans}")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    if not all(result["trigram_index"] for result in results["queries"].values()):
+        print("FAIL: a name search did not use the trigram indexes of passengers", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Query plan benchmark for route searches on /flights/list.
+
+Optionally populates the configured database (DATABASE_* environment variables) with synthetic airports and
+flights, then runs EXPLAIN (ANALYZE, BUFFERS) on the statement /flights/list builds for a route plus departure
+window search and checks that the flights table is read through an index, never a sequential scan.
+
+Only ever point this at a scratch database, --populate inserts millions of rows.
+
+Usage:
+    python -m benchmarks.route_search_plan --populate --flights 10000000
+    python -m benchmarks.route_search_plan --output route_plan.json
+"""
+
+import argparse
+import datetime
+import json
+import sys
+import time
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+
+from flightapi.database import engine
+from flightapi.filters import filter_flights
+from flightapi.models import Flights
+from flightapi.pagination import keyset_segments
+
+# Airports get synthetic IATA style codes AAA, AAB, ... so any route can be queried by code
+CODE_SQL = "chr(65 + (g / 676) % 26) || chr(65 + (g / 26) % 26) || chr(65 + g % 26)"
+
+
+def airport_code(index: int) -> str:
+    return chr(65 + (index // 676) % 26) + chr(65 + (index // 26) % 26) + chr(65 + index % 26)
+
+
+def populate(connection, airports: int, flights: int, batch_size: int = 1000000):
+    connection.execute(text(
+        f"INSERT INTO airports (code, name, city, country) "
+        f"SELECT {CODE_SQL}, 'Airport ' || g, 'City ' || g, 'Country' FROM generate_series(0, :last) g "
+        f"ON CONFLICT (code) DO NOTHING"
+    ), {"last": airports - 1})
+    ids = connection.execute(text("SELECT min(id), max(id) FROM airports")).one()
+    for start in range(0, flights, batch_size):
+        count = min(batch_size, flights - start)
+        connection.execute(text(
+            "INSERT INTO flights (flight_status, flight_number, available_seats, departure_airport_id, "
+            "arrival_airport_id, departure_date, arrival_date, duration, fare) "
+            "SELECT 'On Time', (g % 9000)::text, '150', :min_id + (random() * (:max_id - :min_id))::int, "
+            ":min_id + (random() * (:max_id - :min_id))::int, d, d + interval '2 hours', 120, "
+            "(50 + random() * 950)::numeric(8, 2) "
+            "FROM generate_series(1, :count) g, "
+            "LATERAL (SELECT now() + random() * interval '365 days' + g * interval '0 seconds' AS d) t"
+        ), {"min_id": ids[0], "max_id": ids[1], "count": count})
+        connection.commit()
+        print(f"inserted {start + count}/{flights} flights", file=sys.stderr)
+    connection.execute(text("ANALYZE airports"))
+    connection.execute(text("ANALYZE flights"))
+    connection.commit()
+
+
+def plan_nodes(plan: dict) -> list[dict]:
+    nodes = [{key: plan.get(key) for key in ("Node Type", "Relation Name", "Index Name", "Actual Total Time")}]
+    for child in plan.get("Plans", []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+def explain(connection, statement) -> dict:
+    sql = str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    start = time.perf_counter()
+    plan = connection.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")).scalar()[0]
+    nodes = plan_nodes(plan["Plan"])
+    flight_scans = [node for node in nodes if node["Relation Name"] == "flights"]
+    return {
+        "sql": sql,
+        "wall_ms": round(1000 * (time.perf_counter() - start), 3),
+        "execution_ms": plan["Execution Time"],
+        "planning_ms": plan["Planning Time"],
+        "flight_scans": flight_scans,
+        "index_only": all(node["Node Type"] != "Seq Scan" for node in flight_scans),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--populate", action="store_true", help="insert synthetic airports and flights first")
+    parser.add_argument("--airports", type=int, default=500)
+    parser.add_argument("--flights", type=int, default=10000000)
+    parser.add_argument("--departure-airport", type=int, default=1, help="index of the departure airport code")
+    parser.add_argument("--arrival-airport", type=int, default=2, help="index of the arrival airport code")
+    parser.add_argument("--window-days", type=int, default=7)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        if args.populate:
+            populate(connection, args.airports, args.flights)
+        flight_count = connection.execute(text("SELECT count(*) FROM flights")).scalar()
+
+        departure_from = datetime.datetime.now(datetime.timezone.utc)
+        route = filter_flights(select(Flights),
+                               departure_airport=[airport_code(args.departure_airport)],
+                               arrival_airport=[airport_code(args.arrival_airport)],
+                               departure_from=departure_from,
+                               departure_to=departure_from + datetime.timedelta(days=args.window_days))
+        results = {"flights": flight_count, "queries": {}}
+        for sort, column in (("id", Flights.id), ("departure_date", Flights.departure_date)):
+            statement = keyset_segments(route, sort, column, Flights.id, None)[0].limit(101)
+            results["queries"][f"route_window_sort_{sort}"] = explain(connection, statement)
+
+    for name, result in results["queries"].items():
+        scans = ", ".join(f"{node['Node Type']} {node['Index Name'] or ''}".strip() for node in result["flight_scans"])
+        print(f"{name}: {result['execution_ms']:.2f} ms, flights read by: {scans}")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    if not all(result["index_only"] for result in results["queries"].values()):
+        print("FAIL: a route search fell back to a sequential scan of flights", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Vectorized versus per row route statistics.
+
+Generates --flights synthetic flights between --airports airports with random coordinates and computes the
+/routes/stats aggregates twice: with flightapi.route_stats.compute_route_stats and with a plain Python loop
+over row tuples, the way it would be written over the rows of async_crud.get_flights. Both results are compared
+and the timings reported. Building the arrays from row tuples is timed separately, that is the conversion
+/routes/stats pays after reading the rows.
+
+Usage:
+    python -m benchmarks.route_stats --flights 1000000
+    python -m benchmarks.route_stats --output route_stats.json
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+from flightapi.route_stats import EARTH_RADIUS_KM, compute_route_stats
+
+
+def haversine_row(latitude_1, longitude_1, latitude_2, longitude_2) -> float:
+    latitude_1, longitude_1, latitude_2, longitude_2 = map(math.radians, (latitude_1, longitude_1,
+                                                                           latitude_2, longitude_2))
+    a = (math.sin((latitude_2 - latitude_1) / 2) ** 2
+         + math.cos(latitude_1) * math.cos(latitude_2) * math.sin((longitude_2 - longitude_1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def per_row_route_stats(rows: list[tuple], coordinates: dict[int, tuple[float, float]]) -> dict:
+    routes = {}
+    for departure, arrival, duration, fare in rows:
+        distance = haversine_row(*coordinates[departure], *coordinates[arrival])
+        if duration <= 0 or distance <= 0:
+            continue
+        route = routes.get((departure, arrival))
+        if route is None:
+            route = routes[(departure, arrival)] = {"flights": 0, "distance_km": distance, "fare": 0.0,
+                                                    "min_fare": fare, "max_fare": fare, "fare_per_km": 0.0,
+                                                    "duration": 0.0, "speed_kmh": 0.0}
+        route["flights"] += 1
+        route["fare"] += fare
+        route["min_fare"] = min(route["min_fare"], fare)
+        route["max_fare"] = max(route["max_fare"], fare)
+        route["fare_per_km"] += fare / distance
+        route["duration"] += duration
+        route["speed_kmh"] += distance / (duration / 60)
+    return {
+        key: {"flights": route["flights"], "distance_km": route["distance_km"],
+              "avg_fare": route["fare"] / route["flights"], "min_fare": route["min_fare"],
+              "max_fare": route["max_fare"], "avg_fare_per_km": route["fare_per_km"] / route["flights"],
+              "avg_duration": route["duration"] / route["flights"],
+              "avg_speed_kmh": route["speed_kmh"] / route["flights"]}
+        for key, route in routes.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flights", type=int, default=1000000)
+    parser.add_argument("--airports", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    airport_ids = np.arange(1, args.airports + 1)
+    latitudes, longitudes = np.full(args.airports + 1, np.nan), np.full(args.airports + 1, np.nan)
+    latitudes[airport_ids] = rng.uniform(-60, 70, args.airports)
+    longitudes[airport_ids] = rng.uniform(-180, 180, args.airports)
+    departure = rng.choice(airport_ids, args.flights)
+    arrival = rng.choice(airport_ids, args.flights)
+    duration = rng.integers(30, 900, args.flights)
+    fare = rng.uniform(20, 2000, args.flights).round(2)
+    rows = list(zip(departure.tolist(), arrival.tolist(), duration.tolist(), fare.tolist()))
+    coordinates = {int(i): (float(latitudes[i]), float(longitudes[i])) for i in airport_ids}
+
+    start = time.perf_counter()
+    columns = np.array(rows, dtype=np.float64)
+    ids = columns[:, :2].astype(np.int64)
+    array_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = compute_route_stats(ids[:, 0], ids[:, 1], columns[:, 2], columns[:, 3], latitudes, longitudes)
+    vectorized_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    baseline = per_row_route_stats(rows, coordinates)
+    baseline_time = time.perf_counter() - start
+
+    mismatches = 0
+    for index in range(len(vectorized["flights"])):
+        expected = baseline[(int(vectorized["departure_airport_id"][index]),
+                             int(vectorized["arrival_airport_id"][index]))]
+        if not all(math.isclose(float(vectorized[key][index]), expected[key], rel_tol=1e-9)
+                   for key in expected):
+            mismatches += 1
+    mismatches += abs(len(baseline) - len(vectorized["flights"]))
+
+    results = {
+        "flights": args.flights,
+        "airports": args.airports,
+        "routes": len(vectorized["flights"]),
+        "array_build_s": round(array_build, 4),
+        "vectorized_s": round(vectorized_time, 4),
+        "per_row_s": round(baseline_time, 4),
+        "speedup": round(baseline_time / vectorized_time, 1),
+        "speedup_with_array_build": round(baseline_time / (vectorized_time + array_build), 1),
+        "mismatched_routes": mismatches,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    if mismatches:
+        print(f"FAIL: {mismatches} routes differ from the per row baseline", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""List response rendering, through the response model versus the fast path.
+
+Reads --pages pages of --limit rows of flights and of passengers from the configured database (DATABASE_*
+environment variables, seed it first, e.g. python -m flightapi.db_seed --scale 10k) and renders every page
+two ways:
+
+- model: ORM objects, validated against the endpoint's response_model by FastAPI and encoded by its
+  JSONResponse, which is what the list endpoints did before.
+- fast: the column rows async_crud reads now, rendered by serialization.page_response with orjson.
+
+Both paths read the same id ranges and their bodies are compared. Rows per second of a single worker are
+reported for reading plus rendering and for rendering alone. The benchmark fails if the bodies differ.
+
+Usage:
+    python -m benchmarks.serialization --limit 1000 --pages 20
+    python -m benchmarks.serialization --output serialization.json
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from sqlalchemy import select
+
+from benchmarks.common import write_results
+from flightapi import async_crud
+from flightapi.airport_cache import AIRPORT_CACHE
+from flightapi.database import AsyncSessionLocal, async_engine
+from flightapi.main import app
+from flightapi.models import Flights, Passengers
+from flightapi.pagination import encode_cursor, page_size
+from flightapi.schemas import flights, passengers
+from flightapi.serialization import page_response
+
+ENDPOINTS = {
+    "/flights/list": (Flights, flights.Flights, async_crud.get_flights),
+    "/passengers/list": (Passengers, passengers.Passengers, async_crud.get_passengers),
+}
+
+
+def response_field(path: str):
+    return next(route.response_field for route in app.routes if getattr(route, "path", None) == path)
+
+
+async def model_page(db, model, field, limit: int, after_id: int) -> tuple[list, float, float, bytes]:
+    start = time.perf_counter()
+    rows = (await db.scalars(
+        select(model).where(model.id > after_id).order_by(model.id).limit(limit + 1)
+    )).all()[:limit]
+    read = time.perf_counter()
+    content = await serialize_response(field=field, response_content={"items": rows, "next_cursor": None})
+    body = JSONResponse(content).body
+    return [row.id for row in rows], read - start, time.perf_counter() - read, body
+
+
+async def fast_page(db, schema, get_page, limit: int, after_id: int) -> tuple[list, float, float, bytes]:
+    cursor = encode_cursor("id", after_id, after_id) if after_id else None
+    start = time.perf_counter()
+    rows, _ = await get_page(db, cursor=cursor, limit=limit)
+    read = time.perf_counter()
+    body = page_response(schema, rows, None).body
+    return [row["id"] for row in rows], read - start, time.perf_counter() - read, body
+
+
+def rates(rows: int, read_s: float, render_s: float) -> dict:
+    return {
+        "read_s": round(read_s, 4),
+        "render_s": round(render_s, 4),
+        "rows_per_s": round(rows / (read_s + render_s)),
+        "render_rows_per_s": round(rows / render_s),
+    }
+
+
+async def run(limit: int, pages: int) -> dict:
+    results = {}
+    async with AsyncSessionLocal() as db:
+        await AIRPORT_CACHE.ensure_fresh(db)
+        for path, (model, schema, get_page) in ENDPOINTS.items():
+            field = response_field(path)
+            totals = {"model": [0, 0.0, 0.0], "fast": [0, 0.0, 0.0]}
+            mismatched_pages, after_id = 0, 0
+            for _ in range(pages):
+                ids, *model_times, model_body = await model_page(db, model, field, limit, after_id)
+                fast_ids, *fast_times, fast_body = await fast_page(db, schema, get_page, limit, after_id)
+                if not ids:
+                    break
+                mismatched_pages += fast_ids != ids or fast_body != model_body
+                for name, times in (("model", model_times), ("fast", fast_times)):
+                    totals[name][0] += len(ids)
+                    totals[name][1] += times[0]
+                    totals[name][2] += times[1]
+                after_id = ids[-1]
+            model_rates, fast_rates = rates(*totals["model"]), rates(*totals["fast"])
+            results[path] = {
+                "rows": totals["model"][0],
+                "model": model_rates,
+                "fast": fast_rates,
+                "speedup": round(fast_rates["rows_per_s"] / model_rates["rows_per_s"], 2),
+                "render_speedup": round(fast_rates["render_rows_per_s"] / model_rates["render_rows_per_s"], 2),
+                "mismatched_pages": mismatched_pages,
+            }
+    await async_engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=1000, help="rows per page, capped at MAX_PAGE_SIZE")
+    parser.add_argument("--pages", type=int, default=20, help="pages per endpoint")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    limit = page_size(args.limit)
+    results = asyncio.run(run(limit, args.pages))
+    write_results({"limit": limit, "pages": args.pages, "endpoints": results}, args.output)
+    mismatches = sum(endpoint["mismatched_pages"] for endpoint in results.values())
+    if mismatches:
+        print(f"FAIL: {mismatches} pages rendered differently by the fast path", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
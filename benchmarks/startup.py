@@ -0,0 +1,178 @@
+"""Start up time of an API worker, with a budget.
+
+Imports flightapi.main in fresh interpreters under ``python -X importtime`` and reports the median total import
+time and the packages that take the longest to import. Then measures the time to first request in fresh
+interpreters: import, run the lifespan (schema check, table listener, airport cache) against the configured
+database (DATABASE_* environment variables) and serve GET /airports/list. With --skip-lifespan no database is
+needed and the first request is GET /docs.
+
+Modules only needed for migrations, seeding or rarely used endpoints must not be imported at start up, the
+benchmark fails if any of FORBIDDEN_MODULES shows up. It also fails, exiting with 1, when the median import or
+first request time is over its budget, so it can guard against regressions in CI.
+
+Usage:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --import-budget-ms 2500 --output startup.json
+    python -m benchmarks.startup --skip-lifespan
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+from benchmarks.common import write_results
+
+# Loaded on demand only: by migrations (alembic, geoalchemy2), configuration files (pyaml), the route
+# statistics and the seeding (numpy)
+FORBIDDEN_MODULES = ("alembic", "geoalchemy2", "yaml", "pyaml", "numpy", "faker", "pyarrow")
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+FIRST_REQUEST = """
+import asyncio, json, time
+import httpx
+started = time.perf_counter()
+from flightapi.main import app
+imported = time.perf_counter()
+
+async def main():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+        if {lifespan}:
+            async with app.router.lifespan_context(app):
+                ready = time.perf_counter()
+                response = await client.get("/airports/list", params={{"limit": 1}})
+        else:
+            ready = time.perf_counter()
+            response = await client.get("/docs")
+    response.raise_for_status()
+    return ready
+
+ready = asyncio.run(main())
+done = time.perf_counter()
+print(json.dumps({{"import_s": imported - started, "ready_s": ready - started, "first_request_s": done - started}}))
+"""
+
+
+def parse_import_time(stderr: str) -> dict[str, tuple[int, int]]:
+    """
+    Parse the report of ``-X importtime``.
+
+    Args:
+        stderr (str): The standard error of the interpreter.
+
+    Returns:
+        dict: The self and cumulative microseconds and the nesting depth of every import, by module name.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        modules[module] = (int(self_us), int(cumulative_us), (len(indent) - 1) // 2)
+    return modules
+
+
+def measure_imports(runs: int) -> dict:
+    """
+    Import flightapi.main in fresh interpreters.
+
+    Args:
+        runs (int): The number of interpreters.
+
+    Returns:
+        dict: The median total import time, the packages of the median run that took the longest, counting
+            the time spent in their own modules, and the forbidden modules that were imported.
+    """
+    totals, reports = [], []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import flightapi.main"],
+                                   capture_output=True, text=True, env=os.environ)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Importing flightapi.main failed:\n{completed.stderr[-2000:]}")
+        modules = parse_import_time(completed.stderr)
+        # Every module shows up once, the cumulative times of the outermost ones add up to the total
+        totals.append(sum(cumulative for _, cumulative, depth in modules.values() if depth == 0) / 1000)
+        reports.append(modules)
+
+    median = statistics.median(totals)
+    modules = reports[min(range(runs), key=lambda run: abs(totals[run] - median))]
+    packages = Counter()
+    for name, (self_us, _, _) in modules.items():
+        packages[name.split(".")[0]] += self_us
+    imported = {name.split(".")[0] for report in reports for name in report}
+    return {
+        "median_ms": round(median, 1),
+        "min_ms": round(min(totals), 1),
+        "max_ms": round(max(totals), 1),
+        "slowest_packages_ms": {name: round(self_us / 1000, 1) for name, self_us in packages.most_common(15)},
+        "forbidden_imported": sorted(imported.intersection(FORBIDDEN_MODULES)),
+    }
+
+
+def measure_first_request(runs: int, lifespan: bool) -> dict:
+    """
+    Start the application in fresh interpreters and time its first request.
+
+    Args:
+        runs (int): The number of interpreters.
+        lifespan (bool): Whether to run the lifespan, which needs the database, before the request.
+
+    Returns:
+        dict: The median times, from the start of the import, to the end of the import, to the end of the
+            lifespan start up and to the end of the first response.
+    """
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-c", FIRST_REQUEST.format(lifespan=lifespan)],
+                                   capture_output=True, text=True, env=os.environ)
+        if completed.returncode != 0:
+            raise RuntimeError(f"The first request failed:\n{completed.stderr[-2000:]}")
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return {f"{key[:-2]}_ms": round(1000 * statistics.median(sample[key] for sample in samples), 1)
+            for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--import-budget-ms", type=float, default=2000,
+                        help="maximum median import time of flightapi.main")
+    parser.add_argument("--first-request-budget-ms", type=float, default=3000,
+                        help="maximum median time from interpreter start to the first response")
+    parser.add_argument("--skip-lifespan", action="store_true", help="do not start up against the database")
+    parser.add_argument("--output", help="file to write the JSON results to")
+    args = parser.parse_args()
+
+    imports = measure_imports(args.runs)
+    first_request = measure_first_request(args.runs, not args.skip_lifespan)
+    failures = []
+    if imports["forbidden_imported"]:
+        failures.append(f"imported at start up: {', '.join(imports['forbidden_imported'])}")
+    if imports["median_ms"] > args.import_budget_ms:
+        failures.append(f"import took {imports['median_ms']} ms, over the budget of {args.import_budget_ms} ms")
+    if first_request["first_request_ms"] > args.first_request_budget_ms:
+        failures.append(f"first request after {first_request['first_request_ms']} ms, over the budget of "
+                        f"{args.first_request_budget_ms} ms")
+
+    write_results({
+        "runs": args.runs,
+        "lifespan": not args.skip_lifespan,
+        "budgets_ms": {"import": args.import_budget_ms, "first_request": args.first_request_budget_ms},
+        "import": imports,
+        "first_request": first_request,
+        "failures": failures,
+    }, args.output)
+    if failures:
+        print("\n".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import table_events
+from .filters import airport_ids_by_code
+from .log_config import get_logger
+from .metrics import track_queries
+from .models import Airports
+from .schemas.airports import Airports as AirportSchema
+from .serialization import schema_columns
+
+LOGGER = get_logger(__name__)
+
+# Airports written by other workers or processes are normally picked up through table_events, this bounds the
+# staleness when notifications can not be received (e.g. behind PgBouncer in transaction mode)
+AIRPORT_CACHE_MAX_AGE = float(os.getenv('FLIGHTAPI_AIRPORT_CACHE_MAX_AGE', '300'))
+
+
+class AirportCache:
+    """
+    Process local copy of the airports table, keyed by id and by IATA code.
+
+    The cache is reloaded as a whole whenever the airports version in table_events moves or it gets older than
+    AIRPORT_CACHE_MAX_AGE. Lookups that miss fall back to Postgres, so a stale cache costs a query, never a
+    wrong answer.
+    """
+
+    def __init__(self):
+        self._by_id: dict[int, dict] = {}
+        self._id_by_code: dict[str, int] = {}
+        self._version: Optional[int] = None
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.last_reload_ms: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    @property
+    def fresh(self) -> bool:
+        return (self.loaded and self._version == table_events.version(Airports.__tablename__)
+                and time.monotonic() - self._loaded_at < AIRPORT_CACHE_MAX_AGE)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    async def ensure_fresh(self, db: AsyncSession):
+        """
+        Reload the cache if it was never loaded, airports were written since, or it is older than
+        AIRPORT_CACHE_MAX_AGE.
+
+        Args:
+            db (AsyncSession): The async database session
+        """
+        if self.fresh:
+            return
+        async with self._lock:
+            if self.fresh:
+                return
+            await self.load(db)
+
+    @track_queries
+    async def load(self, db: AsyncSession):
+        # The version is read first, a write that lands while the rows are being read forces another reload
+        version = table_events.version(Airports.__tablename__)
+        start = time.perf_counter()
+        # The columns of the response schema, in its order, so pages of cached rows are rendered as they are. geom
+        # is derived from the coordinates and only ever used inside queries
+        rows = (await db.execute(select(*schema_columns(Airports, AirportSchema)))).mappings().all()
+        self._by_id = {row["id"]: dict(row) for row in rows}
+        self._id_by_code = {row["code"].upper(): row["id"] for row in rows if row["code"] is not None}
+        self._version, self._loaded_at = version, time.monotonic()
+        self.reloads += 1
+        self.last_reload_ms = round(1000 * (time.perf_counter() - start), 3)
+        LOGGER.info(f"Airport cache loaded with {len(rows)} airports in {self.last_reload_ms} ms")
+
+    def invalidate(self):
+        self._version = None
+
+    def get(self, airport_id: int) -> Optional[dict]:
+        """
+        Look an airport up by id.
+
+        Args:
+            airport_id (int): The ID of the airport.
+
+        Returns:
+            Optional[dict]: The airport columns, or None if it is not cached.
+        """
+        airport = self._by_id.get(airport_id)
+        if airport is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return airport
+
+    @track_queries
+    async def get_many(self, db: AsyncSession, airport_ids) -> dict[int, dict]:
+        """
+        Look airports up by id, the ones that are not cached in a single query.
+
+        Args:
+            db (AsyncSession): The async database session
+            airport_ids: The IDs of the airports.
+
+        Returns:
+            dict[int, dict]: The airport columns by id, unknown ids are left out.
+        """
+        airports = {airport_id: self._by_id[airport_id] for airport_id in airport_ids if airport_id in self._by_id}
+        missing = set(airport_ids) - airports.keys()
+        self.hits += len(airports)
+        if missing:
+            self.misses += len(missing)
+            statement = select(*schema_columns(Airports, AirportSchema)).where(Airports.id.in_(missing))
+            airports.update((row["id"], dict(row)) for row in (await db.execute(statement)).mappings())
+        return airports
+
+    def rows(self) -> list[dict]:
+        self.hits += 1
+        return list(self._by_id.values())
+
+    def airport_ids_by_code(self, codes: list[str]):
+        """
+        Resolve IATA codes to airport ids from the cache.
+
+        Args:
+            codes (list[str]): The IATA codes.
+
+        Returns:
+            The matching airport ids, or the filters.airport_ids_by_code select if any code is not cached.
+        """
+        if not codes:
+            return []
+        ids = [self._id_by_code.get(code.upper()) for code in codes]
+        if None in ids:
+            self.misses += 1
+            return airport_ids_by_code(codes)
+        self.hits += 1
+        return ids
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "last_reload_ms": self.last_reload_ms,
+            "age_seconds": None if not self.loaded else round(time.monotonic() - self._loaded_at, 3),
+            "fresh": self.fresh,
+            "listening": table_events.listening(),
+        }
+
+
+AIRPORT_CACHE = AirportCache()
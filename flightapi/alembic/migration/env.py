@@ -4,6 +4,9 @@ import re
 import sys
 from logging.config import fileConfig
 
+# Registers the PostGIS types with the reflection of autogenerate, the models declare their own lighter type so
+# the API does not import geoalchemy2
+import geoalchemy2  # noqa: F401
 from alembic import context
 from sqlalchemy import engine_from_config, pool, create_engine
 
@@ -20,9 +23,10 @@ logger = logging.getLogger("alembic.env")
 config = context.config
 
 # Interpret the config file for Python logging.
-# This line sets up loggers basically.
+# This line sets up loggers basically. Migrations run inside the app's lifespan, so the app's loggers, created
+# before, have to stay enabled.
 if config.config_file_name is not None:
-    fileConfig(config.config_file_name)
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
 
 # Register models within the environment
 # Will not pick up models if import statements are not present
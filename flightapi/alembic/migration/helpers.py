@@ -0,0 +1,30 @@
+"""Helpers shared by the migration scripts in versions/."""
+from typing import Optional
+
+from alembic import op
+import sqlalchemy as sa
+
+# Rows are converted in id ranges of this size, each range in its own transaction, so the backfill never holds
+# row locks on the whole table at once
+BACKFILL_BATCH_SIZE = 50000
+
+
+def backfill(table: str, assignments: str, pending: Optional[str] = None) -> None:
+    """
+    Run an UPDATE over the whole table in id batches, committing after every batch.
+
+    Args:
+        table (str): The table to update.
+        assignments (str): The SET clause of the update.
+        pending (str, optional): A condition matching the rows that still need the update. Batches committed
+            by an interrupted run are then skipped when the migration is run again. Defaults to None.
+    """
+    condition = "id >= :start AND id < :end" + (f" AND ({pending})" if pending else "")
+    bind = op.get_bind()
+    max_id = bind.execute(sa.text(f"SELECT coalesce(max(id), 0) FROM {table}")).scalar()
+    with op.get_context().autocommit_block():
+        for start in range(0, max_id + 1, BACKFILL_BATCH_SIZE):
+            bind.execute(
+                sa.text(f"UPDATE {table} SET {assignments} WHERE {condition}"),
+                {"start": start, "end": start + BACKFILL_BATCH_SIZE},
+            )
@@ -0,0 +1,63 @@
+"""make available seats an integer
+
+Revision ID: 0c289a8eb010
+Revises: 302fa32dabce
+Create Date: 2026-10-18 17:51:21.342194
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from flightapi.alembic.migration.helpers import backfill
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0c289a8eb010'
+down_revision: Union[str, None] = '302fa32dabce'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Only plain non negative numbers are converted. Anything else becomes 0 (sold out) rather than NULL, which
+# means the inventory is not tracked and would make the flight overbookable
+SEAT_COUNT = r"'^\s*\d{1,9}\s*$'"
+
+
+def upgrade() -> None:
+    """
+    Convert flights.available_seats to a non negative integer.
+
+    A new column is added next to the text one, backfilled in batches and then swapped in. The column is no
+    longer indexed, bookings update it all the time and an index on it would rule out HOT updates. NULL seat
+    counts stay NULL, seat counts that are not a plain non negative number become 0.
+
+    The backfill commits batch by batch, so the migration is restartable: when a run is interrupted the new
+    column stays, and running it again only converts the rows whose new column is still NULL.
+
+    Returns:
+        None
+    """
+    # IF NOT EXISTS, the column of an interrupted run is kept
+    op.execute("ALTER TABLE flights ADD COLUMN IF NOT EXISTS seats_left INTEGER")
+    backfill('flights',
+             f"seats_left = CASE WHEN available_seats ~ {SEAT_COUNT} THEN trim(available_seats)::integer ELSE 0 END",
+             pending="seats_left IS NULL AND available_seats IS NOT NULL")
+
+    op.drop_index(op.f('ix_flights_available_seats'), table_name='flights')
+    op.drop_column('flights', 'available_seats')
+    op.alter_column('flights', 'seats_left', new_column_name='available_seats')
+    op.create_check_constraint('ck_flights_available_seats_non_negative', 'flights', 'available_seats >= 0')
+
+
+def downgrade() -> None:
+    """
+    Convert available_seats back to text.
+
+    Returns:
+        None
+    """
+    op.drop_constraint('ck_flights_available_seats_non_negative', 'flights', type_='check')
+    op.alter_column('flights', 'available_seats', type_=sa.String(), postgresql_using="available_seats::text")
+    op.create_index(op.f('ix_flights_available_seats'), 'flights', ['available_seats'], unique=False)
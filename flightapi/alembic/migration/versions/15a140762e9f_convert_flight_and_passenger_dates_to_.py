@@ -0,0 +1,96 @@
+"""convert flight and passenger dates to timestamptz and date
+
+Revision ID: 15a140762e9f
+Revises: 94a02102e0ed
+Create Date: 2026-10-18 17:40:22.547911
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from flightapi.alembic.migration.helpers import backfill
+
+
+# revision identifiers, used by Alembic.
+revision: str = '15a140762e9f'
+down_revision: Union[str, None] = '94a02102e0ed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Only ISO formatted values are converted, anything else becomes NULL instead of failing the migration
+ISO_DATE = r"'^\d{4}-\d{2}-\d{2}'"
+# Values ending with an explicit UTC offset
+UTC_OFFSET = r"'(Z|[+-]\d{2}(:?\d{2})?)$'"
+
+
+def to_timestamptz(column: str) -> str:
+    # Values without an offset are UTC. A plain ::timestamptz cast would read them in the session TimeZone, and
+    # a ::timestamp cast would silently drop an explicit offset
+    return (f"CASE WHEN {column} !~ {ISO_DATE} THEN NULL "
+            f"WHEN {column} ~ {UTC_OFFSET} THEN {column}::timestamptz "
+            f"ELSE {column}::timestamp AT TIME ZONE 'UTC' END")
+
+
+def upgrade() -> None:
+    """
+    Convert flights.departure_date / arrival_date to timestamptz and passengers.date_of_birth to date.
+
+    New columns are added next to the text ones, backfilled in batches and then swapped in, and the composite
+    (departure_airport_id, departure_date) index backing departure time range searches is created. Dates
+    without a UTC offset are taken as UTC, whatever the TimeZone of the migration session.
+
+    The backfill commits batch by batch, so the migration is restartable: when a run is interrupted the new
+    columns stay, and running it again only converts the rows whose new column is still NULL. Rows that
+    could not be converted stay NULL and are simply converted to NULL again.
+
+    Returns:
+        None
+    """
+    # IF NOT EXISTS, the columns of an interrupted run are kept
+    op.execute("ALTER TABLE flights ADD COLUMN IF NOT EXISTS departure_at TIMESTAMP WITH TIME ZONE")
+    op.execute("ALTER TABLE flights ADD COLUMN IF NOT EXISTS arrival_at TIMESTAMP WITH TIME ZONE")
+    op.execute("ALTER TABLE passengers ADD COLUMN IF NOT EXISTS born_on DATE")
+
+    backfill('flights',
+             f"departure_at = {to_timestamptz('departure_date')}, arrival_at = {to_timestamptz('arrival_date')}",
+             pending="departure_at IS NULL AND arrival_at IS NULL")
+    backfill('passengers',
+             f"born_on = CASE WHEN date_of_birth ~ {ISO_DATE} THEN left(date_of_birth, 10)::date END",
+             pending="born_on IS NULL")
+
+    op.drop_index('ix_flights_departure_date_id', table_name='flights')
+    op.drop_index(op.f('ix_flights_departure_date'), table_name='flights')
+    op.drop_index(op.f('ix_flights_arrival_date'), table_name='flights')
+    op.drop_index(op.f('ix_passengers_date_of_birth'), table_name='passengers')
+    op.drop_column('flights', 'departure_date')
+    op.drop_column('flights', 'arrival_date')
+    op.drop_column('passengers', 'date_of_birth')
+    op.alter_column('flights', 'departure_at', new_column_name='departure_date')
+    op.alter_column('flights', 'arrival_at', new_column_name='arrival_date')
+    op.alter_column('passengers', 'born_on', new_column_name='date_of_birth')
+
+    op.create_index(op.f('ix_flights_departure_date'), 'flights', ['departure_date'], unique=False)
+    op.create_index(op.f('ix_flights_arrival_date'), 'flights', ['arrival_date'], unique=False)
+    op.create_index('ix_flights_departure_date_id', 'flights', ['departure_date', 'id'], unique=False)
+    op.create_index('ix_flights_departure_airport_id_departure_date', 'flights',
+                    ['departure_airport_id', 'departure_date'], unique=False)
+    op.create_index(op.f('ix_passengers_date_of_birth'), 'passengers', ['date_of_birth'], unique=False)
+
+
+def downgrade() -> None:
+    """
+    Convert the date columns back to ISO formatted text.
+
+    Returns:
+        None
+    """
+    op.drop_index('ix_flights_departure_airport_id_departure_date', table_name='flights')
+    op.alter_column('flights', 'departure_date', type_=sa.String(),
+                    postgresql_using="to_char(departure_date AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS')")
+    op.alter_column('flights', 'arrival_date', type_=sa.String(),
+                    postgresql_using="to_char(arrival_date AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS')")
+    op.alter_column('passengers', 'date_of_birth', type_=sa.String(),
+                    postgresql_using="to_char(date_of_birth, 'YYYY-MM-DD')")
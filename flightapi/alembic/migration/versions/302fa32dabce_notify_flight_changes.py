@@ -0,0 +1,105 @@
+"""notify flight changes
+
+Revision ID: 302fa32dabce
+Revises: 4dac44e242ee
+Create Date: 2026-10-18 17:49:19.240560
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '302fa32dabce'
+down_revision: Union[str, None] = '4dac44e242ee'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Publish flight writes on the flightapi_table_changed channel.
+
+    The payload is "flights:" followed by the comma separated ids of the written rows, so listeners like the
+    itinerary index can refetch just those flights. Statements writing more than 100 rows, and truncates,
+    publish the bare table name instead, which stands for "reload everything" and keeps the payload under the
+    8000 byte NOTIFY limit.
+
+    Updates only notify when a column other than available_seats changed: every booking updates the seat
+    count, and a NOTIFY on every booking commit would invalidate the cached listings and queue all bookings on
+    the global lock Postgres takes for notifying commits. The updated rows are compared through transition
+    tables, a column list (UPDATE OF) would still fire for the crud updates that set every column. A trigger
+    with transition tables can only handle one event, hence one trigger per event.
+
+    Returns:
+        None
+    """
+    op.execute("""
+        CREATE OR REPLACE FUNCTION flightapi_notify_flights_changed() RETURNS trigger AS $$
+        DECLARE
+            changed integer;
+            ids text;
+        BEGIN
+            -- One row past the limit is enough to know the ids will not be listed
+            IF TG_OP = 'INSERT' THEN
+                SELECT count(*), string_agg(id::text, ',') INTO changed, ids
+                FROM (SELECT id FROM new_rows LIMIT 101) written;
+            ELSIF TG_OP = 'DELETE' THEN
+                SELECT count(*), string_agg(id::text, ',') INTO changed, ids
+                FROM (SELECT id FROM old_rows LIMIT 101) written;
+            ELSE
+                SELECT count(*), string_agg(id::text, ',') INTO changed, ids
+                FROM (
+                    SELECT new_rows.id FROM new_rows JOIN old_rows ON old_rows.id = new_rows.id
+                    WHERE to_jsonb(new_rows) - 'available_seats'
+                          IS DISTINCT FROM to_jsonb(old_rows) - 'available_seats'
+                    LIMIT 101
+                ) written;
+            END IF;
+            IF changed > 100 THEN
+                PERFORM pg_notify('flightapi_table_changed', TG_TABLE_NAME);
+            ELSIF changed > 0 THEN
+                PERFORM pg_notify('flightapi_table_changed', TG_TABLE_NAME || ':' || ids);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER flights_notify_inserted
+        AFTER INSERT ON flights
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION flightapi_notify_flights_changed()
+    """)
+    op.execute("""
+        CREATE TRIGGER flights_notify_updated
+        AFTER UPDATE ON flights
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION flightapi_notify_flights_changed()
+    """)
+    op.execute("""
+        CREATE TRIGGER flights_notify_deleted
+        AFTER DELETE ON flights
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION flightapi_notify_flights_changed()
+    """)
+    op.execute("""
+        CREATE TRIGGER flights_notify_truncated
+        AFTER TRUNCATE ON flights
+        FOR EACH STATEMENT EXECUTE FUNCTION flightapi_notify_table_changed()
+    """)
+
+
+def downgrade() -> None:
+    """
+    Drop the flights change notification triggers.
+
+    Returns:
+        None
+    """
+    for trigger in ("flights_notify_truncated", "flights_notify_deleted", "flights_notify_updated",
+                    "flights_notify_inserted"):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger} ON flights")
+    op.execute("DROP FUNCTION IF EXISTS flightapi_notify_flights_changed()")
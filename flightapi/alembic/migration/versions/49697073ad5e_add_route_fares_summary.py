@@ -0,0 +1,59 @@
+"""add route fares summary
+
+Revision ID: 49697073ad5e
+Revises: 50911a70c1d6
+Create Date: 2026-10-18 19:36:52.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '49697073ad5e'
+down_revision: Union[str, None] = '50911a70c1d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Add the route_fares summary, the cheapest fare per route and UTC departure day, and fill it from the flights.
+
+    Returns:
+        None
+    """
+    op.create_table(
+        'route_fares',
+        sa.Column('departure_airport_id', sa.Integer(), nullable=False),
+        sa.Column('arrival_airport_id', sa.Integer(), nullable=False),
+        sa.Column('departure_day', sa.Date(), nullable=False),
+        sa.Column('min_fare', sa.Numeric(), nullable=False),
+        sa.Column('flights', sa.Integer(), nullable=False),
+        sa.Column('cheapest_flight_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['departure_airport_id'], ['airports.id']),
+        sa.ForeignKeyConstraint(['arrival_airport_id'], ['airports.id']),
+        sa.PrimaryKeyConstraint('departure_airport_id', 'arrival_airport_id', 'departure_day'),
+    )
+    op.execute("""
+        INSERT INTO route_fares (departure_airport_id, arrival_airport_id, departure_day, min_fare, flights,
+                                 cheapest_flight_id)
+        SELECT departure_airport_id, arrival_airport_id, (departure_date AT TIME ZONE 'UTC')::date, min(fare),
+               count(*), (array_agg(id ORDER BY fare, id))[1]
+        FROM flights
+        WHERE departure_airport_id IS NOT NULL AND arrival_airport_id IS NOT NULL
+          AND departure_date IS NOT NULL AND fare IS NOT NULL
+        GROUP BY 1, 2, 3
+    """)
+
+
+def downgrade() -> None:
+    """
+    Drop the route_fares summary.
+
+    Returns:
+        None
+    """
+    op.drop_table('route_fares')
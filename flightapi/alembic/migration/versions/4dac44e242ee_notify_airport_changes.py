@@ -0,0 +1,52 @@
+"""notify airport changes
+
+Revision ID: 4dac44e242ee
+Revises: a510b9d1cc9a
+Create Date: 2026-10-18 17:47:25.719578
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4dac44e242ee'
+down_revision: Union[str, None] = 'a510b9d1cc9a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Publish the table name on the flightapi_table_changed channel whenever airports are written, so every worker
+    can drop its cached copy.
+
+    Returns:
+        None
+    """
+    op.execute("""
+        CREATE OR REPLACE FUNCTION flightapi_notify_table_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('flightapi_table_changed', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER airports_notify_changed
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON airports
+        FOR EACH STATEMENT EXECUTE FUNCTION flightapi_notify_table_changed()
+    """)
+
+
+def downgrade() -> None:
+    """
+    Drop the airports change notification trigger and its function.
+
+    Returns:
+        None
+    """
+    op.execute("DROP TRIGGER IF EXISTS airports_notify_changed ON airports")
+    op.execute("DROP FUNCTION IF EXISTS flightapi_notify_table_changed()")
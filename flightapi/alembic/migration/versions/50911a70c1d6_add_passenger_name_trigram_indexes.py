@@ -0,0 +1,46 @@
+"""add passenger name trigram indexes
+
+Revision ID: 50911a70c1d6
+Revises: a7943962891e
+Create Date: 2026-10-18 18:42:07.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '50911a70c1d6'
+down_revision: Union[str, None] = 'a7943962891e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Add the pg_trgm GIN indexes on the passenger names that back prefix (ILIKE) and fuzzy (%) name searches.
+
+    The indexes are built concurrently, outside the migration transaction, so bookings are not blocked while
+    a large passengers table is indexed.
+
+    Returns:
+        None
+    """
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        for column in ('first_name', 'last_name'):
+            op.create_index(f'ix_passengers_{column}_trgm', 'passengers', [column], unique=False,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """
+    Drop the passenger name trigram indexes.
+
+    Returns:
+        None
+    """
+    op.drop_index('ix_passengers_last_name_trgm', table_name='passengers', postgresql_using='gin')
+    op.drop_index('ix_passengers_first_name_trgm', table_name='passengers', postgresql_using='gin')
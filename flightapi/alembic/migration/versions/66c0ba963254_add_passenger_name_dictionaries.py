@@ -0,0 +1,96 @@
+"""add passenger name dictionaries
+
+Revision ID: 66c0ba963254
+Revises: 49697073ad5e
+Create Date: 2026-10-18 21:12:45.508113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '66c0ba963254'
+down_revision: Union[str, None] = '49697073ad5e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NAME_COLUMNS = {'first_name': 'passenger_first_names', 'last_name': 'passenger_last_names'}
+NAME_TRIGGERS = {'INSERT': 'passengers_collect_names_inserted', 'UPDATE': 'passengers_collect_names_updated'}
+
+
+def upgrade() -> None:
+    """
+    Add the passenger_first_names and passenger_last_names dictionaries, with pg_trgm GiST indexes for fuzzy
+    name searches ranked by trigram distance.
+
+    A nearest neighbour scan of a GiST index on passengers itself visits a large part of the index once there
+    are millions of passengers, as every leaf page mixes unrelated names. The distinct names are a few orders
+    of magnitude fewer, so the nearest names are found in the dictionary and their passengers through the
+    btree indexes of passengers.
+
+    The dictionaries are filled by statement triggers on passengers. The names are inserted in order, so two
+    writes adding the same new names can not deadlock. Names whose passengers are gone are not removed,
+    searches skip them. The triggers are created before the dictionaries are filled, the migration
+    transaction blocks passenger writes in between.
+
+    Searches of both names probe the nearest (first name, last name) pairs in a new (last_name, first_name)
+    index of passengers, built concurrently once the dictionaries are committed.
+
+    Returns:
+        None
+    """
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table in NAME_COLUMNS.values():
+        op.create_table(table, sa.Column('name', sa.VARCHAR(length=255), nullable=False),
+                        sa.PrimaryKeyConstraint('name'))
+        op.create_index(f'ix_{table}_name_trgm', table, ['name'], unique=False,
+                        postgresql_using='gist', postgresql_ops={'name': 'gist_trgm_ops'})
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION flightapi_collect_passenger_names() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO passenger_first_names (name)
+            SELECT DISTINCT first_name FROM new_rows WHERE first_name IS NOT NULL ORDER BY first_name
+            ON CONFLICT DO NOTHING;
+            INSERT INTO passenger_last_names (name)
+            SELECT DISTINCT last_name FROM new_rows WHERE last_name IS NOT NULL ORDER BY last_name
+            ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # A trigger with transition tables can only handle one event, and can not have a column list
+    for event, trigger in NAME_TRIGGERS.items():
+        op.execute(f"""
+            CREATE TRIGGER {trigger}
+            AFTER {event} ON passengers
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION flightapi_collect_passenger_names()
+        """)
+
+    for column, table in NAME_COLUMNS.items():
+        op.execute(f"INSERT INTO {table} (name) SELECT DISTINCT {column} FROM passengers "
+                   f"WHERE {column} IS NOT NULL ON CONFLICT DO NOTHING")
+        op.execute(f"ANALYZE {table}")
+    with op.get_context().autocommit_block():
+        op.create_index('ix_passengers_last_name_first_name', 'passengers', ['last_name', 'first_name'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """
+    Drop the passenger name dictionaries, their triggers and the (last_name, first_name) index.
+
+    Returns:
+        None
+    """
+    op.drop_index('ix_passengers_last_name_first_name', table_name='passengers')
+    for trigger in NAME_TRIGGERS.values():
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger} ON passengers")
+    op.execute("DROP FUNCTION IF EXISTS flightapi_collect_passenger_names()")
+    for table in reversed(NAME_COLUMNS.values()):
+        op.drop_index(f'ix_{table}_name_trgm', table_name=table, postgresql_using='gist')
+        op.drop_table(table)
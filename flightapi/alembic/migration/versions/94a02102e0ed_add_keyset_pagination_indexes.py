@@ -0,0 +1,42 @@
+"""add keyset pagination indexes
+
+Revision ID: 94a02102e0ed
+Revises: 916d7e959e7f
+Create Date: 2026-10-18 17:37:00.098892
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '94a02102e0ed'
+down_revision: Union[str, None] = '916d7e959e7f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Add the (sort key, id) indexes used by keyset pagination on the list endpoints.
+
+    Returns:
+        None
+    """
+    op.create_index('ix_flights_departure_date_id', 'flights', ['departure_date', 'id'], unique=False)
+    op.create_index('ix_flights_fare_id', 'flights', ['fare', 'id'], unique=False)
+    op.create_index('ix_passengers_last_name_id', 'passengers', ['last_name', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """
+    Drop the keyset pagination indexes.
+
+    Returns:
+        None
+    """
+    op.drop_index('ix_passengers_last_name_id', table_name='passengers')
+    op.drop_index('ix_flights_fare_id', table_name='flights')
+    op.drop_index('ix_flights_departure_date_id', table_name='flights')
@@ -0,0 +1,39 @@
+"""add route search index
+
+Revision ID: a510b9d1cc9a
+Revises: 15a140762e9f
+Create Date: 2026-10-18 17:42:13.243846
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a510b9d1cc9a'
+down_revision: Union[str, None] = '15a140762e9f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Add the (departure_airport_id, arrival_airport_id, departure_date) index used by route searches.
+
+    Returns:
+        None
+    """
+    op.create_index('ix_flights_route_departure_date', 'flights',
+                    ['departure_airport_id', 'arrival_airport_id', 'departure_date'], unique=False)
+
+
+def downgrade() -> None:
+    """
+    Drop the route search index.
+
+    Returns:
+        None
+    """
+    op.drop_index('ix_flights_route_departure_date', table_name='flights')
@@ -0,0 +1,58 @@
+"""add airport coordinates
+
+Revision ID: a7943962891e
+Revises: 0c289a8eb010
+Create Date: 2026-10-18 17:54:14.529771
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7943962891e'
+down_revision: Union[str, None] = '0c289a8eb010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Add latitude / longitude to airports, a geography point computed from them and the GiST index that backs
+    nearest airport (KNN <->) and radius (ST_DWithin) searches.
+
+    ALTER TABLE fires no trigger, so the airports change is published by hand: the airport caches of running
+    workers hold rows read before the new columns existed and reload on commit.
+
+    Returns:
+        None
+    """
+    op.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+    op.add_column('airports', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('airports', sa.Column('longitude', sa.Float(), nullable=True))
+    op.create_check_constraint('ck_airports_latitude_range', 'airports', 'latitude BETWEEN -90 AND 90')
+    op.create_check_constraint('ck_airports_longitude_range', 'airports', 'longitude BETWEEN -180 AND 180')
+    op.execute(
+        "ALTER TABLE airports ADD COLUMN geom geography(POINT, 4326) "
+        "GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography) STORED"
+    )
+    op.create_index('ix_airports_geom', 'airports', ['geom'], unique=False, postgresql_using='gist')
+    op.execute("SELECT pg_notify('flightapi_table_changed', 'airports')")
+
+
+def downgrade() -> None:
+    """
+    Drop the airport coordinates and their index, and publish the airports change like upgrade does.
+
+    Returns:
+        None
+    """
+    op.drop_index('ix_airports_geom', table_name='airports', postgresql_using='gist')
+    op.drop_column('airports', 'geom')
+    op.drop_constraint('ck_airports_longitude_range', 'airports', type_='check')
+    op.drop_constraint('ck_airports_latitude_range', 'airports', type_='check')
+    op.drop_column('airports', 'longitude')
+    op.drop_column('airports', 'latitude')
+    op.execute("SELECT pg_notify('flightapi_table_changed', 'airports')")
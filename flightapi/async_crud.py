@@ -0,0 +1,559 @@
+import datetime
+import os
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import select, insert, delete, literal, func, cast, Float
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import route_fares, table_events
+from .airport_cache import AIRPORT_CACHE
+from .filters import filter_flights, filter_passengers, order_by_name_distance
+from .itinerary import FLIGHT_INDEX
+from .metrics import track_queries
+from .pagination import InvalidCursorError, fetch_page, page_rows, page_size
+from .seats import SeatsUnavailableError, reserve_seats, release_seats
+from .schemas import airports, flights, passengers
+from .serialization import schema_columns
+from .models import Flights, Airports, Passengers, GeographyPoint
+
+# Upper bound on the number of rows accepted by a single bulk create request
+MAX_BULK_SIZE = int(os.getenv('FLIGHTAPI_MAX_BULK_SIZE', '10000'))
+
+# Keyset pagination sort keys, every one of them is backed by a (column, id) index
+AIRPORTS_SORT_KEYS = {"id": Airports.id, "code": Airports.code}
+FLIGHTS_SORT_KEYS = {"id": Flights.id, "departure_date": Flights.departure_date, "fare": Flights.fare}
+PASSENGERS_SORT_KEYS = {"id": Passengers.id, "last_name": Passengers.last_name}
+# The columns the list endpoints read, those of their response schemas
+FLIGHTS_LIST_COLUMNS = schema_columns(Flights, flights.Flights)
+PASSENGERS_LIST_COLUMNS = schema_columns(Passengers, passengers.Passengers)
+
+
+@track_queries
+async def create_airports(db: AsyncSession, airport: airports.AirportsCreate):
+    """
+    Create a new airport in the database
+
+    Args:
+        db (AsyncSession): The async database session
+        airport (airports.AirportsCreate): The airport to create
+
+    Returns:
+        airports.Airports: The created airport
+    """
+    db_airports = Airports(**airport.model_dump())
+    db.add(db_airports)
+    await db.commit()
+    await db.refresh(db_airports)
+    table_events.bump(Airports.__tablename__)
+    return db_airports
+
+
+@track_queries
+async def check_airports_exists(db: AsyncSession,
+                                airports_id: int) -> bool:
+    await AIRPORT_CACHE.ensure_fresh(db)
+    if AIRPORT_CACHE.get(airports_id) is not None:
+        return True
+    # The airport may have been created after the last reload and its notification not be in yet
+    exists = (await db.scalar(select(Airports.id).filter_by(id=airports_id))) is not None
+    if exists:
+        AIRPORT_CACHE.invalidate()
+    return exists
+
+
+@track_queries
+async def get_airports(db: AsyncSession,
+                       airport_id: [int] = None,
+                       city: [str] = None,
+                       country: [str] = None,
+                       sort: str = "id",
+                       cursor: Optional[str] = None,
+                       limit: int = 100):
+    """
+        Get a page of airports based on the provided filters, served from the airport cache.
+
+        Args:
+            db (AsyncSession): The async database session
+            airport_id (list, optional): A list of airport IDs. Defaults to None.
+            city (list, optional): A list of cities. Defaults to None.
+            country (list, optional): A list of countries. Defaults to None.
+            sort (str, optional): The AIRPORTS_SORT_KEYS key to order by. Defaults to "id".
+            cursor (str, optional): The next_cursor of the previous page. Defaults to None.
+            limit (int, optional): The maximum number of results to return. Defaults to 100.
+
+        Returns:
+            tuple: A list of airports that match the provided filters and the cursor of the next page.
+        """
+    await AIRPORT_CACHE.ensure_fresh(db)
+    rows = AIRPORT_CACHE.rows()
+    for key, values in (("id", airport_id), ("city", city), ("country", country)):
+        if values is not None:
+            values = set(values)
+            rows = [row for row in rows if row[key] in values]
+    return page_rows(rows, sort, AIRPORTS_SORT_KEYS[sort], Airports.id, cursor, limit)
+
+
+@track_queries
+async def get_nearby_airports(db: AsyncSession,
+                              latitude: float,
+                              longitude: float,
+                              radius_km: Optional[float] = None,
+                              k: int = 10) -> list:
+    """
+    Get the airports closest to a point, nearest first.
+
+    The KNN <-> ordering walks the GiST index on airports.geom, so the k nearest airports are found without
+    computing the distance to every airport. ST_DWithin only narrows the same index scan to the radius.
+
+    Args:
+        db (AsyncSession): The async database session
+        latitude (float): The latitude of the point in degrees.
+        longitude (float): The longitude of the point in degrees.
+        radius_km (float, optional): Only return airports within this distance. Defaults to None.
+        k (int, optional): The maximum number of airports to return. Defaults to 10.
+
+    Returns:
+        list: The airports as mappings with their distance_km, nearest first.
+    """
+    point = cast(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326), GeographyPoint())
+    columns = [column for column in Airports.__table__.c if column.key != "geom"]
+    statement = (
+        select(*columns, (func.ST_Distance(Airports.geom, point, type_=Float) / 1000).label("distance_km"))
+        .where(Airports.geom.is_not(None))
+        .order_by(Airports.geom.op("<->")(point))
+        .limit(k)
+    )
+    if radius_km is not None:
+        statement = statement.where(func.ST_DWithin(Airports.geom, point, radius_km * 1000))
+    return (await db.execute(statement)).mappings().all()
+
+
+def export_flights_statement(departure_airport: [str] = None,
+                             arrival_airport: [str] = None,
+                             departure_date: [datetime.date] = None,
+                             arrival_date: [datetime.date] = None,
+                             departure_from: Optional[datetime.datetime] = None,
+                             departure_to: Optional[datetime.datetime] = None):
+    """
+        Build the column level select used to export flights, ordered by id.
+
+        Args:
+            departure_airport (list, optional): A list of departure airport IATA codes.
+            arrival_airport (list, optional): A list of arrival airport IATA codes.
+            departure_date (list, optional): A list of departure days.
+            arrival_date (list, optional): A list of arrival days.
+            departure_from (datetime, optional): The earliest departure time.
+            departure_to (datetime, optional): The latest departure time.
+
+        Returns:
+            Select: The export statement.
+        """
+    return filter_flights(select(Flights.__table__), departure_airport, arrival_airport, departure_date,
+                          arrival_date, departure_from, departure_to).order_by(Flights.id)
+
+
+@track_queries
+async def get_flights(db: AsyncSession,
+                      departure_airport: [str] = None,
+                      arrival_airport: [str] = None,
+                      departure_date: [datetime.date] = None,
+                      arrival_date: [datetime.date] = None,
+                      departure_from: Optional[datetime.datetime] = None,
+                      departure_to: Optional[datetime.datetime] = None,
+                      sort: str = "id",
+                      cursor: Optional[str] = None,
+                      limit: int = 100,
+                      tuples: bool = False):
+    """
+        Get a page of flights based on the provided filters.
+
+        Args:
+            db (AsyncSession): The async database session
+            departure_airport (list, optional): A list of departure airport IATA codes.
+                Defaults to None.
+            arrival_airport (list, optional): A list of arrival airport IATA codes.
+                Defaults to None.
+            departure_date (list, optional): A list of departure days. Defaults to None.
+            arrival_date (list, optional): A list of arrival days. Defaults to None.
+            departure_from (datetime, optional): The earliest departure time. Defaults to None.
+            departure_to (datetime, optional): The latest departure time. Defaults to None.
+            sort (str, optional): The FLIGHTS_SORT_KEYS key to order by. Defaults to "id".
+            cursor (str, optional): The next_cursor of the previous page. Defaults to None.
+            limit (int, optional): The maximum number of results to return. Defaults to 100.
+            tuples (bool, optional): Return the flights as tuples in the order of FLIGHTS_LIST_COLUMNS rather
+                than dicts, for the columnar formats. Defaults to False.
+
+        Returns:
+            tuple: A list of flights, as dicts with the fields of schemas.flights.Flights, that match the provided
+                filters and the cursor of the next page.
+        """
+    await AIRPORT_CACHE.ensure_fresh(db)
+    statement = filter_flights(select(*FLIGHTS_LIST_COLUMNS), departure_airport, arrival_airport,
+                               departure_date, arrival_date, departure_from, departure_to,
+                               resolve_codes=AIRPORT_CACHE.airport_ids_by_code)
+    return await fetch_page(db, statement, sort, FLIGHTS_SORT_KEYS[sort], Flights.id, cursor, limit, tuples)
+
+
+async def expand_airports(db: AsyncSession, flight_rows: list[dict]) -> list[dict]:
+    """
+    Add the departure and arrival airports to flight rows, from the airport cache.
+
+    The number of queries does not grow with the number of flights: none when every airport is cached, one for
+    all the airports that are not.
+
+    Args:
+        db (AsyncSession): The async database session
+        flight_rows (list[dict]): The flights, as returned by get_flights. They are updated in place.
+
+    Returns:
+        list[dict]: The flights, with departure_airport and arrival_airport.
+    """
+    airport_ids = {row[key] for row in flight_rows for key in ("departure_airport_id", "arrival_airport_id")}
+    airports = await AIRPORT_CACHE.get_many(db, airport_ids - {None})
+    for row in flight_rows:
+        row["departure_airport"] = airports.get(row["departure_airport_id"])
+        row["arrival_airport"] = airports.get(row["arrival_airport_id"])
+    return flight_rows
+
+
+@track_queries
+async def check_flights_exists(db: AsyncSession,
+                               flight_id: int) -> bool:
+    return (await db.scalar(select(Flights.id).filter_by(id=flight_id))) is not None
+
+
+@track_queries
+async def create_flights(db: AsyncSession, flight: flights.FlightsCreate):
+    db_flights = Flights(**flight.model_dump())
+    db.add(db_flights)
+    await db.flush()
+    await route_fares.refresh(db, [route_fares.route_day(db_flights)])
+    await db.commit()
+    await db.refresh(db_flights)
+    table_events.bump(Flights.__tablename__)
+    FLIGHT_INDEX.upsert(db_flights)
+    return db_flights
+
+
+@track_queries
+async def existing_ids(db: AsyncSession, id_column, ids: set) -> set:
+    """
+    Return which of the given ids exist, in a single set based query.
+
+    Args:
+        db (AsyncSession): The async database session
+        id_column: The primary key column to look the ids up in.
+        ids (set): The ids to check.
+
+    Returns:
+        set: The subset of ids that exist.
+    """
+    if not ids:
+        return set()
+    return set((await db.scalars(select(id_column).where(id_column.in_(ids)))).all())
+
+
+@track_queries
+async def bulk_insert(db: AsyncSession, model, rows: list[dict]) -> list:
+    """
+    Insert rows with multi row INSERT ... RETURNING statements inside the current transaction.
+
+    Args:
+        db (AsyncSession): The async database session
+        model: The mapped class to insert into.
+        rows (list[dict]): The column values of the rows to insert.
+
+    Returns:
+        list: The inserted rows as mappings, in the same order as the input.
+    """
+    if not rows:
+        return []
+    table = model.__table__
+    statement = insert(table).returning(*table.c, sort_by_parameter_order=True)
+    return (await db.execute(statement, rows)).mappings().all()
+
+
+@track_queries
+async def bulk_create_flights(db: AsyncSession, flights_create: list[flights.FlightsCreate]) -> tuple[list, list]:
+    """
+    Create many flights in one transaction.
+
+    All referenced airports are validated against the airport cache and at most one query, rows pointing at a
+    missing airport are reported back instead of failing the whole batch.
+
+    Args:
+        db (AsyncSession): The async database session
+        flights_create (list[flights.FlightsCreate]): The flights to create
+
+    Returns:
+        tuple: The created flights and an {index, detail} error per rejected row.
+    """
+    airport_ids = {flight.departure_airport_id for flight in flights_create} | \
+                  {flight.arrival_airport_id for flight in flights_create}
+    await AIRPORT_CACHE.ensure_fresh(db)
+    known_airports = {airport_id for airport_id in airport_ids if AIRPORT_CACHE.get(airport_id) is not None}
+    known_airports |= await existing_ids(db, Airports.id, airport_ids - known_airports)
+
+    rows, errors = [], []
+    for index, flight in enumerate(flights_create):
+        if flight.departure_airport_id not in known_airports:
+            errors.append({"index": index,
+                           "detail": f"Departure airport ={flight.departure_airport_id} does not exist"})
+        elif flight.arrival_airport_id not in known_airports:
+            errors.append({"index": index,
+                           "detail": f"Arrival airport ={flight.arrival_airport_id} does not exist"})
+        else:
+            rows.append(flight.model_dump())
+    created = await bulk_insert(db, Flights, rows)
+    await route_fares.refresh(db, map(route_fares.route_day, created))
+    await db.commit()
+    table_events.bump(Flights.__tablename__)
+    for row in created:
+        FLIGHT_INDEX.upsert(row)
+    return created, errors
+
+
+@track_queries
+async def get_flight_by_id(db: AsyncSession, flight_id: int):
+    return await db.scalar(select(Flights).filter_by(id=flight_id))
+
+
+@track_queries
+async def update_flights(db: AsyncSession, flight_id: int, flight_update: flights.FlightsUpdate):
+    flight = await get_flight_by_id(db=db, flight_id=flight_id)
+    if not flight:
+        raise ValueError(f"Flight with id {flight_id} does not exist")
+    previous_route_day = route_fares.route_day(flight)
+    for key, value in flight_update.model_dump().items():
+        setattr(flight, key, value)
+    await db.flush()
+    await route_fares.refresh(db, [previous_route_day, route_fares.route_day(flight)])
+    await db.commit()
+    await db.refresh(flight)
+    table_events.bump(Flights.__tablename__)
+    FLIGHT_INDEX.upsert(flight)
+    return flight
+
+
+@track_queries
+async def delete_flights(db: AsyncSession, flight_id: int):
+    flight = await get_flight_by_id(db=db, flight_id=flight_id)
+    if flight:
+        await db.delete(flight)
+        await db.flush()
+        await route_fares.refresh(db, [route_fares.route_day(flight)])
+        await db.commit()
+        table_events.bump(Flights.__tablename__)
+        FLIGHT_INDEX.remove(flight_id)
+    else:
+        raise ValueError(f"Flight with id {flight_id} does not exist")
+
+
+@track_queries
+async def create_passengers(db: AsyncSession, passenger: passengers.PassengersCreate):
+    """
+    Book a seat on the passenger's flight and create the passenger.
+
+    The passenger INSERT selects from the reserve_seats UPDATE in a CTE, so both happen in one statement, the
+    passenger only exists if a seat was taken and the flight's row lock is held for no longer than the commit.
+
+    Args:
+        db (AsyncSession): The async database session
+        passenger (passengers.PassengersCreate): The passenger to create
+
+    Returns:
+        The created passenger as a mapping.
+
+    Raises:
+        ValueError: If the flight does not exist.
+        SeatsUnavailableError: If the flight has no seats left.
+    """
+    table = Passengers.__table__
+    seat = reserve_seats(passenger.flight_id).cte("seat")
+    values = passenger.model_dump(exclude={"flight_id"})
+    statement = insert(table).from_select(
+        ["flight_id", *values],
+        select(seat.c.id, *(literal(value, table.c[key].type) for key, value in values.items())),
+    ).returning(*table.c)
+    created = (await db.execute(statement)).mappings().first()
+    if created is None:
+        await db.rollback()
+        if not await check_flights_exists(db, passenger.flight_id):
+            raise ValueError(f"Flight with id {passenger.flight_id} does not exist")
+        raise SeatsUnavailableError(f"Flight with id {passenger.flight_id} is sold out")
+    await db.commit()
+    return created
+
+
+@track_queries
+async def bulk_create_passengers(db: AsyncSession,
+                                 passengers_create: list[passengers.PassengersCreate]) -> tuple[list, list]:
+    """
+    Book seats for and create many passengers in one transaction.
+
+    The seats of each flight are taken with one reserve_seats UPDATE, all or nothing per flight. Flights are
+    locked in id order, so concurrent bulk bookings can not deadlock each other.
+
+    Args:
+        db (AsyncSession): The async database session
+        passengers_create (list[passengers.PassengersCreate]): The passengers to create
+
+    Returns:
+        tuple: The created passengers and an {index, detail} error per rejected row.
+    """
+    requested = Counter(passenger.flight_id for passenger in passengers_create)
+    booked = set()
+    for flight_id in sorted(requested):
+        if (await db.execute(reserve_seats(flight_id, requested[flight_id]))).first() is not None:
+            booked.add(flight_id)
+    known_flights = booked | await existing_ids(db, Flights.id, set(requested) - booked)
+
+    rows, errors = [], []
+    for index, passenger in enumerate(passengers_create):
+        if passenger.flight_id not in known_flights:
+            errors.append({"index": index, "detail": f"Flight ={passenger.flight_id} does not exist"})
+        elif passenger.flight_id not in booked:
+            errors.append({"index": index, "detail": f"Flight ={passenger.flight_id} does not have "
+                                                     f"{requested[passenger.flight_id]} available seats"})
+        else:
+            rows.append(passenger.model_dump())
+    created = await bulk_insert(db, Passengers, rows)
+    await db.commit()
+    return created, errors
+
+
+@track_queries
+async def check_passengers_exists(db: AsyncSession,
+                                  passenger_id: int) -> bool:
+    return (await db.scalar(select(Passengers.id).filter_by(id=passenger_id))) is not None
+
+
+def export_passengers_statement(passenger_id: [int] = None,
+                                first_name: [str] = None,
+                                last_name: [str] = None,
+                                passport_number: [str] = None):
+    """
+        Build the column level select used to export passengers, ordered by id.
+
+        Args:
+            passenger_id (list, optional): A list of passenger IDs.
+            first_name (list, optional): A list of first names.
+            last_name (list, optional): A list of last names.
+            passport_number (list, optional): A list of passport numbers.
+
+        Returns:
+            Select: The export statement.
+        """
+    return filter_passengers(select(Passengers.__table__), passenger_id, first_name, last_name,
+                             passport_number).order_by(Passengers.id)
+
+
+@track_queries
+async def get_passengers(db: AsyncSession,
+                         passenger_id: [int] = None,
+                         first_name: [str] = None,
+                         last_name: [str] = None,
+                         passport_number: [str] = None,
+                         name_match: str = "exact",
+                         sort: str = "id",
+                         cursor: Optional[str] = None,
+                         limit: int = 100,
+                         tuples: bool = False):
+    """
+        Get a page of passengers based on the provided filters.
+
+        Fuzzy name searches return the best matches only, ranked by the trigram distance of their names to the
+        searched names, as a single page without a next cursor.
+
+        Args:
+            db (AsyncSession): The async database session
+            passenger_id (list, optional): A list of passenger IDs. Defaults to None.
+            first_name (list, optional): A list of first names. Defaults to None.
+            last_name (list, optional): A list of last names. Defaults to None.
+            passport_number (list, optional): A list of passport numbers. Defaults to None.
+            name_match (str, optional): How names are matched, one of filters.NAME_MATCHES. Defaults to "exact".
+            sort (str, optional): The PASSENGERS_SORT_KEYS key to order by, unused by fuzzy searches.
+                Defaults to "id".
+            cursor (str, optional): The next_cursor of the previous page. Defaults to None.
+            limit (int, optional): The maximum number of results to return. Defaults to 100.
+            tuples (bool, optional): Return the passengers as tuples in the order of PASSENGERS_LIST_COLUMNS
+                rather than dicts, for the columnar formats. Defaults to False.
+
+        Returns:
+            tuple: A list of passengers, as dicts with the fields of schemas.passengers.Passengers, that match the
+                provided filters and the cursor of the next page.
+
+        Raises:
+            InvalidCursorError: If the cursor is invalid, or given for a fuzzy search.
+        """
+    if name_match != "fuzzy" or (first_name is None and last_name is None):
+        statement = filter_passengers(select(*PASSENGERS_LIST_COLUMNS),
+                                      passenger_id, first_name, last_name, passport_number, name_match)
+        return await fetch_page(db, statement, sort, PASSENGERS_SORT_KEYS[sort], Passengers.id, cursor, limit,
+                                tuples)
+    if cursor is not None:
+        raise InvalidCursorError("Fuzzy name searches return a single page")
+    statement = filter_passengers(select(*PASSENGERS_LIST_COLUMNS), passenger_id, passport_number=passport_number)
+    result = await db.execute(order_by_name_distance(statement, first_name, last_name, page_size(limit)))
+    return list(map(tuple, result) if tuples else map(dict, result.mappings())), None
+
+
+@track_queries
+async def get_passenger_by_id(db: AsyncSession, passenger_id: int):
+    return await db.scalar(select(Passengers).filter_by(id=passenger_id))
+
+
+@track_queries
+async def move_seat(db: AsyncSession, from_flight_id: Optional[int], to_flight_id: int):
+    """
+    Take a seat on one flight and give one back to another, inside the current transaction.
+
+    Args:
+        db (AsyncSession): The async database session
+        from_flight_id (int, optional): The flight the passenger leaves, if any.
+        to_flight_id (int): The flight the passenger moves to.
+
+    Raises:
+        ValueError: If the new flight does not exist.
+        SeatsUnavailableError: If the new flight has no seats left.
+    """
+    # Both rows are locked in id order, so two passengers swapping flights can not deadlock
+    for flight_id in sorted({from_flight_id, to_flight_id} - {None}):
+        if flight_id == from_flight_id:
+            await db.execute(release_seats(flight_id))
+        elif (await db.execute(reserve_seats(flight_id))).first() is None:
+            await db.rollback()
+            if not await check_flights_exists(db, flight_id):
+                raise ValueError(f"Flight with id {flight_id} does not exist")
+            raise SeatsUnavailableError(f"Flight with id {flight_id} is sold out")
+
+
+@track_queries
+async def update_passengers(db: AsyncSession, passenger_id: int,
+                            passenger_update: passengers.PassengersUpdate):
+    passenger = await get_passenger_by_id(db=db, passenger_id=passenger_id)
+    if not passenger:
+        raise ValueError(f"Passenger with id {passenger_id} does not exist")
+    moved = passenger_update.flight_id != passenger.flight_id
+    if moved:
+        await move_seat(db, passenger.flight_id, passenger_update.flight_id)
+    for key, value in passenger_update.model_dump().items():
+        setattr(passenger, key, value)
+    await db.commit()
+    await db.refresh(passenger)
+    return passenger
+
+
+@track_queries
+async def delete_passengers(db: AsyncSession, passenger_id: int) -> None:
+    # The seat goes back to the flight in the same transaction
+    table = Passengers.__table__
+    deleted = (await db.execute(
+        delete(table).where(table.c.id == passenger_id).returning(table.c.flight_id)
+    )).first()
+    if deleted is None:
+        raise ValueError(f"Passenger with id {passenger_id} does not exist")
+    if deleted.flight_id is not None:
+        await db.execute(release_seats(deleted.flight_id))
+    await db.commit()
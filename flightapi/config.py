@@ -1,8 +1,6 @@
 from os import environ
 from typing import Optional
 
-from pyaml import yaml
-
 from .log_config import get_logger
 from .schemas.config import Config
 
@@ -33,6 +31,9 @@ def init_from_file():
             "to point to the config file location."
         )
 
+    # Only needed here, importing it with the module would add to every worker start
+    from pyaml import yaml
+
     with open(config_path, "rb") as config:
         loaded_config = yaml.load(config, Loader=yaml.FullLoader)
         init_from_yaml(loaded_config)
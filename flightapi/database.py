@@ -1,7 +1,14 @@
-from sqlalchemy import create_engine
+from time import perf_counter
+from uuid import uuid4
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, Query
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool
 
-from .db_config import DATABASE_HOST, DATABASE_PASSWORD, DATABASE_NAME, DATABASE_USERNAME
+from .db_config import DATABASE_HOST, DATABASE_PORT, DATABASE_PASSWORD, DATABASE_NAME, DATABASE_USERNAME, \
+    DATABASE_ECHO, DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW, DATABASE_POOL_TIMEOUT, DATABASE_POOL_RECYCLE, \
+    DATABASE_POOL_PRE_PING, DATABASE_PGBOUNCER, DATABASE_NULL_POOL
 from .models import Base
 
 
@@ -15,14 +22,153 @@ class CustomQuery(Query):
             return self
 
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{DATABASE_USERNAME}:{DATABASE_PASSWORD}@{DATABASE_HOST}:5432/{DATABASE_NAME}"
+# 2.0 style select() statements have no custom query class, so the async crud uses this helper instead
+def where_if(statement, condition: bool, *criterion):
+    if condition:
+        return statement.where(*criterion)
+    else:
+        return statement
+
+
+SQLALCHEMY_DATABASE_URL = \
+    f"postgresql://{DATABASE_USERNAME}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
+ASYNC_SQLALCHEMY_DATABASE_URL = \
+    f"postgresql+asyncpg://{DATABASE_USERNAME}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
+
+
+class PoolStats:
+    """
+    Checkout statistics for a single connection pool in the current worker process.
+
+    Attributes:
+        checkouts (int): The number of successful connection checkouts.
+        timeouts (int): The number of checkouts that gave up after DATABASE_POOL_TIMEOUT.
+        wait_total (float): The total time in seconds spent waiting for a connection.
+        wait_max (float): The longest single wait in seconds.
+        listeners (list): Callables taking (wait, timed_out), called on every checkout attempt.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.listeners = []
+
+    def record(self, wait: float, timed_out: bool = False):
+        for listener in self.listeners:
+            listener(wait, timed_out)
+        if timed_out:
+            self.timeouts += 1
+        else:
+            self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self, pool) -> dict:
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        return {
+            "pool_class": type(pool).__name__,
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "capacity": capacity,
+            "saturation": pool.checkedout() / capacity if capacity else 0.0,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": 1000 * self.wait_total / self.checkouts if self.checkouts else 0.0,
+            "wait_max_ms": 1000 * self.wait_max,
+        }
+
+
+# Times every checkout - _do_get is where QueuePool blocks when all connections are in use
+class _TimedCheckoutMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(perf_counter() - start)
+        return connection
+
+
+class InstrumentedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(is_async: bool = False) -> dict:
+    """
+    Build the create_engine keyword arguments from the DATABASE_* environment settings.
+
+    Args:
+        is_async (bool, optional): Whether the options are for the asyncpg engine. Defaults to False.
+
+    Returns:
+        dict: The keyword arguments for create_engine / create_async_engine.
+    """
+    options = {"echo": DATABASE_ECHO, "pool_pre_ping": DATABASE_POOL_PRE_PING}
+    if DATABASE_NULL_POOL:
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            poolclass=InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+            pool_size=DATABASE_POOL_SIZE,
+            max_overflow=DATABASE_MAX_OVERFLOW,
+            pool_timeout=DATABASE_POOL_TIMEOUT,
+            pool_recycle=DATABASE_POOL_RECYCLE,
+        )
+    # psycopg2 never uses server side prepared statements, asyncpg does unless its caches are turned off
+    if is_async and DATABASE_PGBOUNCER:
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    return options
+
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, echo=True
+    SQLALCHEMY_DATABASE_URL, **engine_options()
+)
+
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL, **engine_options(is_async=True)
 )
 
+
+def pool_stats() -> dict:
+    """
+    Return the connection pool statistics of the current worker process.
+
+    Returns:
+        dict: A snapshot of the sync and async engine pools.
+    """
+    stats = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        if isinstance(pool, _TimedCheckoutMixin):
+            stats[name] = pool.stats.snapshot(pool)
+        else:
+            stats[name] = {"pool_class": type(pool).__name__}
+    return stats
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, query_cls=CustomQuery)
 
+# expire_on_commit is disabled so the returned objects can still be serialized after the commit
+# without triggering an implicit (and in async, forbidden) lazy refresh
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False,
+                                       class_=AsyncSession)
+
 
 # Dependency
 def get_db():
@@ -31,3 +177,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Async dependency
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,8 +1,28 @@
 import os
 
+
+def _getenv_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
 DATABASE_USERNAME = os.getenv('DATABASE_USERNAME', 'flight_user')
 DATABASE_PASSWORD = os.getenv('DATABASE_PASSWORD', 'Password1!')
 DATABASE_HOST = os.getenv('DATABASE_HOST', 'postgresql')
+DATABASE_PORT = int(os.getenv('DATABASE_PORT', '5432'))
 DATABASE_NAME = os.getenv('DATABASE_NAME', 'flight_db')
 
-DATABASE_URL = f"postgresql://{DATABASE_USERNAME}:{DATABASE_PASSWORD}@{DATABASE_HOST}:5432/{DATABASE_NAME}"
+DATABASE_URL = f"postgresql://{DATABASE_USERNAME}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
+
+# Connection pool settings - these apply per engine, and every gunicorn worker holds its own sync and async
+# engine, so the worst case connection count is workers * 2 * (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW)
+DATABASE_ECHO = _getenv_bool('DATABASE_ECHO', 'false')
+DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', '5'))
+DATABASE_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW', '10'))
+DATABASE_POOL_TIMEOUT = float(os.getenv('DATABASE_POOL_TIMEOUT', '30'))
+DATABASE_POOL_RECYCLE = int(os.getenv('DATABASE_POOL_RECYCLE', '1800'))
+DATABASE_POOL_PRE_PING = _getenv_bool('DATABASE_POOL_PRE_PING', 'true')
+
+# When running behind PgBouncer in transaction pooling mode, server side prepared statements can not be used
+# and pooling is usually best left to PgBouncer itself (DATABASE_NULL_POOL)
+DATABASE_PGBOUNCER = _getenv_bool('DATABASE_PGBOUNCER', 'false')
+DATABASE_NULL_POOL = _getenv_bool('DATABASE_NULL_POOL', 'false')
@@ -1,90 +1,394 @@
+"""Generate a deterministic, production sized dataset and load it with COPY.
+
+Airports are made from the faker_airtravel airport list, topped up with synthetic codes when more are asked for.
+Their popularity follows a Zipf like distribution (--skew, 0 for uniform), so a few hubs carry most routes and
+flights the way real traffic does. Flight durations and fares follow the great circle distance of the route.
+
+Flights and passengers are generated in chunks of --chunk-size rows by --workers processes, each streaming its
+chunk into Postgres with COPY. Every chunk has its own random generator derived from --seed and the chunk
+number, and the ids are assigned up front, so the same arguments always produce the same rows, whatever the
+number of workers.
+
+Without --truncate the rows are added to what is there. Airports are only generated when the airports table is
+empty, the existing ones are used otherwise. --defer-indexes drops the secondary indexes of flights and
+passengers during the load and builds them again afterwards, in parallel, which is much faster for the large
+scales.
+
+The route fares summary is rebuilt from the flights at the end, the rows are loaded without the crud functions
+that keep it up to date.
+
+Usage:
+    python -m flightapi.db_seed --scale small
+    python -m flightapi.db_seed --scale 10m --truncate --defer-indexes --seed 7
+    python -m flightapi.db_seed --airports 300 --flights 250000 --passengers 100000 --skew 1.2 --workers 8
+"""
+
+import argparse
+import csv
 import datetime
+import io
+import multiprocessing
+import random
+import sys
+import time
+from typing import NamedTuple
 
+import numpy as np
+import psycopg2
 from faker import Faker
-from faker_airtravel import AirTravelProvider
-import random
+from faker_airtravel.airports import airport_list
+from faker_airtravel.constants import airlines
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects import postgresql
 
 from flightapi.db_config import DATABASE_URL
-from flightapi.models import Airports, Flights, Passengers
+from flightapi.route_fares import rebuild_statements
+from flightapi.route_stats import haversine_km
 
-if __name__ == "__main__":
-    engine = create_engine(
-        DATABASE_URL, echo=True
+# Airports, flights and passengers per scale
+SCALES = {
+    "small": (10, 50, 25),
+    "10k": (200, 10000, 5000),
+    "1m": (2000, 1000000, 500000),
+    "10m": (5000, 10000000, 5000000),
+}
+
+AIRPORT_COLUMNS = ("code", "name", "city", "country", "latitude", "longitude")
+FLIGHT_COLUMNS = ("id", "flight_status", "flight_number", "available_seats", "departure_airport_id",
+                  "arrival_airport_id", "departure_date", "arrival_date", "duration", "fare")
+PASSENGER_COLUMNS = ("id", "flight_id", "first_name", "last_name", "date_of_birth", "passport_number")
+
+FLIGHT_STATUSES = np.array(["On Time", "Delayed", "Cancelled"])
+FLIGHT_STATUS_WEIGHTS = (0.85, 0.12, 0.03)
+AIRLINE_CODES = np.array(sorted({name[:2].upper() for name in airlines}))
+# Pools the passenger names are drawn from, generating millions of names with Faker would take longer than the
+# whole load
+NAME_POOL_SIZE = 2000
+CRUISE_SPEED_KMH = 800
+TAXI_MINUTES = 30
+
+
+class SeedContext(NamedTuple):
+    """
+    Everything the workers need to generate their chunks.
+
+    Attributes:
+        seed (int): The seed of the run.
+        airport_ids (numpy.ndarray): The airport ids, most popular first.
+        weights (numpy.ndarray): The popularity of every airport, summing to 1.
+        latitudes (numpy.ndarray): The latitude of every airport.
+        longitudes (numpy.ndarray): The longitude of every airport.
+        start_date (numpy.datetime64): The earliest departure.
+        days (int): The number of days departures are spread over.
+        first_flight_id (int): The lowest flight id passengers are booked on.
+        last_flight_id (int): The highest flight id passengers are booked on.
+        first_names (numpy.ndarray): The pool of first names.
+        last_names (numpy.ndarray): The pool of last names.
+    """
+    seed: int
+    airport_ids: np.ndarray
+    weights: np.ndarray
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    start_date: np.datetime64
+    days: int
+    first_flight_id: int
+    last_flight_id: int
+    first_names: np.ndarray
+    last_names: np.ndarray
+
+
+def zipf_weights(count: int, skew: float) -> np.ndarray:
+    """
+    Get Zipf like popularity weights, the item of rank r weighs 1 / r ** skew.
+
+    Args:
+        count (int): The number of items.
+        skew (float): The exponent, 0 for a uniform distribution.
+
+    Returns:
+        numpy.ndarray: The weights, most popular first, summing to 1.
+    """
+    weights = np.arange(1, count + 1, dtype=np.float64) ** -skew
+    return weights / weights.sum()
+
+
+def synthetic_codes(taken: set):
+    for index in range(26 ** 3):
+        code = chr(65 + index // 676) + chr(65 + index // 26 % 26) + chr(65 + index % 26)
+        if code not in taken:
+            yield code
+
+
+def generate_airports(count: int, seed: int) -> list[tuple]:
+    """
+    Generate airports, the real ones of faker_airtravel first and then synthetic ones.
+
+    Args:
+        count (int): The number of airports, at most 17576, the number of three letter codes.
+        seed (int): The seed of the run.
+
+    Returns:
+        list[tuple]: The airports, with the values of AIRPORT_COLUMNS.
+    """
+    faker = Faker()
+    faker.seed_instance(seed)
+    real = sorted(airport_list, key=lambda airport: airport["iata"])
+    random.Random(seed).shuffle(real)
+    airports = [(airport["iata"], airport["airport"], airport["city"], airport["country"])
+                for airport in real[:count]]
+    codes = synthetic_codes({airport[0] for airport in airports})
+    while len(airports) < count:
+        city = faker.city()
+        airports.append((next(codes), f"{city} Airport", city, faker.country()))
+    return [(*airport, float(faker.latitude()), float(faker.longitude())) for airport in airports]
+
+
+def flight_rows(context: SeedContext, chunk: int, first_id: int, count: int) -> str:
+    """
+    Generate a chunk of flights as CSV.
+
+    Args:
+        context (SeedContext): The shared generation parameters.
+        chunk (int): The chunk number, it seeds the chunk's random generator.
+        first_id (int): The id of the first flight of the chunk.
+        count (int): The number of flights.
+
+    Returns:
+        str: The flights, one CSV line per flight with the values of FLIGHT_COLUMNS.
+    """
+    rng = np.random.default_rng([context.seed, 1, chunk])
+    airports = len(context.airport_ids)
+    departure = rng.choice(airports, count, p=context.weights)
+    arrival = rng.choice(airports, count, p=context.weights)
+    if airports > 1:
+        # Move round trips to the same airport to another, random, airport
+        same = departure == arrival
+        arrival[same] = (arrival[same] + rng.integers(1, airports, same.sum())) % airports
+
+    distance = np.nan_to_num(haversine_km(context.latitudes[departure], context.longitudes[departure],
+                                          context.latitudes[arrival], context.longitudes[arrival]))
+    duration = np.rint(distance / CRUISE_SPEED_KMH * 60 + TAXI_MINUTES).astype(np.int64)
+    fare = np.round((40 + 0.08 * distance) * rng.lognormal(0, 0.35, count), 2)
+    departure_date = context.start_date + rng.integers(0, context.days * 24 * 60, count).astype("timedelta64[m]")
+    arrival_date = departure_date + duration.astype("timedelta64[m]")
+    flight_number = np.char.add(rng.choice(AIRLINE_CODES, count), rng.integers(100, 10000, count).astype(str))
+
+    columns = (
+        np.arange(first_id, first_id + count).astype(str),
+        rng.choice(FLIGHT_STATUSES, count, p=FLIGHT_STATUS_WEIGHTS),
+        flight_number,
+        rng.integers(0, 301, count).astype(str),
+        context.airport_ids[departure].astype(str),
+        context.airport_ids[arrival].astype(str),
+        np.datetime_as_string(departure_date, unit="m", timezone="UTC"),
+        np.datetime_as_string(arrival_date, unit="m", timezone="UTC"),
+        duration.astype(str),
+        fare.astype(str),
     )
+    return "".join(",".join(row) + "\n" for row in zip(*(column.tolist() for column in columns)))
+
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-session = SessionLocal()
-
-faker = Faker()
-
-faker.add_provider(AirTravelProvider)
-
-num_airports = 10
-num_airlines = 15
-num_flights = 50
-num_passengers = 25
-
-# airports_code = faker.airports_object()
-
-for i in range(num_airports):
-    airports_code = faker.airport_object()
-    code = faker.airport_iata()
-    unique_code = [i for i in code if code.count(i) == 1]
-    name = airports_code.get('airport')
-    city = airports_code.get('city')
-    country = airports_code.get('country')
-    session.add_all(
-        [
-            Airports(
-                code=code,
-                name=name,
-                city=city,
-                country=country,
-            )
-        ]
+def passenger_rows(context: SeedContext, chunk: int, first_id: int, count: int) -> str:
+    """
+    Generate a chunk of passengers as CSV.
+
+    Args:
+        context (SeedContext): The shared generation parameters.
+        chunk (int): The chunk number, it seeds the chunk's random generator.
+        first_id (int): The id of the first passenger of the chunk.
+        count (int): The number of passengers.
+
+    Returns:
+        str: The passengers, one CSV line per passenger with the values of PASSENGER_COLUMNS.
+    """
+    rng = np.random.default_rng([context.seed, 2, chunk])
+    ids = np.arange(first_id, first_id + count)
+    columns = (
+        ids.astype(str),
+        rng.integers(context.first_flight_id, context.last_flight_id + 1, count).astype(str),
+        rng.choice(context.first_names, count),
+        rng.choice(context.last_names, count),
+        (np.datetime64("1940-01-01") + rng.integers(0, 70 * 365, count).astype("timedelta64[D]")).astype(str),
+        np.char.add("P", np.char.zfill(ids.astype(str), 9)),
+    )
+    return "".join(",".join(row) + "\n" for row in zip(*(column.tolist() for column in columns)))
+
+
+_context = None
+_connection = None
+
+
+def _init_worker(context: SeedContext):
+    global _context, _connection
+    _context = context
+    _connection = psycopg2.connect(DATABASE_URL)
+
+
+def copy(connection, table: str, columns: tuple, rows: str):
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, ENCODING 'UTF8')",
+                           io.BytesIO(rows.encode()))
+    connection.commit()
+
+
+def _load_chunk(task: tuple) -> int:
+    table, chunk, first_id, count = task
+    if table == "flights":
+        copy(_connection, "flights", FLIGHT_COLUMNS, flight_rows(_context, chunk, first_id, count))
+    else:
+        copy(_connection, "passengers", PASSENGER_COLUMNS, passenger_rows(_context, chunk, first_id, count))
+    return count
+
+
+def _execute(statement: str):
+    with _connection.cursor() as cursor:
+        cursor.execute(statement)
+    _connection.commit()
+
+
+def chunks(table: str, first_id: int, count: int, chunk_size: int) -> list[tuple]:
+    return [(table, chunk, first_id + start, min(chunk_size, count - start))
+            for chunk, start in enumerate(range(0, count, chunk_size))]
+
+
+def secondary_indexes(cursor, table: str) -> list[tuple[str, str]]:
+    # Indexes backing a primary key or unique constraint stay, they can not be dropped on their own
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+        "AND indexname NOT IN (SELECT conname FROM pg_constraint)",
+        (table,),
     )
+    return cursor.fetchall()
+
+
+def seed(airports: int, flights: int, passengers: int, seed_value: int = 42, skew: float = 1.0,
+         start_date: datetime.date = None, days: int = 365, workers: int = None, chunk_size: int = 200000,
+         truncate: bool = False, defer_indexes: bool = False):
+    """
+    Generate the dataset and load it.
 
-for i in range(num_flights):
-    airport = faker.flight()
-    print(airport)
-    departure_airport = random.choice(airport['origin'].get('iata'))
-    arrival_airport = random.choice(airport['destination'].get('iata'))
-    print(departure_airport)
-    arrival_airport_code = airport.get('iata')
-    departure_date = faker.date_this_year(after_today=True)
-    arrival_date = departure_date + datetime.timedelta(days=random.randint(1, 12))
-    session.add_all(
-        [
-            Flights(
-                # airline_id=random.randint(1, num_airlines),
-                flight_status=random.choice(["On Time", "Delayed", "Cancelled"]),
-                flight_number= random.randint(100, 900),
-                available_seats=faker.text(max_nb_chars=5),
-                departure_airport_id=random.randint(1, num_airports),
-                arrival_airport_id=random.randint(1, num_airports),
-                departure_date=departure_date.strftime("%Y-%m-%d"),
-                arrival_date=arrival_date.strftime("%Y-%m-%d"),
-                duration=random.randint(30, 360),
-                fare=random.randint(1000, 100000),
-
-            )
-            ]
+    Args:
+        airports (int): The number of airports, used only when the airports table is empty.
+        flights (int): The number of flights to add.
+        passengers (int): The number of passengers to add.
+        seed_value (int, optional): The seed of the run. Defaults to 42.
+        skew (float, optional): The Zipf exponent of the airport popularity. Defaults to 1.0.
+        start_date (date, optional): The earliest departure. Defaults to today.
+        days (int, optional): The number of days departures are spread over. Defaults to 365.
+        workers (int, optional): The number of processes. Defaults to the CPU count.
+        chunk_size (int, optional): The number of rows per COPY. Defaults to 200000.
+        truncate (bool, optional): Whether to empty the tables first. Defaults to False.
+        defer_indexes (bool, optional): Whether to build the secondary indexes after the load. Defaults to False.
+    """
+    connection = psycopg2.connect(DATABASE_URL)
+    cursor = connection.cursor()
+    if truncate:
+        cursor.execute("TRUNCATE passengers, flights, airports RESTART IDENTITY CASCADE")
+        connection.commit()
+
+    cursor.execute("SELECT count(*) FROM airports")
+    if not cursor.fetchone()[0]:
+        rows = io.StringIO()
+        csv.writer(rows).writerows(generate_airports(airports, seed_value))
+        copy(connection, "airports", AIRPORT_COLUMNS, rows.getvalue())
+    cursor.execute("SELECT id, coalesce(latitude, 'NaN'), coalesce(longitude, 'NaN') FROM airports ORDER BY id")
+    airport_rows = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 3)
+    # Popularity is assigned in a random order, so the hubs are not simply the lowest ids
+    airport_rows = airport_rows[np.random.default_rng([seed_value, 0]).permutation(len(airport_rows))]
+
+    cursor.execute("SELECT coalesce(max(id), 0) FROM flights")
+    first_flight_id = cursor.fetchone()[0] + 1
+    if flights:
+        flight_range = (first_flight_id, first_flight_id + flights - 1)
+    else:
+        cursor.execute("SELECT min(id), max(id) FROM flights")
+        flight_range = cursor.fetchone()
+    cursor.execute("SELECT coalesce(max(id), 0) FROM passengers")
+    first_passenger_id = cursor.fetchone()[0] + 1
+    if passengers and flight_range[0] is None:
+        raise ValueError("Passengers need flights, there are none and none are generated")
+
+    faker = Faker()
+    faker.seed_instance(seed_value)
+    context = SeedContext(
+        seed=seed_value,
+        airport_ids=airport_rows[:, 0].astype(np.int64),
+        weights=zipf_weights(len(airport_rows), skew),
+        latitudes=airport_rows[:, 1],
+        longitudes=airport_rows[:, 2],
+        start_date=np.datetime64(start_date or datetime.date.today(), "m"),
+        days=days,
+        first_flight_id=flight_range[0] or 0,
+        last_flight_id=flight_range[1] or 0,
+        first_names=np.array([faker.first_name() for _ in range(NAME_POOL_SIZE)]),
+        last_names=np.array([faker.last_name() for _ in range(NAME_POOL_SIZE)]),
     )
-for i in range(num_passengers):
-    session.add_all(
-        [
-            Passengers(
-                flight_id=random.randint(1, num_flights),
-                first_name=faker.first_name(),
-                last_name=faker.last_name(),
-                date_of_birth=faker.date_this_year(after_today=True).strftime("%Y-%m-%d"),
-                passport_number=faker.passport_number(),
-            )
-        ]
+    tasks = (chunks("flights", first_flight_id, flights, chunk_size)
+             + chunks("passengers", first_passenger_id, passengers, chunk_size))
+
+    deferred = []
+    if defer_indexes:
+        for table in ("flights", "passengers"):
+            deferred += secondary_indexes(cursor, table)
+        for name, _ in deferred:
+            cursor.execute(f"DROP INDEX {name}")
+        connection.commit()
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(context,)) as pool:
+        try:
+            # Passengers reference flights, so every flight chunk is in before the first passenger chunk starts
+            for table in ("flights", "passengers"):
+                loaded, total, start = 0, sum(task[3] for task in tasks if task[0] == table), time.perf_counter()
+                for count in pool.imap_unordered(_load_chunk, [task for task in tasks if task[0] == table]):
+                    loaded += count
+                    print(f"{table}: {loaded}/{total} rows, {time.perf_counter() - start:.1f} s", file=sys.stderr)
+        finally:
+            if deferred:
+                print(f"building {len(deferred)} indexes", file=sys.stderr)
+                pool.map(_execute, [definition for _, definition in deferred], chunksize=1)
+
+    # The ids were assigned here, the sequences have to continue after them
+    for table in ("flights", "passengers"):
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), coalesce(max(id), 1)) FROM {table}")
+    # COPY bypasses the crud functions that keep the route fares summary up to date
+    for statement in rebuild_statements():
+        cursor.execute(str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})))
+    connection.commit()
+    connection.autocommit = True
+    for table in ("airports", "flights", "passengers", "route_fares"):
+        cursor.execute(f"ANALYZE {table}")
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="small",
+                        help="the numbers of airports, flights and passengers, unless given on their own")
+    parser.add_argument("--airports", type=int)
+    parser.add_argument("--flights", type=int)
+    parser.add_argument("--passengers", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of airport popularity, 0 is uniform")
+    parser.add_argument("--start-date", type=datetime.date.fromisoformat, help="first departure day, default today")
+    parser.add_argument("--days", type=int, default=365, help="days the departures are spread over")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=200000, help="rows per COPY")
+    parser.add_argument("--truncate", action="store_true", help="empty airports, flights and passengers first")
+    parser.add_argument("--defer-indexes", action="store_true", help="build the secondary indexes after the load")
+    args = parser.parse_args()
+
+    airports, flights, passengers = SCALES[args.scale]
+    start = time.perf_counter()
+    seed(
+        args.airports if args.airports is not None else airports,
+        args.flights if args.flights is not None else flights,
+        args.passengers if args.passengers is not None else passengers,
+        seed_value=args.seed, skew=args.skew, start_date=args.start_date, days=args.days, workers=args.workers,
+        chunk_size=args.chunk_size, truncate=args.truncate, defer_indexes=args.defer_indexes,
     )
+    print(f"seeded in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
 
-session.commit()
+if __name__ == "__main__":
+    main()
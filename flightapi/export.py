@@ -0,0 +1,302 @@
+import csv
+import datetime
+import decimal
+import io
+import json
+import os
+from typing import AsyncIterator, Optional
+
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import BigInteger, Boolean, Date, DateTime, Float, Integer, Numeric, SmallInteger, String, cast
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .database import async_engine
+
+# Number of rows fetched from the server side cursor and written per response chunk
+EXPORT_CHUNK_SIZE = int(os.getenv('FLIGHTAPI_EXPORT_CHUNK_SIZE', '5000'))
+# Rows per Parquet row group, cursor partitions are collected until a row group is full
+PARQUET_ROW_GROUP_SIZE = int(os.getenv('FLIGHTAPI_PARQUET_ROW_GROUP_SIZE', '100000'))
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+COLUMNAR_FORMATS = ("arrow", "parquet")
+
+
+class FormatUnavailableError(RuntimeError):
+    """Raised when a columnar format is requested but pyarrow is not installed."""
+    pass
+
+
+def _pyarrow():
+    # pyarrow is optional (the analytics extra) and large, it is only imported once a columnar format is requested
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as error:
+        raise FormatUnavailableError("The arrow and parquet formats need pyarrow, install the analytics extra") \
+            from error
+    return pyarrow
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def stream_partitions(statement, chunk_size: int = EXPORT_CHUNK_SIZE,
+                            connection: Optional[AsyncConnection] = None) -> AsyncIterator[tuple[list, list]]:
+    """
+    Read a select through a server side cursor, one partition at a time.
+
+    The connection is owned by the generator rather than the request dependency, so it stays open for as
+    long as the response is being streamed and no more than chunk_size rows are held in memory.
+
+    Args:
+        statement: The select statement to read.
+        chunk_size (int, optional): The number of rows per partition. Defaults to EXPORT_CHUNK_SIZE.
+        connection (AsyncConnection, optional): A connection owned by the caller to read on, for statements
+            that have to share its transaction. Defaults to None, a connection of its own.
+
+    Yields:
+        tuple: The column names and a list of row tuples.
+    """
+    if connection is None:
+        async with async_engine.connect() as connection:
+            async for keys, partition in stream_partitions(statement, chunk_size, connection):
+                yield keys, partition
+        return
+    result = await connection.stream(statement.execution_options(yield_per=chunk_size))
+    keys = list(result.keys())
+    async for partition in result.partitions():
+        yield keys, partition
+
+
+async def ndjson_chunks(statement) -> AsyncIterator[bytes]:
+    async for keys, partition in stream_partitions(statement):
+        lines = [json.dumps(dict(zip(keys, row)), default=_json_default) for row in partition]
+        yield ("\n".join(lines) + "\n").encode()
+
+
+async def csv_chunks(statement) -> AsyncIterator[bytes]:
+    # The header comes from the statement so that an empty export is still a valid CSV file
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(statement.selected_columns.keys())
+    yield buffer.getvalue().encode()
+    async for _, partition in stream_partitions(statement):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(partition)
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write only file collecting what pyarrow writes, drained into response chunks as it goes."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        # The Parquet footer records the offsets of the row groups, so the position counts what was drained
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_type(pa, column_type):
+    # Numeric, Float included, is a float in the API. BigInteger and SmallInteger are Integers, checked first
+    if isinstance(column_type, Numeric):
+        return pa.float64()
+    if isinstance(column_type, BigInteger):
+        return pa.int64()
+    if isinstance(column_type, SmallInteger):
+        return pa.int16()
+    if isinstance(column_type, Integer):
+        return pa.int32()
+    if isinstance(column_type, DateTime):
+        return pa.timestamp("us", tz="UTC" if column_type.timezone else None)
+    if isinstance(column_type, Date):
+        return pa.date32()
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, String):
+        return pa.string()
+    raise TypeError(f"No Arrow type for columns of type {column_type!r}")
+
+
+def arrow_schema(columns):
+    """
+    Get the Arrow schema of the selected columns, from their SQL types.
+
+    The schema does not depend on the rows, so an empty result is still a valid, typed file.
+
+    Args:
+        columns: The selected columns, e.g. statement.selected_columns.
+
+    Returns:
+        pyarrow.Schema: One nullable field per column.
+    """
+    pa = _pyarrow()
+    return pa.schema([pa.field(column.key, _arrow_type(pa, column.type)) for column in columns])
+
+
+def record_batch(schema, columns, column_values: list):
+    """
+    Build a record batch from the values of each column.
+
+    Args:
+        schema (pyarrow.Schema): The schema from arrow_schema.
+        columns: The selected columns, in the order of the schema.
+        column_values (list): One sequence of values per column.
+
+    Returns:
+        pyarrow.RecordBatch: The batch.
+    """
+    pa = _pyarrow()
+    arrays = []
+    for column, field, values in zip(columns, schema, column_values):
+        if _is_decimal(column):
+            # pyarrow only converts Decimals to decimal types, going through one of those would not round trip
+            values = [None if value is None else float(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _is_decimal(column) -> bool:
+    return isinstance(column.type, Numeric) and not isinstance(column.type, Float)
+
+
+def columnar_statement(statement):
+    """
+    Read the Numeric columns of an export as float8, so the rows carry floats rather than Decimals to convert.
+
+    Args:
+        statement: The select statement to export.
+
+    Returns:
+        Select: The same select, with the Numeric columns cast.
+    """
+    return statement.with_only_columns(
+        *(cast(column, Float).label(column.key) if _is_decimal(column) else column
+          for column in statement.selected_columns),
+        maintain_column_froms=True,
+    )
+
+
+async def arrow_chunks(statement) -> AsyncIterator[bytes]:
+    # Every cursor partition is transposed into columns and sent as one message of an Arrow IPC stream
+    pa = _pyarrow()
+    statement = columnar_statement(statement)
+    columns = list(statement.selected_columns)
+    schema = arrow_schema(columns)
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield sink.drain()
+        async for _, partition in stream_partitions(statement):
+            writer.write_batch(record_batch(schema, columns, list(zip(*partition))))
+            yield sink.drain()
+    yield sink.drain()
+
+
+async def parquet_chunks(statement) -> AsyncIterator[bytes]:
+    pa = _pyarrow()
+    statement = columnar_statement(statement)
+    columns = list(statement.selected_columns)
+    schema = arrow_schema(columns)
+    sink = _ChunkSink()
+    batches, rows = [], 0
+    with pa.parquet.ParquetWriter(sink, schema) as writer:
+        async for _, partition in stream_partitions(statement):
+            batches.append(record_batch(schema, columns, list(zip(*partition))))
+            rows += len(partition)
+            if rows >= PARQUET_ROW_GROUP_SIZE:
+                writer.write_table(pa.Table.from_batches(batches), row_group_size=rows)
+                batches, rows = [], 0
+                yield sink.drain()
+        if batches:
+            writer.write_table(pa.Table.from_batches(batches), row_group_size=rows)
+    yield sink.drain()
+
+
+FORMAT_CHUNKS = {
+    "ndjson": ndjson_chunks,
+    "csv": csv_chunks,
+    "arrow": arrow_chunks,
+    "parquet": parquet_chunks,
+}
+
+
+def export_response(statement, export_format: str, filename: str) -> StreamingResponse:
+    """
+    Stream the rows of a select as an NDJSON, CSV, Arrow IPC stream or Parquet attachment.
+
+    Args:
+        statement: The select statement to export.
+        export_format (str): One of the FORMAT_CHUNKS keys.
+        filename (str): The file name, without extension, suggested to the client.
+
+    Returns:
+        StreamingResponse: The chunked response.
+
+    Raises:
+        FormatUnavailableError: If a columnar format is requested and pyarrow is not installed.
+    """
+    if export_format in COLUMNAR_FORMATS:
+        # Checked before the response starts, a failing stream could only be cut off
+        _pyarrow()
+    chunks = FORMAT_CHUNKS[export_format](statement)
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'},
+    )
+
+
+def table_response(columns, rows: list[tuple], table_format: str, next_cursor: Optional[str]) -> Response:
+    """
+    Render a page of rows as an Arrow IPC stream or a Parquet file.
+
+    The rows are transposed into columns for the record batch, no per row dict is built.
+
+    Args:
+        columns: The columns the rows were selected from, in output order.
+        rows (list[tuple]): The rows of the page, as tuples in the order of the columns.
+        table_format (str): Either "arrow" or "parquet".
+        next_cursor (Optional[str]): The cursor of the next page, sent in the X-Next-Cursor header.
+
+    Returns:
+        Response: The page.
+
+    Raises:
+        FormatUnavailableError: If pyarrow is not installed.
+    """
+    pa = _pyarrow()
+    schema = arrow_schema(columns)
+    batch = record_batch(schema, columns, list(zip(*rows)) if rows else [()] * len(columns))
+    sink = pa.BufferOutputStream()
+    if table_format == "arrow":
+        with pa.ipc.new_stream(sink, schema) as writer:
+            writer.write_batch(batch)
+    else:
+        pa.parquet.write_table(pa.Table.from_batches([batch], schema=schema), sink)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor is not None else None
+    return Response(sink.getvalue().to_pybytes(), media_type=MEDIA_TYPES[table_format], headers=headers)
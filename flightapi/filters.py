@@ -0,0 +1,203 @@
+import datetime
+import os
+from typing import Optional
+
+from sqlalchemy import select, and_, or_, func, union_all, true, Float
+from sqlalchemy.orm import aliased
+
+from .database import where_if
+from .models import Flights, Airports, Passengers, PassengerFirstNames, PassengerLastNames
+
+NAME_MATCHES = ("exact", "prefix", "fuzzy")
+# Trigrams are three characters long, shorter prefix and fuzzy searches can not be narrowed down by the index
+MIN_NAME_SEARCH_LENGTH = 3
+# The distinct names of each passenger name column, see the 66c0ba963254 migration
+NAME_DICTIONARIES = {"first_name": PassengerFirstNames, "last_name": PassengerLastNames}
+# Least number of nearest names looked up per searched name. Searching one name column returns the best
+# matches whatever the number, searching both only pairs these names up
+FUZZY_NAME_CANDIDATES = int(os.getenv('FLIGHTAPI_FUZZY_NAME_CANDIDATES', '100'))
+
+
+def on_days(column, days: list[datetime.date]):
+    """
+    Match timestamps that fall on any of the given (UTC) days, as index friendly half open ranges.
+
+    Args:
+        column: The timestamptz column.
+        days (list[datetime.date]): The days to match.
+
+    Returns:
+        The OR of one [day, day + 1) range per day.
+    """
+    starts = [datetime.datetime.combine(day, datetime.time(), tzinfo=datetime.timezone.utc) for day in days]
+    return or_(*(and_(column >= start, column < start + datetime.timedelta(days=1)) for start in starts))
+
+
+def airport_ids_by_code(codes: list[str]):
+    """
+    Resolve IATA codes to airport ids inside the same statement, through the unique airports.code index.
+
+    Args:
+        codes (list[str]): The IATA codes.
+
+    Returns:
+        Select: A select of the matching airport ids, to be used with in_().
+    """
+    return select(Airports.id).where(Airports.code.in_([code.upper() for code in codes]))
+
+
+def filter_flights(statement,
+                   departure_airport: [str] = None,
+                   arrival_airport: [str] = None,
+                   departure_date: [datetime.date] = None,
+                   arrival_date: [datetime.date] = None,
+                   departure_from: Optional[datetime.datetime] = None,
+                   departure_to: Optional[datetime.datetime] = None,
+                   resolve_codes=airport_ids_by_code):
+    """
+    Apply the flight search filters to a select or query.
+
+    Route filters resolve the IATA codes in the same query, so together with a departure window the search is
+    one range scan of the (departure_airport_id, arrival_airport_id, departure_date) index.
+
+    Args:
+        statement: The select statement or query to filter.
+        departure_airport (list, optional): A list of departure airport IATA codes.
+        arrival_airport (list, optional): A list of arrival airport IATA codes.
+        departure_date (list, optional): A list of departure days.
+        arrival_date (list, optional): A list of arrival days.
+        departure_from (datetime, optional): The earliest departure time.
+        departure_to (datetime, optional): The latest departure time.
+        resolve_codes (callable, optional): Maps a list of IATA codes to what the airport id columns are matched
+            with in_(). Defaults to airport_ids_by_code.
+
+    Returns:
+        The filtered statement.
+    """
+    statement = where_if(statement, departure_airport is not None,
+                         Flights.departure_airport_id.in_(resolve_codes(departure_airport or [])))
+    statement = where_if(statement, arrival_airport is not None,
+                         Flights.arrival_airport_id.in_(resolve_codes(arrival_airport or [])))
+    # Unlike IN, these criteria can not be built from None, so they are only created when needed
+    if departure_date:
+        statement = statement.where(on_days(Flights.departure_date, departure_date))
+    if arrival_date:
+        statement = statement.where(on_days(Flights.arrival_date, arrival_date))
+    if departure_from is not None:
+        statement = statement.where(Flights.departure_date >= departure_from)
+    if departure_to is not None:
+        statement = statement.where(Flights.departure_date <= departure_to)
+    return statement
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def name_condition(column, names: list[str], name_match: str = "exact"):
+    """
+    Match a name column against any of the given names.
+
+    Prefix matches are case insensitive ILIKE 'name%' patterns and fuzzy matches use the pg_trgm similarity
+    operator, both served by the trigram GIN index of the column. Exact matches use its btree index.
+
+    Args:
+        column: The name column.
+        names (list[str]): The names to match.
+        name_match (str, optional): One of NAME_MATCHES. Defaults to "exact".
+
+    Returns:
+        The condition.
+    """
+    if name_match == "prefix":
+        return or_(*(column.ilike(escape_like(name) + "%", escape="\\") for name in names))
+    if name_match == "fuzzy":
+        return or_(*(column.op("%")(name) for name in names))
+    return column.in_(names)
+
+
+def trigram_distance(column, name: str):
+    # The pg_trgm distance, 1 - similarity, ordering by it is a nearest neighbour scan of a GiST trigram index
+    return column.op("<->", return_type=Float)(name)
+
+
+def nearest_names(column, names: list[str], limit: int):
+    """
+    Find the values of a passenger name column nearest to the searched names, by trigram distance.
+
+    The names are looked up in the dictionary of the column with a nearest neighbour scan of its GiST index,
+    and only those above the pg_trgm similarity threshold (the % operator) that some passenger still has.
+
+    Args:
+        column: Passengers.first_name or Passengers.last_name.
+        names (list[str]): The searched names.
+        limit (int): The number of nearest names per searched name.
+
+    Returns:
+        Subquery: The name and distance columns, the distance to the nearest of the searched names.
+    """
+    dictionary = NAME_DICTIONARIES[column.key]
+    passengers = aliased(Passengers)
+    in_use = select(passengers.id).where(getattr(passengers, column.key) == dictionary.name).exists()
+    nearest = [select(dictionary.name, trigram_distance(dictionary.name, name).label("distance"))
+               .where(dictionary.name.op("%")(name), in_use)
+               .order_by(trigram_distance(dictionary.name, name))
+               .limit(limit)
+               for name in names]
+    if len(nearest) == 1:
+        return nearest[0].subquery()
+    candidates = union_all(*nearest).subquery()
+    distance = func.min(candidates.c.distance).label("distance")
+    return select(candidates.c.name, distance).group_by(candidates.c.name).order_by(distance).subquery()
+
+
+def order_by_name_distance(statement, first_name: [str] = None, last_name: [str] = None, limit: int = 100):
+    """
+    Keep the passengers whose names are nearest to the searched names, best match first.
+
+    Passengers are ranked by the sum of the trigram distances of their searched names, then id. The nearest
+    names, or (first name, last name) pairs when both are searched, are looked up nearest first in the btree
+    indexes of passengers until there are enough passengers, so the search does not slow down with the number
+    of passengers.
+
+    Args:
+        statement: The passengers select to rank, without name conditions.
+        first_name (list, optional): The searched first names.
+        last_name (list, optional): The searched last names.
+        limit (int, optional): The number of passengers to return. Defaults to 100.
+
+    Returns:
+        The ordered and limited statement.
+    """
+    candidates = max(limit, FUZZY_NAME_CANDIDATES)
+    if first_name is None or last_name is None:
+        column, names = (Passengers.first_name, first_name) if last_name is None else (Passengers.last_name, last_name)
+        nearest = nearest_names(column, names, candidates)
+        statement = statement.join(nearest, nearest.c.name == column)
+        return statement.order_by(nearest.c.distance, Passengers.id).limit(limit)
+    first = nearest_names(Passengers.first_name, first_name, candidates)
+    last = nearest_names(Passengers.last_name, last_name, candidates)
+    # Ordered, so that the pairs are probed through ix_passengers_last_name_first_name nearest first
+    distance = (first.c.distance + last.c.distance).label("distance")
+    pairs = (select(first.c.name.label("first_name"), last.c.name.label("last_name"), distance)
+             .select_from(first.join(last, true()))
+             .order_by(distance)
+             .subquery())
+    statement = statement.join(pairs, and_(pairs.c.last_name == Passengers.last_name,
+                                           pairs.c.first_name == Passengers.first_name))
+    return statement.order_by(pairs.c.distance, Passengers.id).limit(limit)
+
+
+def filter_passengers(statement,
+                      passenger_id: [int] = None,
+                      first_name: [str] = None,
+                      last_name: [str] = None,
+                      passport_number: [str] = None,
+                      name_match: str = "exact"):
+    statement = where_if(statement, passenger_id is not None, Passengers.id.in_(passenger_id or []))
+    for column, names in ((Passengers.first_name, first_name), (Passengers.last_name, last_name)):
+        if names is not None:
+            statement = statement.where(name_condition(column, names, name_match))
+    statement = where_if(statement, passport_number is not None,
+                         Passengers.passport_number.in_(passport_number or []))
+    return statement
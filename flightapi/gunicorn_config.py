@@ -4,12 +4,22 @@ Environment variables:
     - FLIGHTAPI_BIND: Default 0.0.0.0:8000, The host and IP to set the bind argument
     - FLIGHTAPI_WORKERS: Default CPU count, The number of gunicorn workers
     - FLIGHTAPI_LOG_LEVEL: Default info, the log level for the application
+    - PROMETHEUS_MULTIPROC_DIR: Default /tmp/flightapi-metrics, The directory the workers write their metrics to,
+      emptied when gunicorn starts
+    - FLIGHTAPI_MIGRATE_ON_START: Default true, Whether the master process migrates the database before it starts
+      the workers, turn it off when migrations run as a separate deployment step (python -m flightapi.migrate)
 """
 
 import multiprocessing
-from os import environ
+import shutil
+from os import environ, makedirs
 
-from flightapi.log_config import get_logger
+# prometheus_client picks its multiprocess storage when it is first imported, the workers inherit this module's
+environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/flightapi-metrics")
+
+from prometheus_client import multiprocess  # noqa: E402
+
+from flightapi.log_config import get_logger  # noqa: E402
 
 LOGGER = get_logger(__name__)
 
@@ -19,3 +29,21 @@ log_level = environ.get("FLIGHTAPI_LOG_LEVEL", "info")
 environment_domain = environ.get("ENVIRONMENT_DOMAIN")
 worker_class = "uvicorn.workers.UvicornWorker"
 threads = 4
+migrate_on_start = environ.get("FLIGHTAPI_MIGRATE_ON_START", "true").lower() in ("1", "true", "yes")
+
+
+def on_starting(server):
+    # Samples left over from a previous run would be added to this one's
+    shutil.rmtree(environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    makedirs(environ["PROMETHEUS_MULTIPROC_DIR"])
+    if migrate_on_start:
+        # Once, in the master, instead of in every worker. The app is not imported here, so the workers do not
+        # inherit its engines and connections.
+        from flightapi.migrate import upgrade
+
+        upgrade()
+
+
+def child_exit(server, worker):
+    # Drop the live gauges of the dead worker, its counters and histograms are kept
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,376 @@
+import asyncio
+import bisect
+import datetime
+import heapq
+import itertools
+import os
+import time
+from collections.abc import Mapping
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
+
+from . import table_events
+from .database import async_engine
+from .export import stream_partitions
+from .log_config import get_logger
+from .metrics import track_queries
+from .models import Flights
+
+LOGGER = get_logger(__name__)
+
+# Every worker keeps its own index, applying the flight changes published by the table_events listener. While
+# the listener is down the index is reloaded in full after this many seconds instead, departed flights are
+# pruned at the same interval
+FLIGHT_INDEX_MAX_AGE = float(os.getenv('FLIGHTAPI_FLIGHT_INDEX_MAX_AGE', '60'))
+# Seconds to wait before retrying a failed load of the index
+FLIGHT_INDEX_RETRY_DELAY = 5
+# Upper bounds on the partial itineraries a single search may expand and may put on its heap, keep
+# pathological searches bounded in time and memory
+MAX_EXPANSIONS = int(os.getenv('FLIGHTAPI_ITINERARY_MAX_EXPANSIONS', '200000'))
+MAX_PARTIALS = int(os.getenv('FLIGHTAPI_ITINERARY_MAX_PARTIALS', '200000'))
+# Number of changed flights refetched per statement
+CHANGES_BATCH_SIZE = 1000
+
+LEG_COLUMNS = (Flights.id, Flights.flight_number, Flights.departure_airport_id, Flights.arrival_airport_id,
+               Flights.departure_date, Flights.duration, Flights.fare)
+
+
+class Leg(NamedTuple):
+    """
+    A flight as seen by the itinerary search.
+
+    Attributes:
+        id (int): The ID of the flight.
+        flight_number (str): The flight number of the flight.
+        departure_airport_id (int): The ID of the departure airport.
+        arrival_airport_id (int): The ID of the arrival airport.
+        departure (datetime.datetime): The departure time.
+        arrival (datetime.datetime): The arrival time, departure plus duration.
+        fare (float): The fare of the flight.
+    """
+    id: int
+    flight_number: Optional[str]
+    departure_airport_id: int
+    arrival_airport_id: int
+    departure: datetime.datetime
+    arrival: datetime.datetime
+    fare: float
+
+
+def _as_datetime(value) -> Optional[datetime.datetime]:
+    # Everything in the index is timezone aware. The API normalizes its inputs to UTC (schemas.flights.as_utc),
+    # naive values are taken as UTC the same way
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=datetime.timezone.utc)
+
+
+def leg_from_row(row) -> Optional[Leg]:
+    """
+    Build a Leg from a Flights ORM object or a row mapping.
+
+    Args:
+        row: The flight.
+
+    Returns:
+        Optional[Leg]: The leg, or None if the flight can not be scheduled (missing airports, date or duration).
+    """
+    get = row.get if isinstance(row, Mapping) else lambda key: getattr(row, key)
+    departure = _as_datetime(get("departure_date"))
+    if None in (departure, get("duration"), get("departure_airport_id"), get("arrival_airport_id")):
+        return None
+    return Leg(
+        id=get("id"),
+        flight_number=get("flight_number"),
+        departure_airport_id=get("departure_airport_id"),
+        arrival_airport_id=get("arrival_airport_id"),
+        departure=departure,
+        arrival=departure + datetime.timedelta(minutes=get("duration")),
+        fare=float(get("fare") or 0),
+    )
+
+
+def _upcoming_since() -> datetime.datetime:
+    # Flights that left more than a day ago are dropped from the index, searches start from now
+    return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
+
+
+def _legs_from_partition(keys: list, partition: list) -> list[Leg]:
+    return [leg for leg in (leg_from_row(dict(zip(keys, row))) for row in partition) if leg is not None]
+
+
+def _build_departures(legs: list[Leg]) -> dict[int, tuple[list[datetime.datetime], list[Leg]]]:
+    legs.sort(key=lambda leg: leg.departure)
+    departures = {}
+    for leg in legs:
+        times, airport_legs = departures.setdefault(leg.departure_airport_id, ([], []))
+        times.append(leg.departure)
+        airport_legs.append(leg)
+    return departures
+
+
+class FlightIndex:
+    """
+    In memory adjacency index of upcoming flights, keyed by departure airport.
+
+    The legs leaving each airport are kept sorted by departure time, so the connections that fit a layover
+    window are found with a binary search.
+
+    The index is maintained by a background task started with start(): it loads every upcoming flight, then
+    refetches the flights named by the table_events notifications. A full reload, needed when notifications
+    may have been missed, builds a new index while the old one keeps serving searches and swaps it in when
+    done. Requests never load anything.
+
+    The departures of an airport are replaced rather than modified in place, so a search running in a thread
+    sees a consistent snapshot while the event loop applies changes.
+    """
+
+    def __init__(self):
+        self._legs: dict[int, Leg] = {}
+        self._departures: dict[int, tuple[list[datetime.datetime], list[Leg]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._reload = True
+        self._changed_ids: set[int] = set()
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def __len__(self) -> int:
+        return len(self._legs)
+
+    def start(self):
+        """Subscribe to the flight changes and start the task that loads and maintains the index."""
+        table_events.subscribe(Flights.__tablename__, self._on_flights_changed)
+        self._changed.set()
+        self._task = asyncio.get_running_loop().create_task(self._maintain())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _on_flights_changed(self, ids: Optional[list[int]]):
+        if ids is None:
+            self._reload = True
+        else:
+            self._changed_ids.update(ids)
+        self._changed.set()
+
+    async def _maintain(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=FLIGHT_INDEX_MAX_AGE)
+            except asyncio.TimeoutError:
+                self.prune()
+                if not table_events.listening():
+                    self._reload = True
+            self._changed.clear()
+            try:
+                if self._reload:
+                    await self.load()
+                elif self._changed_ids:
+                    await self.apply_changes()
+            except Exception:
+                LOGGER.exception("Could not update the flight index, retrying")
+                await asyncio.sleep(FLIGHT_INDEX_RETRY_DELAY)
+                self._changed.set()
+
+    @track_queries
+    async def load(self):
+        """
+        Build a new index from every upcoming flight and swap it in.
+
+        The rows are streamed and turned into legs in a thread, partition by partition, the current index is
+        served until the new one is complete.
+        """
+        # The new snapshot includes every change notified so far, those notified while it is read are kept
+        self._reload = False
+        self._changed_ids.clear()
+        legs = []
+        statement = select(*LEG_COLUMNS).where(Flights.departure_date >= _upcoming_since())
+        try:
+            async for keys, partition in stream_partitions(statement):
+                legs.extend(await asyncio.to_thread(_legs_from_partition, keys, partition))
+            departures = await asyncio.to_thread(_build_departures, legs)
+        except BaseException:
+            # Nothing was swapped in, the next update has to load again
+            self._reload = True
+            raise
+        self._legs, self._departures = {leg.id: leg for leg in legs}, departures
+        self._loaded_at = time.monotonic()
+        LOGGER.info(f"Flight index loaded with {len(legs)} flights")
+
+    @track_queries
+    async def apply_changes(self):
+        """Refetch the flights named by the notifications received since the last update."""
+        ids, self._changed_ids = sorted(self._changed_ids), set()
+        since = _upcoming_since()
+        start = 0
+        try:
+            async with async_engine.connect() as connection:
+                for start in range(0, len(ids), CHANGES_BATCH_SIZE):
+                    batch = ids[start:start + CHANGES_BATCH_SIZE]
+                    rows = {row["id"]: row for row in (await connection.execute(
+                        select(*LEG_COLUMNS).where(Flights.id.in_(batch)))).mappings()}
+                    self._apply_batch(batch, rows, since)
+        except BaseException:
+            # The flights of the failed batch and after it are refetched by the next update
+            self._changed_ids.update(ids[start:])
+            raise
+
+    def _apply_batch(self, batch: list[int], rows: dict, since: datetime.datetime):
+        for flight_id in batch:
+            row = rows.get(flight_id)
+            if row is None or row["departure_date"] is None or _as_datetime(row["departure_date"]) < since:
+                self.remove(flight_id)
+            else:
+                self.upsert(row)
+
+    def prune(self):
+        """Drop the flights that left more than a day ago."""
+        since = _upcoming_since()
+        for airport_id, (times, legs) in list(self._departures.items()):
+            end = bisect.bisect_left(times, since)
+            if end:
+                for leg in legs[:end]:
+                    self._legs.pop(leg.id, None)
+                self._departures[airport_id] = (times[end:], legs[end:])
+
+    def upsert(self, row):
+        """
+        Add or replace a single flight, a no-op until the index is loaded.
+
+        Args:
+            row: The Flights ORM object or row mapping that was written.
+        """
+        if not self.loaded:
+            return
+        flight_id = row["id"] if isinstance(row, Mapping) else row.id
+        self.remove(flight_id)
+        leg = leg_from_row(row)
+        if leg is None:
+            return
+        self._legs[leg.id] = leg
+        times, legs = self._departures.get(leg.departure_airport_id, ([], []))
+        position = bisect.bisect_right(times, leg.departure)
+        self._departures[leg.departure_airport_id] = (times[:position] + [leg.departure] + times[position:],
+                                                      legs[:position] + [leg] + legs[position:])
+
+    def remove(self, flight_id: int):
+        """
+        Remove a single flight, if it is in the index.
+
+        Args:
+            flight_id (int): The ID of the flight.
+        """
+        leg = self._legs.pop(flight_id, None)
+        if leg is None:
+            return
+        times, legs = self._departures[leg.departure_airport_id]
+        position = bisect.bisect_left(times, leg.departure)
+        while legs[position].id != flight_id:
+            position += 1
+        self._departures[leg.departure_airport_id] = (times[:position] + times[position + 1:],
+                                                      legs[:position] + legs[position + 1:])
+
+    @staticmethod
+    def _departing(departures: dict, airport_id: int, earliest: datetime.datetime,
+                   latest: datetime.datetime) -> list[Leg]:
+        times, legs = departures.get(airport_id, ((), ()))
+        return legs[bisect.bisect_left(times, earliest):bisect.bisect_right(times, latest)]
+
+    def search(self,
+               origin: int,
+               destination: int,
+               departure_date: Optional[datetime.date] = None,
+               sort: str = "fare",
+               max_legs: int = 3,
+               min_layover: int = 45,
+               max_layover: int = 720,
+               limit: int = 10,
+               earliest_departure: Optional[datetime.datetime] = None) -> list[tuple[Leg, ...]]:
+        """
+        Find the best itineraries between two airports.
+
+        Partial itineraries are expanded best first. Neither the total fare nor the total elapsed time can go
+        down when a leg is added, so complete itineraries come off the heap already ranked. The cost is carried
+        in the heap entries and extended leg by leg. Past MAX_PARTIALS partial itineraries nothing more is
+        pushed and the heap is only drained.
+
+        CPU bound, run it in a thread: it reads a snapshot of the index and never modifies it.
+
+        Args:
+            origin (int): The ID of the departure airport.
+            destination (int): The ID of the arrival airport.
+            departure_date (datetime.date, optional): Only start with flights leaving on this (UTC) day.
+            sort (str, optional): Rank by total "fare" or total elapsed "duration". Defaults to "fare".
+            max_legs (int, optional): The maximum number of flights per itinerary. Defaults to 3.
+            min_layover (int, optional): The minimum connection time in minutes. Defaults to 45.
+            max_layover (int, optional): The maximum connection time in minutes. Defaults to 720.
+            limit (int, optional): The maximum number of itineraries to return. Defaults to 10.
+            earliest_departure (datetime.datetime, optional): Only start with flights leaving at or after this
+                time. Defaults to None, now: the index keeps flights that left up to a day ago, they can not be
+                booked.
+
+        Returns:
+            list: The itineraries, each a tuple of legs, best first.
+        """
+        def extended_cost(cost: float, first: Leg, leg: Leg) -> float:
+            if sort == "fare":
+                return cost + leg.fare
+            return (leg.arrival - first.departure).total_seconds()
+
+        departures = self._departures
+        earliest = earliest_departure or datetime.datetime.now(datetime.timezone.utc)
+        times, first_legs = departures.get(origin, ((), ()))
+        if departure_date is not None:
+            day = datetime.datetime.combine(departure_date, datetime.time(), tzinfo=datetime.timezone.utc)
+            first_legs = self._departing(departures, origin, max(day, earliest),
+                                         day + datetime.timedelta(days=1) - datetime.timedelta.resolution)
+        else:
+            first_legs = first_legs[bisect.bisect_left(times, earliest):]
+
+        counter = itertools.count()
+        heap = [(extended_cost(0, leg, leg), next(counter), (leg,)) for leg in first_legs
+                if leg.arrival_airport_id != origin and (max_legs > 1 or leg.arrival_airport_id == destination)]
+        if len(heap) > MAX_PARTIALS:
+            heap = heapq.nsmallest(MAX_PARTIALS, heap)
+        heapq.heapify(heap)
+        partials = len(heap)
+        min_gap, max_gap = datetime.timedelta(minutes=min_layover), datetime.timedelta(minutes=max_layover)
+
+        itineraries, expansions = [], 0
+        while heap and len(itineraries) < limit and expansions < MAX_EXPANSIONS:
+            cost, _, legs = heapq.heappop(heap)
+            last = legs[-1]
+            if last.arrival_airport_id == destination:
+                itineraries.append(legs)
+                continue
+            if len(legs) >= max_legs or partials >= MAX_PARTIALS:
+                continue
+            expansions += 1
+            # The last leg of an itinerary has to reach the destination, nothing else is worth a push
+            final = len(legs) + 1 == max_legs
+            visited = {origin, *(leg.arrival_airport_id for leg in legs)}
+            for leg in self._departing(departures, last.arrival_airport_id, last.arrival + min_gap,
+                                       last.arrival + max_gap):
+                if leg.arrival_airport_id in visited or (final and leg.arrival_airport_id != destination):
+                    continue
+                heapq.heappush(heap, (extended_cost(cost, legs[0], leg), next(counter), legs + (leg,)))
+                partials += 1
+                if partials >= MAX_PARTIALS:
+                    break
+        return itineraries
+
+
+FLIGHT_INDEX = FlightIndex()
@@ -1,34 +1,48 @@
+import asyncio
+import datetime
 import os
 from contextlib import asynccontextmanager
 from logging import basicConfig, DEBUG, getLogger
 from sys import stdout
-from typing import Annotated, Optional
+from typing import Annotated, Literal, Optional
 
-from alembic import command
-from alembic.config import Config
-from fastapi import FastAPI, Query, Depends, HTTPException
+from fastapi import FastAPI, Query, Depends, HTTPException, Response
 from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
-from sqlalchemy.orm import Session
-
-from . import crud, config
-from .crud import check_flights_exists, check_airports_exists
-from .database import get_db
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import async_crud, config, export, manifest, metrics, migrate, route_fares, serialization, table_events
+from .airport_cache import AIRPORT_CACHE
+from .database import get_async_db, async_engine, pool_stats, AsyncSessionLocal
+from .itinerary import FLIGHT_INDEX
+from .filters import MIN_NAME_SEARCH_LENGTH
+from .pagination import InvalidCursorError
+from .query_monitor import QueryMonitorMiddleware
+from .response_cache import RESPONSE_CACHE, ResponseCacheMiddleware
+from .seats import SeatsUnavailableError
 from .schemas import flights, airports, passengers
+from .schemas.bulk import BulkCreateResult
+from .schemas.itineraries import Itinerary
+from .schemas.pagination import Page
+from .schemas.routes import RouteFare, RouteStats
 
 basicConfig(stream=stdout, level=DEBUG)
 logger = getLogger()
 
 
-def run_migrations():
-    alembic_cfg = Config("flightapi/alembic/alembic.ini")
-    command.upgrade(alembic_cfg, "head")
-
-
 @asynccontextmanager
 async def lifespan(app_: FastAPI):
-    logger.info("Running db migration")
-    run_migrations()
+    # Migrations run once per deployment, see migrate.py, a worker only makes sure it got the schema it expects
+    await migrate.check_schema(async_engine)
+    await table_events.start_listener()
+    async with AsyncSessionLocal() as db:
+        await AIRPORT_CACHE.ensure_fresh(db)
+    FLIGHT_INDEX.start()
     yield
+    await FLIGHT_INDEX.stop()
+    await table_events.stop_listener()
+    await async_engine.dispose()
     logger.info("Done")
 
 
@@ -38,6 +52,31 @@ app = FastAPI(
     version="1.0",
     lifespan=lifespan,
 )
+# Polled list endpoints, mapped to the tables their responses are built from
+app.add_middleware(ResponseCacheMiddleware, paths={
+    "/airports/list": ("airports",),
+    "/flights/list": ("flights", "airports"),
+    "/routes/cheapest": ("flights", "airports"),
+})
+# Statements a request may execute per endpoint, reloading a stale airport cache and looking up airports missing
+# from the cache included
+app.add_middleware(QueryMonitorMiddleware, budgets={
+    "/airports/list": 2,
+    "/airports/nearby": 2,
+    "/flights/list": 4,
+    "/passengers/list": 2,
+    "/itineraries/search": 0,
+    "/flights/{flight_id}/manifest": 2,
+    "/flights/manifests": 2,
+    "/routes/stats": 3,
+    "/routes/cheapest": 2,
+    "/flights/bulk_create": None,
+    "/passengers/bulk_create": None,
+    "/flights/export": None,
+    "/passengers/export": None,
+})
+# Added last so it is the outermost middleware and its latencies include the response cache
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 @app.get("/healthchecker")
@@ -45,6 +84,44 @@ def home():
     return {"message": "Flight API is up and running"}
 
 
+@app.get(
+    "/stats",
+    summary="Return runtime statistics of the worker serving the request",
+    tags=["Monitoring"],
+)
+def stats():
+    """
+    Get the connection pool and cache statistics of the worker process that handles this request.
+
+    Every gunicorn worker owns its own pools, so repeated calls may be answered by different workers.
+
+    Returns:
+        dict: The worker pid, the checkout wait time and saturation of its connection pools and the hit, miss
+            and reload counters of its airport cache and the counters of its response cache.
+    """
+    return {"pid": os.getpid(), "pools": pool_stats(), "airport_cache": AIRPORT_CACHE.stats(),
+            "response_cache": RESPONSE_CACHE.stats()}
+
+
+@app.get(
+    "/metrics",
+    summary="Return the metrics in the Prometheus text format",
+    tags=["Monitoring"],
+)
+def get_metrics():
+    """
+    Expose request counts and latency histograms per route, statement latencies per crud function and the
+    connection pool usage for Prometheus to scrape.
+
+    Under gunicorn the samples of all workers are aggregated, so the scrape does not depend on the worker that
+    answers it.
+
+    Returns:
+        Response: The metrics in the Prometheus text exposition format.
+    """
+    return Response(metrics.render(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
 @app.get("/docs", include_in_schema=False)
 def custom_swagger_ui_html():
     logger.info("Flight Tracker API '/docs' accessed.")
@@ -68,38 +145,79 @@ async def redoc_html():
 
 @app.get(
     "/airports/list",
-    response_model=list[airports.Airports],
+    response_model=Page[airports.Airports],
     summary="Return airport data",
     tags=["Airports"],
 )
-def get_airports(
+async def get_airports(
         airport_id: Annotated[Optional[list[int]], Query()] = None,
         city: Annotated[Optional[list[str]], Query()] = None,
         country: Annotated[Optional[list[str]], Query()] = None,
+        sort: Literal["id", "code"] = "id",
+        cursor: Optional[str] = None,
         limit: int = 100,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
 ):
     """
-        Get a list of airports based on the provided filters.
+        Get a page of airports based on the provided filters.
 
         Args:
             airport_id (Optional[List[int]]): A list of airport IDs to filter by.
             city (Optional[List[str]]): A list of cities to filter by.
             country (Optional[List[str]]): A list of countries to filter by.
+            sort (str, optional): The key to order the airports by. Defaults to "id".
+            cursor (Optional[str]): The next_cursor of the previous page.
             limit (int, optional): The maximum number of results to return. Defaults to 100.
-            db (Session): The database session to use.
+            db (AsyncSession): The async database session to use.
 
         Returns:
-            List[airports.Airports]: A list of airport objects that match the provided filters.
+            FastJSONResponse: A Page[airports.Airports] of the airports that match the provided filters.
+
+        Raises:
+            HTTPException: If the cursor is invalid.
         """
-    airport_result = crud.get_airports(
-        db,
-        airport_id=airport_id,
-        city=city,
-        country=country,
-        limit=limit
-    )
-    return airport_result
+    try:
+        airport_result, next_cursor = await async_crud.get_airports(
+            db,
+            airport_id=airport_id,
+            city=city,
+            country=country,
+            sort=sort,
+            cursor=cursor,
+            limit=limit
+        )
+    except InvalidCursorError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    return serialization.page_response(airports.Airports, airport_result, next_cursor)
+
+
+@app.get(
+    "/airports/nearby",
+    response_model=list[airports.NearbyAirport],
+    summary="Return the airports nearest to a point",
+    tags=["Airports"],
+)
+async def get_nearby_airports(
+        lat: Annotated[float, Query(ge=-90, le=90)],
+        lon: Annotated[float, Query(ge=-180, le=180)],
+        radius_km: Annotated[Optional[float], Query(gt=0)] = None,
+        k: Annotated[int, Query(ge=1, le=100)] = 10,
+        db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Get the airports nearest to a point, optionally within a radius.
+
+    Args:
+        lat (float): The latitude of the point in degrees.
+        lon (float): The longitude of the point in degrees.
+        radius_km (Optional[float]): Only return airports within this many kilometers.
+        k (int, optional): The maximum number of airports to return. Defaults to 10.
+        db (AsyncSession): The async database session to use.
+
+    Returns:
+        List[airports.NearbyAirport]: The airports with their distance, nearest first.
+    """
+    return await async_crud.get_nearby_airports(db, latitude=lat, longitude=lon, radius_km=radius_km, k=k)
 
 
 # We should only check to see if the departing airport exists in order to create a flight
@@ -109,13 +227,13 @@ def get_airports(
     summary="Create a new flight",
     tags=["Flights"],
 )
-def create_flights(flight: flights.FlightsCreate, db: Session = Depends(get_db)):
+async def create_flights(flight: flights.FlightsCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Create a new flight.
 
     Args:
         flight (FlightsCreate): The flight to create.
-        db (Session): The database session to use.
+        db (AsyncSession): The async database session to use.
 
     Returns:
         Flights: The created flight.
@@ -123,49 +241,225 @@ def create_flights(flight: flights.FlightsCreate, db: Session = Depends(get_db))
     Raises:
         HTTPException: If the departure airport does not exist.
     """
-    if not check_airports_exists(db, flight.departure_airport_id):
+    if not await async_crud.check_airports_exists(db, flight.departure_airport_id):
         raise HTTPException(status_code=400, detail="Departure airport does not exist")
-    return crud.create_flights(db, flight)
+    return await async_crud.create_flights(db, flight)
+
+
+@app.post(
+    "/flights/bulk_create",
+    response_model=BulkCreateResult[flights.Flights],
+    summary="Create many flights at once",
+    tags=["Flights"],
+)
+async def bulk_create_flights(flights_create: list[flights.FlightsCreate],
+                              db: AsyncSession = Depends(get_async_db)):
+    """
+    Create many flights in a single transaction.
+
+    Airports are validated for the whole batch in one query and the rows are inserted with multi row
+    INSERT ... RETURNING statements. Rows referencing unknown airports are skipped and reported in errors.
+
+    Args:
+        flights_create (List[FlightsCreate]): The flights to create.
+        db (AsyncSession): The async database session to use.
+
+    Returns:
+        BulkCreateResult[Flights]: The created flights and the per row errors.
+
+    Raises:
+        HTTPException: If the batch is larger than the configured maximum.
+    """
+    if len(flights_create) > async_crud.MAX_BULK_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {async_crud.MAX_BULK_SIZE} flights per request")
+    created, errors = await async_crud.bulk_create_flights(db, flights_create)
+    return {"created": created, "errors": errors}
 
 
 # Return all flights or a specific flight
 @app.get(
     "/flights/list",
-    response_model=list[flights.Flights],
+    response_model=Page[flights.FlightsWithAirports],
     summary="Return flight data",
     tags=["Flights"],
 )
-def get_flights(
+async def get_flights(
         departure_airport: Annotated[Optional[list[str]], Query()] = None,
         arrival_airport: Annotated[Optional[list[str]], Query()] = None,
-        departure_date: Annotated[Optional[list[str]], Query()] = None,
-        arrival_date: Annotated[Optional[list[str]], Query()] = None,
+        departure_date: Annotated[Optional[list[datetime.date]], Query()] = None,
+        arrival_date: Annotated[Optional[list[datetime.date]], Query()] = None,
+        departure_from: Optional[flights.UtcDatetime] = None,
+        departure_to: Optional[flights.UtcDatetime] = None,
+        sort: Literal["id", "departure_date", "fare"] = "id",
+        cursor: Optional[str] = None,
         limit: int = 100,
-        db: Session = Depends(get_db),
+        format: Literal["json", "arrow", "parquet"] = "json",
+        expand: Optional[Literal["airports"]] = None,
+        db: AsyncSession = Depends(get_async_db),
 ):
     """
-    Get a list of flights based on the provided filters.
+    Get a page of flights based on the provided filters.
+
+    With format "arrow" or "parquet" the page is an Arrow IPC stream or a Parquet file of the same columns, with
+    the cursor of the next page in the X-Next-Cursor header.
+
+    With expand "airports" every flight also has its departure_airport and arrival_airport objects, taken from the
+    airport cache, so the number of queries does not depend on the page size.
 
     Args:
-        departure_airport (Optional[List[str]]): A list of departure airports to filter by.
-        arrival_airport (Optional[List[str]]): A list of arrival airports to filter by.
-        departure_date (Optional[List[str]]): A list of departure dates to filter by.
-        arrival_date (Optional[List[str]]): A list of arrival dates to filter by.
+        departure_airport (Optional[List[str]]): A list of departure airport IATA codes to filter by.
+        arrival_airport (Optional[List[str]]): A list of arrival airport IATA codes to filter by.
+        departure_date (Optional[List[date]]): A list of departure days to filter by.
+        arrival_date (Optional[List[date]]): A list of arrival days to filter by.
+        departure_from (Optional[datetime]): The earliest departure time to filter by, UTC without an offset.
+        departure_to (Optional[datetime]): The latest departure time to filter by, UTC without an offset.
+        sort (str, optional): The key to order the flights by. Defaults to "id".
+        cursor (Optional[str]): The next_cursor of the previous page.
         limit (int, optional): The maximum number of results to return. Defaults to 100.
-        db (Session): The database session to use.
+        format (str, optional): The output format, "json", "arrow" or "parquet". Defaults to "json".
+        expand (str, optional): "airports" to embed the airports of the flights, JSON only. Defaults to None.
+        db (AsyncSession): The async database session to use.
 
     Returns:
-        List[flights.Flights]: A list of flight objects that match the provided filters.
+        FastJSONResponse: A Page[flights.FlightsWithAirports] of the flights that match the provided filters.
+
+    Raises:
+        HTTPException: If the cursor is invalid, airports are expanded in a columnar format, or a columnar format
+            is requested without pyarrow installed.
     """
-    flight_results = crud.get_flights(
-        db,
+    if expand is not None and format != "json":
+        raise HTTPException(status_code=400, detail="expand is only supported with format=json")
+    try:
+        flight_results, next_cursor = await async_crud.get_flights(
+            db,
+            departure_airport=departure_airport,
+            arrival_airport=arrival_airport,
+            departure_date=departure_date,
+            arrival_date=arrival_date,
+            departure_from=departure_from,
+            departure_to=departure_to,
+            sort=sort,
+            cursor=cursor,
+            limit=limit,
+            tuples=format != "json",
+        )
+    except InvalidCursorError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if expand == "airports":
+        flight_results = await async_crud.expand_airports(db, flight_results)
+        return serialization.page_response(flights.FlightsWithAirports, flight_results, next_cursor)
+    if format == "json":
+        return serialization.page_response(flights.Flights, flight_results, next_cursor)
+    try:
+        return export.table_response(async_crud.FLIGHTS_LIST_COLUMNS, flight_results, format, next_cursor)
+    except export.FormatUnavailableError as error:
+        raise HTTPException(status_code=501, detail=str(error))
+
+
+@app.get(
+    "/flights/export",
+    summary="Export flight data as NDJSON, CSV, Arrow or Parquet",
+    tags=["Flights"],
+)
+async def export_flights(
+        format: Literal["ndjson", "csv", "arrow", "parquet"] = "ndjson",
+        departure_airport: Annotated[Optional[list[str]], Query()] = None,
+        arrival_airport: Annotated[Optional[list[str]], Query()] = None,
+        departure_date: Annotated[Optional[list[datetime.date]], Query()] = None,
+        arrival_date: Annotated[Optional[list[datetime.date]], Query()] = None,
+        departure_from: Optional[flights.UtcDatetime] = None,
+        departure_to: Optional[flights.UtcDatetime] = None,
+):
+    """
+    Stream every flight matching the provided filters.
+
+    Rows are read through a server side cursor and written in chunks, so memory use does not grow with
+    the size of the export.
+
+    Args:
+        format (str, optional): The output format, "ndjson", "csv", "arrow" (an Arrow IPC stream) or "parquet".
+            Defaults to "ndjson".
+        departure_airport (Optional[List[str]]): A list of departure airport IATA codes to filter by.
+        arrival_airport (Optional[List[str]]): A list of arrival airport IATA codes to filter by.
+        departure_date (Optional[List[date]]): A list of departure days to filter by.
+        arrival_date (Optional[List[date]]): A list of arrival days to filter by.
+        departure_from (Optional[datetime]): The earliest departure time to filter by, UTC without an offset.
+        departure_to (Optional[datetime]): The latest departure time to filter by, UTC without an offset.
+
+    Returns:
+        StreamingResponse: The exported flights.
+
+    Raises:
+        HTTPException: If a columnar format is requested without pyarrow installed.
+    """
+    statement = async_crud.export_flights_statement(
         departure_airport=departure_airport,
         arrival_airport=arrival_airport,
         departure_date=departure_date,
         arrival_date=arrival_date,
-        limit=limit
+        departure_from=departure_from,
+        departure_to=departure_to,
     )
-    return flight_results
+    try:
+        return export.export_response(statement, format, "flights")
+    except export.FormatUnavailableError as error:
+        raise HTTPException(status_code=501, detail=str(error))
+
+
+@app.get(
+    "/flights/{flight_id}/manifest",
+    response_model=flights.FlightManifest,
+    summary="Return a flight and its passengers",
+    tags=["Flights"],
+)
+async def get_flight_manifest(flight_id: int):
+    """
+    Get the manifest of a flight, its passengers streamed in one query over the passengers.flight_id index.
+
+    The flight and its passengers are read in one snapshot on a connection owned by the stream, no request
+    session is held while the response is written.
+
+    Args:
+        flight_id (int): The id of the flight.
+
+    Returns:
+        StreamingResponse: The flights.FlightManifest of the flight.
+
+    Raises:
+        HTTPException: If the flight does not exist.
+    """
+    chunks = await manifest.flight_manifest(flight_id)
+    if chunks is None:
+        raise HTTPException(status_code=404, detail=f"Flight with id {flight_id} does not exist")
+    return StreamingResponse(chunks, media_type="application/json")
+
+
+@app.get(
+    "/flights/manifests",
+    summary="Stream the manifests of many flights as NDJSON",
+    tags=["Flights"],
+)
+async def get_flight_manifests(flight_id: Annotated[Optional[list[int]], Query()] = None):
+    """
+    Stream the manifests of many flights, one flights.FlightManifest per line in flight id order.
+
+    The flights and the passengers of all of them, read in a single IN query, come from one snapshot on a
+    connection owned by the stream. Unknown flight ids are left out.
+
+    Args:
+        flight_id (List[int]): The ids of the flights, at most MAX_MANIFEST_FLIGHTS.
+
+    Returns:
+        StreamingResponse: The manifests as NDJSON.
+
+    Raises:
+        HTTPException: If no flight or more than MAX_MANIFEST_FLIGHTS flights are requested.
+    """
+    flight_ids = sorted(set(flight_id or []))
+    if not 0 < len(flight_ids) <= manifest.MAX_MANIFEST_FLIGHTS:
+        raise HTTPException(status_code=400,
+                            detail=f"Request between 1 and {manifest.MAX_MANIFEST_FLIGHTS} flights by flight_id")
+    return StreamingResponse(manifest.manifests_ndjson(flight_ids), media_type=export.MEDIA_TYPES["ndjson"])
 
 
 @app.put(
@@ -174,14 +468,14 @@ def get_flights(
     summary="Update a flight",
     tags=["Flights"],
 )
-def update_flight(flight_id: int, flight: flights.FlightsUpdate, db: Session = Depends(get_db)):
+async def update_flight(flight_id: int, flight: flights.FlightsUpdate, db: AsyncSession = Depends(get_async_db)):
     """
     Update an existing flight.
 
     Args:
         flight_id (int): The ID of the flight to update.
         flight (FlightsUpdate): The updated flight information.
-        db (Session): The database session to use.
+        db (AsyncSession): The async database session to use.
 
     Returns:
         Flights: The updated flight information.
@@ -189,13 +483,12 @@ def update_flight(flight_id: int, flight: flights.FlightsUpdate, db: Session = D
     Raises:
         HTTPException: If the flight does not exist.
     """
-    existing_flight = crud.get_flights(db, flight_id)
-    if not existing_flight:
+    if not await async_crud.check_flights_exists(db, flight_id):
         raise HTTPException(
             status_code=400,
             detail=f"Flight ={flight_id} does not exist",
         )
-    updated_flight = crud.update_flights(db, flight_id, flight)
+    updated_flight = await async_crud.update_flights(db, flight_id, flight)
     return updated_flight
 
 
@@ -204,11 +497,167 @@ def update_flight(flight_id: int, flight: flights.FlightsUpdate, db: Session = D
     summary="Delete a flight",
     tags=["Flights"],
 )
-def delete_flight(flight_id: int, db: Session = Depends(get_db)):
-    crud.delete_flights(db, flight_id)
+async def delete_flight(flight_id: int, db: AsyncSession = Depends(get_async_db)):
+    if not await async_crud.check_flights_exists(db, flight_id):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Flight ={flight_id} does not exist",
+        )
+    await async_crud.delete_flights(db, flight_id)
     return None
 
 
+@app.get(
+    "/itineraries/search",
+    response_model=list[Itinerary],
+    summary="Search connecting flights between two airports",
+    tags=["Itineraries"],
+)
+async def search_itineraries(
+        origin: int,
+        destination: int,
+        departure_date: Optional[datetime.date] = None,
+        sort: Literal["fare", "duration"] = "fare",
+        max_legs: Annotated[int, Query(ge=1, le=4)] = 3,
+        min_layover: Annotated[int, Query(ge=0, le=1440)] = 45,
+        max_layover: Annotated[int, Query(ge=0, le=1440)] = 720,
+        limit: Annotated[int, Query(ge=1, le=100)] = 10,
+):
+    """
+    Find direct and connecting itineraries between two airports.
+
+    The search runs in a thread on the in memory flight index of the worker, no SQL is issued. Until the
+    index finished loading, after startup, the endpoint answers 503.
+
+    Args:
+        origin (int): The ID of the departure airport.
+        destination (int): The ID of the arrival airport.
+        departure_date (Optional[date]): Only start with flights leaving on this day.
+        sort (str, optional): Rank by total "fare" or total "duration". Defaults to "fare".
+        max_legs (int, optional): The maximum number of flights per itinerary. Defaults to 3.
+        min_layover (int, optional): The minimum connection time in minutes. Defaults to 45.
+        max_layover (int, optional): The maximum connection time in minutes. Defaults to 720.
+        limit (int, optional): The maximum number of itineraries to return. Defaults to 10.
+
+    Returns:
+        List[Itinerary]: The itineraries, best first.
+    """
+    if not FLIGHT_INDEX.loaded:
+        raise HTTPException(
+            status_code=503,
+            detail="The flight index is still loading, retry shortly",
+            headers={"Retry-After": "5"},
+        )
+    results = await asyncio.to_thread(
+        FLIGHT_INDEX.search,
+        origin,
+        destination,
+        departure_date=departure_date,
+        sort=sort,
+        max_legs=max_legs,
+        min_layover=min_layover,
+        max_layover=max_layover,
+        limit=limit,
+    )
+    return [
+        {
+            "legs": [leg._asdict() for leg in legs],
+            "total_fare": sum(leg.fare for leg in legs),
+            "total_duration": int((legs[-1].arrival - legs[0].departure).total_seconds() // 60),
+        }
+        for legs in results
+    ]
+
+
+@app.get(
+    "/routes/stats",
+    response_model=list[RouteStats],
+    summary="Return distance, fare per km and speed statistics per route",
+    tags=["Routes"],
+)
+async def get_route_stats(
+        departure_airport: Annotated[Optional[list[str]], Query()] = None,
+        arrival_airport: Annotated[Optional[list[str]], Query()] = None,
+        departure_from: Optional[flights.UtcDatetime] = None,
+        departure_to: Optional[flights.UtcDatetime] = None,
+        limit: Annotated[int, Query(ge=1, le=10000)] = 100,
+        db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Get per route statistics over the flights matching the provided filters, busiest routes first.
+
+    Distances are great circle distances between the airport coordinates, flights on routes without
+    coordinates are left out. At least one filter is required, and filters matching more flights than the
+    worker aggregates per request (FLIGHTAPI_ROUTE_STATS_MAX_FLIGHTS) are rejected with a 400.
+
+    Args:
+        departure_airport (Optional[List[str]]): A list of departure airport IATA codes to filter by.
+        arrival_airport (Optional[List[str]]): A list of arrival airport IATA codes to filter by.
+        departure_from (Optional[datetime]): The earliest departure time to filter by, UTC without an offset.
+        departure_to (Optional[datetime]): The latest departure time to filter by, UTC without an offset.
+        limit (int, optional): The maximum number of routes to return. Defaults to 100.
+        db (AsyncSession): The async database session to use.
+
+    Returns:
+        List[RouteStats]: The statistics of each route.
+    """
+    # Imported on first use, numpy is only needed here and would otherwise slow down every worker start
+    from . import route_stats
+
+    try:
+        return await route_stats.get_route_stats(
+            db,
+            departure_airport=departure_airport,
+            arrival_airport=arrival_airport,
+            departure_from=departure_from,
+            departure_to=departure_to,
+            limit=limit,
+        )
+    except route_stats.TooManyFlightsError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+
+@app.get(
+    "/routes/cheapest",
+    response_model=list[RouteFare],
+    summary="Return the cheapest fare per day between two airports",
+    tags=["Routes"],
+)
+async def get_cheapest_fares(
+        departure_airport: str,
+        arrival_airport: str,
+        departure_from: Optional[datetime.date] = None,
+        departure_to: Optional[datetime.date] = None,
+        limit: Annotated[int, Query(ge=1, le=366)] = 31,
+        db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Get the cheapest fare of every (UTC) day with flights from one airport to another, in day order.
+
+    The fares come from the route_fares summary, which is kept up to date as flights are written, rather than
+    being aggregated over the flights of the route on every request.
+
+    Args:
+        departure_airport (str): The IATA code of the departure airport.
+        arrival_airport (str): The IATA code of the arrival airport.
+        departure_from (Optional[date]): The first departure day to return.
+        departure_to (Optional[date]): The last departure day to return.
+        limit (int, optional): The maximum number of days to return. Defaults to 31.
+        db (AsyncSession): The async database session to use.
+
+    Returns:
+        List[RouteFare]: The cheapest fare of each day.
+    """
+    return await route_fares.get_cheapest_fares(
+        db,
+        departure_airport=departure_airport,
+        arrival_airport=arrival_airport,
+        departure_from=departure_from,
+        departure_to=departure_to,
+        limit=limit,
+    )
+
+
 # When we create a new passenger, we need to check if the flight exists
 @app.post(
     "/passengers/create",
@@ -216,67 +665,177 @@ def delete_flight(flight_id: int, db: Session = Depends(get_db)):
     summary="Create a new passenger",
     tags=["Passengers"],
 )
-def create_passengers(passenger: passengers.PassengersCreate, db: Session = Depends(get_db)
-                      ):
+async def create_passengers(passenger: passengers.PassengersCreate, db: AsyncSession = Depends(get_async_db)
+                            ):
     """
     Create a new passenger.
 
     Args:
         passenger (PassengersCreate): The passenger to create.
-        db (Session): The database session to use.
+        db (AsyncSession): The async database session to use.
 
     Returns:
         Passengers: The created passenger.
 
     Raises:
-        HTTPException: If the flight does not exist.
+        HTTPException: If the flight does not exist (400) or is sold out (409).
     """
-    if not check_flights_exists(db, passenger.flight_id):
+    try:
+        return await async_crud.create_passengers(db, passenger)
+    except SeatsUnavailableError as error:
+        raise HTTPException(status_code=409, detail=str(error))
+    except ValueError:
         raise HTTPException(
             status_code=400,
             detail=f"Flight ={passenger.flight_id} does not exist",
         )
-    return crud.create_passengers(db, passenger)
+
+
+@app.post(
+    "/passengers/bulk_create",
+    response_model=BulkCreateResult[passengers.Passengers],
+    summary="Create many passengers at once",
+    tags=["Passengers"],
+)
+async def bulk_create_passengers(passengers_create: list[passengers.PassengersCreate],
+                                 db: AsyncSession = Depends(get_async_db)):
+    """
+    Create many passengers in a single transaction.
+
+    Seats are booked per flight, all or nothing. Rows for unknown or sold out flights are skipped and reported
+    in errors.
+
+    Args:
+        passengers_create (List[PassengersCreate]): The passengers to create.
+        db (AsyncSession): The async database session to use.
+
+    Returns:
+        BulkCreateResult[Passengers]: The created passengers and the per row errors.
+
+    Raises:
+        HTTPException: If the batch is larger than the configured maximum.
+    """
+    if len(passengers_create) > async_crud.MAX_BULK_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {async_crud.MAX_BULK_SIZE} passengers per request")
+    created, errors = await async_crud.bulk_create_passengers(db, passengers_create)
+    return {"created": created, "errors": errors}
 
 
 # We can return all passengers or a specific passenger by id
 @app.get(
     "/passengers/list",
-    response_model=list[passengers.Passengers],
+    response_model=Page[passengers.Passengers],
     summary="Return passenger data",
     tags=["Passengers"],
 )
-def get_passengers(
+async def get_passengers(
         passenger_id: Annotated[Optional[list[int]], Query()] = None,
         first_name: Annotated[Optional[list[str]], Query()] = None,
         last_name: Annotated[Optional[list[str]], Query()] = None,
         passport_number: Annotated[Optional[list[str]], Query()] = None,
+        name_match: Literal["exact", "prefix", "fuzzy"] = "exact",
+        sort: Literal["id", "last_name"] = "id",
+        cursor: Optional[str] = None,
         limit: int = 100,
-        db: Session = Depends(get_db),
+        format: Literal["json", "arrow", "parquet"] = "json",
+        db: AsyncSession = Depends(get_async_db),
 ):
     """
-        Get a list of passengers based on the provided filters.
+        Get a page of passengers based on the provided filters.
+
+        name_match "prefix" finds the names starting with first_name / last_name, case insensitively. "fuzzy"
+        tolerates typos and returns the closest matches only, best first, without a next page. Both need at
+        least MIN_NAME_SEARCH_LENGTH characters per name.
+
+        With format "arrow" or "parquet" the page is an Arrow IPC stream or a Parquet file of the same columns,
+        with the cursor of the next page in the X-Next-Cursor header.
 
         Args:
             passenger_id (Optional[List[int]]): A list of passenger IDs to filter by.
             first_name (Optional[List[str]]): A list of first names to filter by.
             last_name (Optional[List[str]]): A list of last names to filter by.
             passport_number (Optional[List[str]]): A list of passport numbers to filter by.
+            name_match (str, optional): How first_name and last_name are matched, "exact", "prefix" or "fuzzy".
+                Defaults to "exact".
+            sort (str, optional): The key to order the passengers by, unused by fuzzy searches. Defaults to "id".
+            cursor (Optional[str]): The next_cursor of the previous page.
             limit (int, optional): The maximum number of results to return. Defaults to 100.
-            db (Session): The database session to use.
+            format (str, optional): The output format, "json", "arrow" or "parquet". Defaults to "json".
+            db (AsyncSession): The async database session to use.
 
         Returns:
-            List[passengers.Passengers]: A list of passenger objects that match the provided filters.
+            FastJSONResponse: A Page[passengers.Passengers] of the passengers that match the provided filters.
+
+        Raises:
+            HTTPException: If the cursor is invalid, a searched name is too short, or a columnar format is
+                requested without pyarrow installed.
         """
-    passenger_result = crud.get_passengers(
-        db,
+    if name_match != "exact" and any(len(name.strip()) < MIN_NAME_SEARCH_LENGTH
+                                     for name in (first_name or []) + (last_name or [])):
+        raise HTTPException(status_code=400, detail=f"Prefix and fuzzy name searches need at least "
+                                                    f"{MIN_NAME_SEARCH_LENGTH} characters per name")
+    try:
+        passenger_result, next_cursor = await async_crud.get_passengers(
+            db,
+            passenger_id=passenger_id,
+            first_name=first_name,
+            last_name=last_name,
+            passport_number=passport_number,
+            name_match=name_match,
+            sort=sort,
+            cursor=cursor,
+            limit=limit,
+            tuples=format != "json",
+        )
+    except InvalidCursorError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if format == "json":
+        return serialization.page_response(passengers.Passengers, passenger_result, next_cursor)
+    try:
+        return export.table_response(async_crud.PASSENGERS_LIST_COLUMNS, passenger_result, format, next_cursor)
+    except export.FormatUnavailableError as error:
+        raise HTTPException(status_code=501, detail=str(error))
+
+
+@app.get(
+    "/passengers/export",
+    summary="Export passenger data as NDJSON, CSV, Arrow or Parquet",
+    tags=["Passengers"],
+)
+async def export_passengers(
+        format: Literal["ndjson", "csv", "arrow", "parquet"] = "ndjson",
+        passenger_id: Annotated[Optional[list[int]], Query()] = None,
+        first_name: Annotated[Optional[list[str]], Query()] = None,
+        last_name: Annotated[Optional[list[str]], Query()] = None,
+        passport_number: Annotated[Optional[list[str]], Query()] = None,
+):
+    """
+    Stream every passenger matching the provided filters.
+
+    Args:
+        format (str, optional): The output format, "ndjson", "csv", "arrow" (an Arrow IPC stream) or "parquet".
+            Defaults to "ndjson".
+        passenger_id (Optional[List[int]]): A list of passenger IDs to filter by.
+        first_name (Optional[List[str]]): A list of first names to filter by.
+        last_name (Optional[List[str]]): A list of last names to filter by.
+        passport_number (Optional[List[str]]): A list of passport numbers to filter by.
+
+    Returns:
+        StreamingResponse: The exported passengers.
+
+    Raises:
+        HTTPException: If a columnar format is requested without pyarrow installed.
+    """
+    statement = async_crud.export_passengers_statement(
         passenger_id=passenger_id,
         first_name=first_name,
         last_name=last_name,
         passport_number=passport_number,
-        limit=limit
     )
-    return passenger_result
+    try:
+        return export.export_response(statement, format, "passengers")
+    except export.FormatUnavailableError as error:
+        raise HTTPException(status_code=501, detail=str(error))
 
 
 # Update a passenger by id
@@ -286,30 +845,34 @@ def get_passengers(
     summary="Update a passenger",
     tags=["Passengers"],
 )
-def update_passenger(passenger_id: int, passenger_update: passengers.PassengersUpdate, db: Session = Depends(get_db)):
+async def update_passenger(passenger_id: int, passenger_update: passengers.PassengersUpdate,
+                           db: AsyncSession = Depends(get_async_db)):
     """
-    Update a passenger.
+    Update a passenger, moving their seat when the flight changes.
 
     Args:
         passenger_id (int): The ID of the passenger to update.
         passenger_update (PassengersUpdate): The updated passenger information.
-        db (Session): The database session to use.
+        db (AsyncSession): The async database session to use.
 
     Returns:
         Passengers: The updated passenger information.
 
     Raises:
-        HTTPException: If the passenger does not exist.
+        HTTPException: If the passenger or the new flight does not exist (400) or the new flight is sold out (409).
     """
     # Check if the passenger exists
-    existing_passenger = crud.get_passengers(db, passenger_id=passenger_id)
-    if not existing_passenger:
+    if not await async_crud.check_passengers_exists(db, passenger_id):
         raise HTTPException(
             status_code=400,
             detail=f"Passenger ={passenger_id} does not exist",
         )
-    updated_passenger = crud.update_passengers(db, passenger_id, passenger_update)
-    return updated_passenger
+    try:
+        return await async_crud.update_passengers(db, passenger_id, passenger_update)
+    except SeatsUnavailableError as error:
+        raise HTTPException(status_code=409, detail=str(error))
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
 
 
 # Delete a passenger by id
@@ -319,7 +882,13 @@ def update_passenger(passenger_id: int, passenger_update: passengers.PassengersU
     summary="Delete a passenger",
     tags=["Passengers"],
 )
-def delete_passenger(passenger_id: int, db: Session = Depends(get_db)):
-    # Check if the passenger exists
-    crud.delete_passengers(db, passenger_id)
-    return None
\ No newline at end of file
+async def delete_passenger(passenger_id: int, db: AsyncSession = Depends(get_async_db)):
+    # The seat of the passenger is released in the same transaction
+    try:
+        await async_crud.delete_passengers(db, passenger_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Passenger ={passenger_id} does not exist",
+        )
+    return None
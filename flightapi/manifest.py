@@ -0,0 +1,165 @@
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .async_crud import FLIGHTS_LIST_COLUMNS, PASSENGERS_LIST_COLUMNS
+from .database import async_engine
+from .export import stream_partitions
+from .metrics import track_queries
+from .models import Flights, Passengers
+from .serialization import dumps
+
+# Upper bound on the number of flights in a single batched manifest request
+MAX_MANIFEST_FLIGHTS = int(os.getenv('FLIGHTAPI_MAX_MANIFEST_FLIGHTS', '500'))
+
+
+@asynccontextmanager
+async def snapshot() -> AsyncIterator[AsyncConnection]:
+    """
+    Open a read only REPEATABLE READ transaction on a connection of its own.
+
+    Manifests are streamed from it rather than from the request session, which would sit idle in transaction
+    for as long as the response is being written. The flights and their passengers are read in the same
+    snapshot, so a manifest never lists passengers moved to or from the flight after it was read.
+
+    Yields:
+        AsyncConnection: The connection, in the transaction.
+    """
+    async with async_engine.connect() as connection:
+        await connection.execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+        async with connection.begin():
+            yield connection
+
+
+@track_queries
+async def get_flights_by_id(connection: AsyncConnection, flight_ids: list[int]) -> list[dict]:
+    """
+    Get flights by id, in one IN query.
+
+    Args:
+        connection (AsyncConnection): The connection to read on.
+        flight_ids (list[int]): The flight ids, unknown ids are left out.
+
+    Returns:
+        list[dict]: The flights, ordered by id, with the fields of schemas.flights.Flights.
+    """
+    statement = select(*FLIGHTS_LIST_COLUMNS).where(Flights.id.in_(flight_ids)).order_by(Flights.id)
+    return list(map(dict, (await connection.execute(statement)).mappings()))
+
+
+def passengers_statement(flight_ids: list[int]):
+    # A single IN over the passengers.flight_id index for all the flights, rather than one query per flight
+    return (select(*PASSENGERS_LIST_COLUMNS)
+            .where(Passengers.flight_id.in_(flight_ids))
+            .order_by(Passengers.flight_id, Passengers.id))
+
+
+async def passengers_by_flight(connection: AsyncConnection,
+                               flight_ids: list[int]) -> AsyncIterator[tuple[int, list[dict]]]:
+    """
+    Read the passengers of many flights through a server side cursor, grouped by flight.
+
+    Args:
+        connection (AsyncConnection): The connection to read on.
+        flight_ids (list[int]): The flight ids.
+
+    Yields:
+        tuple: A flight id and its passengers, in flight id order. Flights without passengers are skipped.
+    """
+    flight_id: Optional[int] = None
+    passengers = []
+    async for keys, partition in stream_partitions(passengers_statement(flight_ids), connection=connection):
+        for row in partition:
+            passenger = dict(zip(keys, row))
+            if passenger["flight_id"] != flight_id:
+                if passengers:
+                    yield flight_id, passengers
+                flight_id, passengers = passenger["flight_id"], []
+            passengers.append(passenger)
+    if passengers:
+        yield flight_id, passengers
+
+
+async def manifest_chunks(flight_id: int) -> AsyncIterator[bytes]:
+    """
+    Stream the manifest of one flight as a single JSON document, shaped like schemas.flights.FlightManifest.
+
+    The flight and its passengers are read in one snapshot, the passengers one cursor partition at a time,
+    so a full large aircraft is never held in memory.
+
+    Args:
+        flight_id (int): The id of the flight.
+
+    Yields:
+        bytes: The pieces of the document, nothing if the flight does not exist.
+    """
+    async with snapshot() as connection:
+        flight = await get_flights_by_id(connection, [flight_id])
+        if not flight:
+            return
+        yield b'{"flight":' + dumps(flight[0]) + b',"passengers":['
+        separator = b""
+        async for keys, partition in stream_partitions(passengers_statement([flight_id]), connection=connection):
+            yield separator + b",".join(dumps(dict(zip(keys, row))) for row in partition)
+            separator = b","
+        yield b"]}"
+
+
+async def flight_manifest(flight_id: int) -> Optional[AsyncIterator[bytes]]:
+    """
+    Start streaming the manifest of one flight, up to its first piece.
+
+    The flight is looked up before the response starts, so a missing flight can still be answered with a 404.
+
+    Args:
+        flight_id (int): The id of the flight.
+
+    Returns:
+        Optional[AsyncIterator[bytes]]: The pieces of the manifest_chunks document, None if the flight does not
+            exist.
+    """
+    chunks = manifest_chunks(flight_id)
+    first = await anext(chunks, None)
+    if first is None:
+        return None
+
+    async def resumed() -> AsyncIterator[bytes]:
+        yield first
+        async for chunk in chunks:
+            yield chunk
+    return resumed()
+
+
+async def manifests_ndjson(flight_ids: list[int]) -> AsyncIterator[bytes]:
+    """
+    Stream the manifests of many flights, one NDJSON line per flight.
+
+    The flights and their passengers are read in one snapshot, the passengers of all the flights in a single
+    IN query.
+
+    Args:
+        flight_ids (list[int]): The flight ids, unknown ids are left out.
+
+    Yields:
+        bytes: One line per flight, shaped like schemas.flights.FlightManifest, in flight id order.
+    """
+    def line(flight: dict, passengers: list[dict]) -> bytes:
+        return dumps({"flight": flight, "passengers": passengers}) + b"\n"
+
+    async with snapshot() as connection:
+        flights = await get_flights_by_id(connection, flight_ids)
+        if not flights:
+            return
+        # Both the flights and the passenger groups are in flight id order, so they are merged in one pass
+        pending = iter(flights)
+        async for flight_id, passengers in passengers_by_flight(connection, [flight["id"] for flight in flights]):
+            for flight in pending:
+                if flight["id"] == flight_id:
+                    yield line(flight, passengers)
+                    break
+                yield line(flight, [])
+        for flight in pending:
+            yield line(flight, [])
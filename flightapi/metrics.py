@@ -0,0 +1,181 @@
+import contextvars
+import functools
+import inspect
+import os
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+from sqlalchemy import event
+from starlette.routing import Match
+
+from .database import engine, async_engine, _TimedCheckoutMixin
+
+# Under gunicorn every worker writes its samples to files in this directory and /metrics aggregates them all,
+# whichever worker serves the scrape. It has to be set before prometheus_client is imported, see
+# gunicorn_config.py. Without it, e.g. under a single uvicorn process, the metrics are those of this process.
+MULTIPROCESS_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROCESS_DIR:
+    os.makedirs(MULTIPROCESS_DIR, exist_ok=True)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HTTP_REQUESTS = Counter("flightapi_http_requests_total", "HTTP requests handled",
+                        ["method", "route", "status"])
+HTTP_IN_PROGRESS = Gauge("flightapi_http_requests_in_progress", "HTTP requests being handled",
+                         ["method", "route"], multiprocess_mode="livesum")
+HTTP_DURATION = Histogram("flightapi_http_request_duration_seconds", "HTTP request latency, until the last byte",
+                          ["method", "route"], buckets=LATENCY_BUCKETS)
+DB_QUERY_DURATION = Histogram("flightapi_db_query_duration_seconds", "Database statement latency per crud function",
+                              ["function"], buckets=QUERY_BUCKETS)
+POOL_CHECKED_OUT = Gauge("flightapi_db_pool_checked_out", "Connections checked out of the pool",
+                         ["engine"], multiprocess_mode="livesum")
+POOL_CAPACITY = Gauge("flightapi_db_pool_capacity", "Pool size plus max overflow",
+                      ["engine"], multiprocess_mode="livesum")
+POOL_WAIT = Histogram("flightapi_db_pool_wait_seconds", "Time spent waiting for a pooled connection",
+                      ["engine"], buckets=QUERY_BUCKETS)
+POOL_TIMEOUTS = Counter("flightapi_db_pool_timeouts_total", "Checkouts that gave up after DATABASE_POOL_TIMEOUT",
+                        ["engine"])
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+_db_function = contextvars.ContextVar("flightapi_db_function", default="other")
+
+
+def current_db_function() -> str:
+    return _db_function.get()
+
+
+def track_queries(function):
+    """
+    Attribute the statements executed while a crud function runs to that function in the database metrics.
+
+    Args:
+        function: The crud function, sync or async.
+
+    Returns:
+        The wrapped function.
+    """
+    name = f"{function.__module__.rsplit('.', 1)[-1]}.{function.__name__}"
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            token = _db_function.set(name)
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                _db_function.reset(token)
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _db_function.set(name)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _db_function.reset(token)
+    return wrapper
+
+
+# SQLAlchemy runs the async engine's statements in a greenlet that shares the caller's context, so the
+# contextvar set by track_queries is visible here for both engines
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._flightapi_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERY_DURATION.labels(_db_function.get()).observe(time.perf_counter() - context._flightapi_started)
+
+
+def instrument_engine(name: str, sync_engine):
+    """
+    Export the statement latencies and the pool usage of an engine.
+
+    Args:
+        name (str): The engine label, "sync" or "async".
+        sync_engine: The engine, or the sync_engine of an async engine.
+    """
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+    pool = sync_engine.pool
+    checked_out = POOL_CHECKED_OUT.labels(name)
+    event.listen(pool, "checkout", lambda *_: checked_out.inc())
+    event.listen(pool, "checkin", lambda *_: checked_out.dec())
+    if isinstance(pool, _TimedCheckoutMixin):
+        POOL_CAPACITY.labels(name).set(pool.size() + max(pool._max_overflow, 0))
+        wait, timeouts = POOL_WAIT.labels(name), POOL_TIMEOUTS.labels(name)
+
+        def record(seconds: float, timed_out: bool):
+            wait.observe(seconds)
+            if timed_out:
+                timeouts.inc()
+        pool.stats.listeners.append(record)
+
+
+instrument_engine("sync", engine)
+instrument_engine("async", async_engine.sync_engine)
+
+
+def route_template(scope) -> str:
+    # The path template rather than the path, so /flights/update/1 and /flights/update/2 are one series. A
+    # partial match is a known path called with the wrong method, the 405 is still counted against that path.
+    partial = UNMATCHED_ROUTE
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial == UNMATCHED_ROUTE:
+            partial = route.path
+    return partial
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the count, the in flight number and the latency of requests per route.
+
+    Args:
+        app: The ASGI application.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method, route = scope["method"], route_template(scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = HTTP_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_DURATION.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            in_progress.dec()
+
+
+def render() -> bytes:
+    """
+    Render the metrics in the Prometheus text format.
+
+    Returns:
+        bytes: The metrics of all workers in multiprocess mode, of this process otherwise.
+    """
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,145 @@
+"""Database migrations, run once per deployment.
+
+``python -m flightapi.migrate`` upgrades the database to the latest revision, gunicorn does the same from its
+master process before it forks the workers (see gunicorn_config.py). Concurrent runs, e.g. several containers
+starting at once, are serialized with a Postgres advisory lock, whoever comes second finds the database
+migrated already. Workers only compare the revision of the database with the revision of the code, reading
+the alembic_version table directly, so alembic is not imported by the API unless the revisions differ.
+
+Usage:
+    python -m flightapi.migrate
+    python -m flightapi.migrate --check
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import re
+import sys
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .db_config import DATABASE_URL
+from .log_config import get_logger
+
+LOGGER = get_logger(__name__)
+
+ALEMBIC_CONFIG = "flightapi/alembic/alembic.ini"
+MIGRATION_VERSIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic", "migration", "versions")
+# Key of the advisory lock held while migrating, an arbitrary number no other code uses
+MIGRATION_LOCK_ID = 7294013385
+
+
+class SchemaOutOfDateError(RuntimeError):
+    """Raised when the database is behind the revision the code expects."""
+    pass
+
+
+def alembic_config():
+    from alembic.config import Config
+
+    return Config(ALEMBIC_CONFIG)
+
+
+@functools.lru_cache(maxsize=None)
+def code_revisions() -> tuple[frozenset, frozenset]:
+    """
+    Get the revisions of the migration scripts, without importing alembic.
+
+    The scripts are scanned for their revision and down_revision assignments, the heads are the revisions no
+    other script revises. Cached, gunicorn computes it in its master so the workers inherit it.
+
+    Returns:
+        tuple: The heads and all the known revisions.
+    """
+    revisions, revised = set(), set()
+    for name in os.listdir(MIGRATION_VERSIONS):
+        if not name.endswith(".py"):
+            continue
+        with open(os.path.join(MIGRATION_VERSIONS, name)) as script:
+            source = script.read()
+        revision = re.search(r"^revision(?:: str)? = ['\"](\w+)['\"]", source, re.MULTILINE)
+        if revision is None:
+            continue
+        revisions.add(revision.group(1))
+        down_revision = re.search(r"^down_revision[^=]*= (.*)$", source, re.MULTILINE)
+        if down_revision is not None:
+            revised.update(re.findall(r"['\"](\w+)['\"]", down_revision.group(1)))
+    return frozenset(revisions - revised), frozenset(revisions)
+
+
+def upgrade():
+    """
+    Upgrade the database to the latest revision, holding the migration advisory lock.
+
+    The lock is taken on its own connection, alembic migrates through another one, so a crashed migration
+    releases the lock together with its process.
+    """
+    from alembic import command
+
+    lock_engine = create_engine(DATABASE_URL, pool_size=1, max_overflow=0)
+    try:
+        with lock_engine.connect() as connection:
+            LOGGER.info("Waiting for the migration lock")
+            connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            try:
+                LOGGER.info("Running db migration")
+                command.upgrade(alembic_config(), "head")
+            finally:
+                connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+    finally:
+        lock_engine.dispose()
+    # Workers forked after this inherit the scanned revisions
+    code_revisions()
+
+
+async def check_schema(engine: AsyncEngine):
+    """
+    Check that the database has been migrated to the revision of the code, without migrating it.
+
+    A database ahead of the code, which happens while a newer version is being rolled out, is only logged.
+
+    Args:
+        engine (AsyncEngine): The engine to check the database of.
+
+    Raises:
+        SchemaOutOfDateError: If the database is behind the code, or was never migrated.
+    """
+    async with engine.connect() as connection:
+        migrated = (await connection.execute(text("SELECT to_regclass('alembic_version')"))).scalar()
+        database_heads = set((await connection.execute(
+            text("SELECT version_num FROM alembic_version")
+        )).scalars()) if migrated else set()
+    expected, known = code_revisions()
+    if database_heads == expected:
+        return
+    if database_heads and not database_heads & known:
+        LOGGER.warning(f"Database revision {sorted(database_heads)} is newer than the code's {sorted(expected)}")
+        return
+    raise SchemaOutOfDateError(
+        f"Database revision {sorted(database_heads) or 'none'} is behind the code's {sorted(expected)}, "
+        f"run python -m flightapi.migrate"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only check the revision, exit 1 when behind")
+    args = parser.parse_args()
+
+    if not args.check:
+        upgrade()
+        return
+    from .database import async_engine
+
+    try:
+        asyncio.run(check_schema(async_engine))
+    except SchemaOutOfDateError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
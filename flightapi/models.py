@@ -1,10 +1,24 @@
-from sqlalchemy import Column, Integer, String, JSON, Computed, Numeric, VARCHAR, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, JSON, Computed, Numeric, VARCHAR, ForeignKey, UniqueConstraint, Index, \
+    DateTime, Date, CheckConstraint, Float
 from sqlalchemy.orm import relationship, declarative_base
-from geoalchemy2 import Geometry
+from sqlalchemy.types import UserDefinedType
 
 Base = declarative_base()
 
 
+class GeographyPoint(UserDefinedType):
+    """
+    The PostGIS geography(POINT, 4326) type.
+
+    Declared here instead of using geoalchemy2's Geography, whose import is a sizeable part of a worker's start
+    up, for a column that is only ever computed and compared in SQL. Values are read as hex encoded EWKB.
+    """
+    cache_ok = True
+
+    def get_col_spec(self, **kw):
+        return "geography(POINT,4326)"
+
+
 class Airports(Base):
     """
     The Airports class represents airports in the system.
@@ -17,7 +31,7 @@ class Airports(Base):
         country (str): The country the airport is located in.
         latitude (float): The latitude of the airport.
         longitude (float): The longitude of the airport.
-        geom (shapely.geometry.Point): The location of the airport as a shapely point.
+        geom (str): The location of the airport as a geography point, computed from the coordinates.
         departing_flights (list): A list of flights that depart from this airport.
         arriving_flights (list): A list of flights that arrive at this airport.
     """
@@ -29,16 +43,26 @@ class Airports(Base):
     name = Column(VARCHAR(255))
     city = Column(VARCHAR(255))
     country = Column(VARCHAR(255))
-    # latitude = Column(Numeric, nullable=False, index=True)
-    # longitude = Column(Numeric, nullable=False, index=True)
-    # geom = Column(Geometry(geometry_type='POINT', srid=4326),
-    #               server_onupdate=Computed('ST_GeomFromEWKT(ST_MakePoint(longitude, latitude))'))
+    latitude = Column(Float)
+    longitude = Column(Float)
+    # Geography rather than geometry, so distances and radii are in meters on the spheroid. Left out of
+    # autogenerate, its migration is written by hand
+    geom = Column(GeographyPoint(),
+                  Computed('ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography', persisted=True),
+                  info={"skip_autogenerate": True})
 
     # departing_flights = relationship("Flights", backref="departing_airport",
     #                                  foreign_keys=[Column('departing_airport_id')])
     # arriving_flights = relationship("Flights", backref="arrival_airport",
     #                                 foreign_keys=[Column('arrival_airport_id')])
 
+    __table_args__ = (
+        # Backs KNN (<->) ordering and ST_DWithin radius searches
+        Index('ix_airports_geom', 'geom', postgresql_using='gist'),
+        CheckConstraint('latitude BETWEEN -90 AND 90', name='ck_airports_latitude_range'),
+        CheckConstraint('longitude BETWEEN -180 AND 180', name='ck_airports_longitude_range'),
+    )
+
 
 class Airlines(Base):
     """
@@ -63,11 +87,11 @@ class Flights(Base):
           id (int): The primary key of the flight.
           flight_status (str): The status of the flight.
           flight_number (str): The flight number of the flight.
-          available_seats (str): The available seats of the flight.
+          available_seats (int): The number of seats left to book, NULL when the inventory is not tracked.
           departure_airport_id (int): The ID of the departure airport.
           arrival_airport_id (int): The ID of the arrival airport.
-          departure_date (str): The departure date of the flight.
-          arrival_date (str): The arrival date of the flight.
+          departure_date (datetime): The departure time of the flight.
+          arrival_date (datetime): The arrival time of the flight.
           duration (int): The duration of the flight in minutes.
           fare (float): The fare of the flight.
 
@@ -80,11 +104,12 @@ class Flights(Base):
     id = Column(Integer, primary_key=True, index=True)
     flight_status = Column(String, index=True)
     flight_number = Column(String, index=True)
-    available_seats = Column(String, index=True)
+    # Not indexed, every booking updates it and an index would rule out HOT updates of the flight row
+    available_seats = Column(Integer)
     departure_airport_id = Column(Integer, ForeignKey('airports.id'), index=True)
     arrival_airport_id = Column(Integer, ForeignKey('airports.id'), index=True)
-    departure_date = Column(String, index=True)
-    arrival_date = Column(String, index=True)
+    departure_date = Column(DateTime(timezone=True), index=True)
+    arrival_date = Column(DateTime(timezone=True), index=True)
     duration = Column(Integer, index=True)
     fare = Column(Numeric, index=True)
 
@@ -95,6 +120,17 @@ class Flights(Base):
     #     UniqueConstraint('departure_airport_id', 'arrival_airport_id', name='unique_flight_airports'),
     # )
 
+    __table_args__ = (
+        # (sort key, id) indexes for keyset pagination
+        Index('ix_flights_departure_date_id', 'departure_date', 'id'),
+        Index('ix_flights_fare_id', 'fare', 'id'),
+        # Departures from an airport within a time window
+        Index('ix_flights_departure_airport_id_departure_date', 'departure_airport_id', 'departure_date'),
+        # Route searches, optionally within a time window
+        Index('ix_flights_route_departure_date', 'departure_airport_id', 'arrival_airport_id', 'departure_date'),
+        CheckConstraint('available_seats >= 0', name='ck_flights_available_seats_non_negative'),
+    )
+
 
 class Passengers(Base):
     """
@@ -105,7 +141,7 @@ class Passengers(Base):
         flight_id (int): The ID of the flight the passenger is on.
         first_name (str): The first name of the passenger.
         last_name (str): The last name of the passenger.
-        date_of_birth (str): The date of birth of the passenger.
+        date_of_birth (date): The date of birth of the passenger.
         passport_number (str): The passport number of the passenger.
 
     Methods:
@@ -117,8 +153,82 @@ class Passengers(Base):
     flight_id = Column(Integer, ForeignKey('flights.id'), index=True)
     first_name = Column(VARCHAR(255), index=True)
     last_name = Column(VARCHAR(255), index=True)
-    date_of_birth = Column(String, index=True)
+    date_of_birth = Column(Date, index=True)
     passport_number = Column(VARCHAR(255), index=True)
 
     departure_airport = relationship("Flights", backref="passenger_flights", foreign_keys=[flight_id])
 
+    __table_args__ = (
+        # (sort key, id) index for keyset pagination
+        Index('ix_passengers_last_name_id', 'last_name', 'id'),
+        # Fuzzy searches of both names look (last name, first name) pairs up
+        Index('ix_passengers_last_name_first_name', 'last_name', 'first_name'),
+        # pg_trgm indexes for prefix and fuzzy name searches
+        Index('ix_passengers_first_name_trgm', 'first_name', postgresql_using='gin',
+              postgresql_ops={'first_name': 'gin_trgm_ops'}),
+        Index('ix_passengers_last_name_trgm', 'last_name', postgresql_using='gin',
+              postgresql_ops={'last_name': 'gin_trgm_ops'}),
+    )
+
+
+class PassengerFirstNames(Base):
+    """
+    The PassengerFirstNames class holds every distinct passenger first name, the dictionary fuzzy first name
+    searches rank by trigram distance. Rows are added by a trigger on passengers and never removed.
+
+    Attributes:
+        name (str): A first name some passenger has, or had.
+    """
+    __tablename__ = "passenger_first_names"
+
+    name = Column(VARCHAR(255), primary_key=True)
+
+    __table_args__ = (
+        # pg_trgm index for nearest neighbour (<->) searches
+        Index('ix_passenger_first_names_name_trgm', 'name', postgresql_using='gist',
+              postgresql_ops={'name': 'gist_trgm_ops'}),
+    )
+
+
+class PassengerLastNames(Base):
+    """
+    The PassengerLastNames class holds every distinct passenger last name, the dictionary fuzzy last name
+    searches rank by trigram distance. Rows are added by a trigger on passengers and never removed.
+
+    Attributes:
+        name (str): A last name some passenger has, or had.
+    """
+    __tablename__ = "passenger_last_names"
+
+    name = Column(VARCHAR(255), primary_key=True)
+
+    __table_args__ = (
+        # pg_trgm index for nearest neighbour (<->) searches
+        Index('ix_passenger_last_names_name_trgm', 'name', postgresql_using='gist',
+              postgresql_ops={'name': 'gist_trgm_ops'}),
+    )
+
+
+class RouteFares(Base):
+    """
+    The RouteFares class is the cheapest fare summary of every route and day, kept up to date by the crud
+    functions that write flights (see route_fares).
+
+    Attributes:
+        departure_airport_id (int): The ID of the departure airport.
+        arrival_airport_id (int): The ID of the arrival airport.
+        departure_day (date): The UTC day the flights depart on.
+        min_fare (float): The lowest fare of the flights.
+        flights (int): The number of flights with a fare.
+        cheapest_flight_id (int): The ID of the flight with the lowest fare, the lowest ID on a tie.
+    """
+    __tablename__ = "route_fares"
+
+    # The primary key is the only index, every lookup is a range of it
+    departure_airport_id = Column(Integer, ForeignKey('airports.id'), primary_key=True)
+    arrival_airport_id = Column(Integer, ForeignKey('airports.id'), primary_key=True)
+    departure_day = Column(Date, primary_key=True)
+    min_fare = Column(Numeric, nullable=False)
+    flights = Column(Integer, nullable=False)
+    # Not a foreign key, the entry is refreshed after the flight was deleted, in the same transaction
+    cheapest_flight_id = Column(Integer, nullable=False)
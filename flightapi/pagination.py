@@ -0,0 +1,195 @@
+import base64
+import datetime
+import decimal
+import json
+import os
+from typing import Optional
+
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Server side cap on the page size, whatever limit the client asks for
+MAX_PAGE_SIZE = int(os.getenv('FLIGHTAPI_MAX_PAGE_SIZE', '1000'))
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor can not be decoded or was issued for another sort order"""
+
+    pass
+
+
+def page_size(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(sort: str, value, row_id: int) -> str:
+    """
+    Encode the position of the last row of a page into an opaque cursor token.
+
+    Args:
+        sort (str): The name of the sort key the page was ordered by.
+        value: The sort key value of the last row.
+        row_id (int): The primary key of the last row.
+
+    Returns:
+        str: A url safe cursor token.
+    """
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+    elif isinstance(value, decimal.Decimal):
+        value = str(value)
+    payload = json.dumps({"s": sort, "v": value, "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, sort_column) -> tuple:
+    """
+    Decode a cursor token back into the (sort value, id) position it points at.
+
+    Args:
+        cursor (str): The cursor token returned as next_cursor by a previous page.
+        sort (str): The name of the sort key of the current request.
+        sort_column: The column the sort key maps to, used to restore the value type.
+
+    Returns:
+        tuple: The sort key value and the id of the last row of the previous page.
+
+    Raises:
+        InvalidCursorError: If the token is malformed or was issued for a different sort key.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        value, row_id = payload["v"], int(payload["id"])
+        if payload["s"] != sort:
+            raise InvalidCursorError(f"Cursor was issued for sort={payload['s']}, not sort={sort}")
+        if value is not None:
+            python_type = sort_column.type.python_type
+            if python_type in (datetime.date, datetime.datetime):
+                value = python_type.fromisoformat(value)
+                if python_type is datetime.datetime and value.tzinfo is None:
+                    # Like every other input, times without an offset are UTC
+                    value = value.replace(tzinfo=datetime.timezone.utc)
+            else:
+                value = python_type(value)
+    except InvalidCursorError:
+        raise
+    # binascii.Error, raised for bad base64, is a ValueError
+    except (ValueError, KeyError, TypeError, decimal.InvalidOperation) as error:
+        raise InvalidCursorError("Malformed cursor") from error
+    return value, row_id
+
+
+def keyset_segments(statement, sort: str, sort_column, id_column, cursor: Optional[str]) -> list:
+    """
+    Split a keyset page query into index range scans that are read one after the other.
+
+    Rows are ordered by (sort_column, id_column) with NULL sort values last. A single OR'ed predicate would
+    stop Postgres from seeking straight to the cursor, so the non NULL and the NULL part of the ordering are
+    separate statements, each a range scan of a (sort_column, id) index.
+
+    Args:
+        statement: The filtered select statement to paginate.
+        sort (str): The name of the sort key.
+        sort_column: The column to sort by.
+        id_column: The unique tie breaker column.
+        cursor (str, optional): The cursor of the previous page.
+
+    Returns:
+        list: The ordered statements, to be read in sequence until the page is full.
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed or was issued for a different sort key.
+    """
+    if cursor is None:
+        value, row_id = None, None
+    else:
+        value, row_id = decode_cursor(cursor, sort, sort_column)
+    if sort_column is id_column:
+        if cursor is not None:
+            statement = statement.where(id_column > row_id)
+        return [statement.order_by(id_column)]
+
+    null_segment = statement.where(sort_column.is_(None))
+    if cursor is not None and value is None:
+        return [null_segment.where(id_column > row_id).order_by(id_column)]
+    value_segment = statement.where(sort_column.is_not(None))
+    if cursor is not None:
+        value_segment = value_segment.where(tuple_(sort_column, id_column) > tuple_(value, row_id))
+    return [value_segment.order_by(sort_column, id_column), null_segment.order_by(id_column)]
+
+
+async def fetch_page(db: AsyncSession, statement, sort: str, sort_column, id_column,
+                     cursor: Optional[str] = None, limit: int = 100,
+                     tuples: bool = False) -> tuple[list, Optional[str]]:
+    """
+    Fetch one keyset page of rows, as dicts keyed by the selected column names or as plain tuples.
+
+    Args:
+        db (AsyncSession): The async database session
+        statement: The filtered select statement, selecting columns including the sort and id columns.
+        sort (str): The name of the sort key.
+        sort_column: The column to sort by.
+        id_column: The unique tie breaker column.
+        cursor (str, optional): The cursor of the previous page. Defaults to None for the first page.
+        limit (int, optional): The requested page size, capped at MAX_PAGE_SIZE. Defaults to 100.
+        tuples (bool, optional): Return tuples in the order of the selected columns rather than dicts, for
+            callers that transpose the page into columns. Defaults to False.
+
+    Returns:
+        tuple: The rows of the page and the cursor of the next page, or None on the last page.
+    """
+    limit = page_size(limit)
+    rows = []
+    # One extra row tells whether there is a next page without a count(*)
+    for segment in keyset_segments(statement, sort, sort_column, id_column, cursor):
+        result = await db.execute(segment.limit(limit + 1 - len(rows)))
+        rows.extend(map(tuple, result) if tuples else map(dict, result.mappings()))
+        if len(rows) > limit:
+            break
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    if tuples:
+        keys = list(statement.selected_columns.keys())
+        return rows, encode_cursor(sort, last[keys.index(sort_column.key)], last[keys.index(id_column.key)])
+    return rows, encode_cursor(sort, last[sort_column.key], last[id_column.key])
+
+
+def page_rows(rows: list, sort: str, sort_column, id_column,
+              cursor: Optional[str] = None, limit: int = 100) -> tuple[list, Optional[str]]:
+    """
+    Slice one keyset page out of rows that are already in memory, with the same ordering and cursors as
+    fetch_page.
+
+    Args:
+        rows (list): The row mappings to paginate, already filtered.
+        sort (str): The name of the sort key.
+        sort_column: The column to sort by.
+        id_column: The unique tie breaker column.
+        cursor (str, optional): The cursor of the previous page. Defaults to None for the first page.
+        limit (int, optional): The requested page size, capped at MAX_PAGE_SIZE. Defaults to 100.
+
+    Returns:
+        tuple: The rows of the page and the cursor of the next page, or None on the last page.
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed or was issued for a different sort key.
+    """
+    limit = page_size(limit)
+    sort_key, id_key = sort_column.key, id_column.key
+
+    # NULL sort values go last, like the NULL segment of keyset_segments
+    def position(row):
+        return row[sort_key] is None, row[sort_key], row[id_key]
+
+    rows = sorted(rows, key=position)
+    if cursor is not None:
+        value, row_id = decode_cursor(cursor, sort, sort_column)
+        after = (value is None, value, row_id)
+        rows = [row for row in rows if position(row) > after]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(sort, last[sort_key], last[id_key])
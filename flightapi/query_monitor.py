@@ -0,0 +1,189 @@
+import contextvars
+import os
+import time
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import event
+
+from .database import engine, async_engine
+from .log_config import get_logger
+from .metrics import route_template
+
+LOGGER = get_logger(__name__)
+
+# Statements slower than this are logged together with their plan
+SLOW_QUERY_MS = float(os.getenv('FLIGHTAPI_SLOW_QUERY_MS', '200'))
+# A statement executed this many times in one request is reported as a likely N+1, e.g. a lazy loaded
+# relationship touched in a loop
+REPEATED_QUERY_THRESHOLD = int(os.getenv('FLIGHTAPI_REPEATED_QUERY_THRESHOLD', '5'))
+# The number of statements a request may execute when its endpoint has no budget of its own
+DEFAULT_QUERY_BUDGET = int(os.getenv('FLIGHTAPI_QUERY_BUDGET', '20'))
+# Meant for the test suite: a request going over its budget fails at the statement that exceeds it instead of
+# only being logged
+ENFORCE_QUERY_BUDGET = os.getenv('FLIGHTAPI_ENFORCE_QUERY_BUDGET', 'false').lower() in ('1', 'true', 'yes')
+
+EXPLAINABLE = ("select", "with", "insert", "update", "delete", "values")
+
+
+class QueryBudgetExceededError(RuntimeError):
+    """Raised, when the query budget is enforced, by the statement that takes a request over its budget."""
+    pass
+
+
+class RequestQueries:
+    """
+    The statements executed while handling one request.
+
+    Attributes:
+        endpoint (str): The method and route template of the request.
+        budget (Optional[int]): The maximum number of statements, None when unlimited.
+        count (int): The number of statements executed so far.
+        seconds (float): The total execution time of those statements.
+        statements (Counter): The number of executions of every distinct statement text.
+        slow (int): The number of statements slower than SLOW_QUERY_MS.
+    """
+
+    __slots__ = ("endpoint", "budget", "count", "seconds", "statements", "slow")
+
+    def __init__(self, endpoint: str, budget: Optional[int]):
+        self.endpoint = endpoint
+        self.budget = budget
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self.slow = 0
+
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.count > self.budget
+
+    def repeated(self) -> list[tuple[str, int]]:
+        """
+        Get the statements executed at least REPEATED_QUERY_THRESHOLD times.
+
+        Returns:
+            list[tuple[str, int]]: The statement texts and their number of executions, most repeated first.
+        """
+        return [(statement, count) for statement, count in self.statements.most_common()
+                if count >= REPEATED_QUERY_THRESHOLD]
+
+
+_request_queries = contextvars.ContextVar("flightapi_request_queries", default=None)
+
+
+def current_request_queries() -> Optional[RequestQueries]:
+    return _request_queries.get()
+
+
+def explain(conn, statement: str, parameters) -> str:
+    """
+    Get the plan of a statement that just ran, through a separate cursor on the same connection.
+
+    The EXPLAIN runs in a savepoint, so a failing EXPLAIN does not abort the request's transaction. The
+    statement is planned, not executed again.
+
+    Args:
+        conn (Connection): The connection the statement ran on.
+        statement (str): The statement, as sent to the driver.
+        parameters: The statement parameters, as sent to the driver.
+
+    Returns:
+        str: The plan, one line per node.
+    """
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT flightapi_explain")
+        try:
+            cursor.execute("EXPLAIN " + statement, parameters)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT flightapi_explain")
+            raise
+        cursor.execute("RELEASE SAVEPOINT flightapi_explain")
+        return plan
+    finally:
+        cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    queries = _request_queries.get()
+    if queries is None:
+        return
+    if ENFORCE_QUERY_BUDGET and queries.budget is not None and queries.count >= queries.budget:
+        raise QueryBudgetExceededError(
+            f"{queries.endpoint} exceeded its budget of {queries.budget} statements, "
+            f"the most executed ones: {queries.statements.most_common(3)}"
+        )
+    context._flightapi_request_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    queries = _request_queries.get()
+    if queries is None:
+        return
+    seconds = time.perf_counter() - context._flightapi_request_started
+    queries.count += 1
+    queries.seconds += seconds
+    queries.statements[statement] += 1
+
+    if seconds * 1000 < SLOW_QUERY_MS:
+        return
+    queries.slow += 1
+    plan = None
+    if not executemany and statement.lstrip().split(None, 1)[0].lower() in EXPLAINABLE:
+        try:
+            plan = explain(conn, statement, parameters)
+        except Exception as error:
+            plan = f"EXPLAIN failed: {error!r}"
+    LOGGER.warning(f"Slow statement in {queries.endpoint}, {seconds * 1000:.1f} ms: {statement}\nPlan:\n{plan}")
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryMonitorMiddleware:
+    """
+    ASGI middleware counting the statements and the database time of every request.
+
+    Requests that go over the statement budget of their endpoint, or that execute the same statement
+    REPEATED_QUERY_THRESHOLD times or more, are logged. With FLIGHTAPI_ENFORCE_QUERY_BUDGET set, going over the
+    budget raises QueryBudgetExceededError instead.
+
+    Args:
+        app: The ASGI application.
+        budgets (dict): The statement budget per route template. None turns the checks off for routes whose
+            statement count grows with the input, like the bulk and export endpoints. Routes not listed get
+            DEFAULT_QUERY_BUDGET.
+    """
+
+    def __init__(self, app, budgets: dict[str, Optional[int]]):
+        self.app = app
+        self.budgets = budgets
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = route_template(scope)
+        queries = RequestQueries(f"{scope['method']} {route}", self.budgets.get(route, DEFAULT_QUERY_BUDGET))
+        token = _request_queries.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_queries.reset(token)
+            self.report(queries)
+
+    @staticmethod
+    def report(queries: RequestQueries):
+        LOGGER.debug(f"{queries.endpoint}: {queries.count} statements, {queries.seconds * 1000:.1f} ms in the "
+                     f"database, {queries.slow} slow")
+        if queries.budget is None:
+            return
+        if queries.over_budget():
+            LOGGER.warning(f"{queries.endpoint} executed {queries.count} statements, "
+                           f"over its budget of {queries.budget}")
+        for statement, count in queries.repeated():
+            LOGGER.warning(f"Possible N+1 in {queries.endpoint}, statement executed {count} times: {statement}")
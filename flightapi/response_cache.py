@@ -0,0 +1,169 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qsl
+
+from starlette.datastructures import Headers
+
+from . import table_events
+
+# Bounded number of rendered responses kept per worker, least recently used entries are evicted first
+RESPONSE_CACHE_SIZE = int(os.getenv('FLIGHTAPI_RESPONSE_CACHE_SIZE', '1024'))
+# Entries are normally invalidated through table_events, this bounds the staleness when notifications from other
+# workers can not be received. Bookings only move flights.available_seats and do not invalidate entries, so the
+# seat counts in a cached response may also lag by up to this long, the booking itself always checks them
+RESPONSE_CACHE_TTL = float(os.getenv('FLIGHTAPI_RESPONSE_CACHE_TTL', '60'))
+# Clients may keep a response but have to revalidate it with If-None-Match, which is answered from the cache
+CACHE_CONTROL = "no-cache"
+
+
+class CachedResponse(NamedTuple):
+    """
+    A rendered 200 response.
+
+    Attributes:
+        versions (tuple): The table_events versions of the tables the response was built from.
+        created_at (float): The monotonic time the response was rendered.
+        etag (str): The quoted entity tag, a digest of the body.
+        headers (list): The raw response headers, ETag and Cache-Control included.
+        body (bytes): The response body.
+    """
+    versions: tuple
+    created_at: float
+    etag: str
+    headers: list
+    body: bytes
+
+
+class ResponseCache:
+    """
+    LRU cache of rendered GET responses, keyed by path and normalized query string.
+
+    An entry is only served while the versions of the tables it depends on are unchanged, so writes invalidate
+    it without having to know which queries they affect.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(path: str, query_string: bytes) -> tuple:
+        # Parameter order, and the order of repeated values, does not change the result of any cached endpoint
+        return path, tuple(sorted(parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)))
+
+    def get(self, key: tuple, versions: tuple) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.versions != versions or time.monotonic() - entry.created_at >= self.ttl:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: tuple, entry: CachedResponse):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+        }
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+class ResponseCacheMiddleware:
+    """
+    ASGI middleware that serves GET requests on the configured paths from RESPONSE_CACHE.
+
+    Misses run the endpoint as usual and keep its 200 response. Every response of a cached path carries an ETag
+    and Cache-Control, and a matching If-None-Match is answered with an empty 304.
+
+    Args:
+        app: The ASGI application.
+        paths (dict): The cached paths, each mapped to the names of the tables its responses are built from.
+        cache (ResponseCache, optional): The cache to use. Defaults to RESPONSE_CACHE.
+    """
+
+    def __init__(self, app, paths: dict[str, tuple[str, ...]], cache: ResponseCache = RESPONSE_CACHE):
+        self.app = app
+        self.paths = paths
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        # The versions are read before the query runs, a write that lands meanwhile makes the entry stale at once
+        versions = tuple(table_events.version(table) for table in self.paths[scope["path"]])
+        key = self.cache.key(scope["path"], scope["query_string"])
+        if_none_match = Headers(scope=scope).get("if-none-match")
+
+        entry = self.cache.get(key, versions)
+        if entry is not None:
+            await self._send(send, entry, if_none_match)
+            return
+
+        start, chunks = {}, []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        body = b"".join(chunks)
+        headers = [(name, value) for name, value in start.get("headers", [])
+                   if name.lower() not in (b"etag", b"cache-control")]
+        if start.get("status") != 200:
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        headers += [(b"etag", etag.encode()), (b"cache-control", CACHE_CONTROL.encode())]
+        entry = CachedResponse(versions, time.monotonic(), etag, headers, body)
+        self.cache.put(key, entry)
+        await self._send(send, entry, if_none_match)
+
+    async def _send(self, send, entry: CachedResponse, if_none_match: Optional[str]):
+        if etag_matches(if_none_match, entry.etag):
+            self.cache.not_modified += 1
+            headers = [(b"etag", entry.etag.encode()), (b"cache-control", CACHE_CONTROL.encode())]
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": 200, "headers": entry.headers})
+        await send({"type": "http.response.body", "body": entry.body})
@@ -0,0 +1,186 @@
+import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import Date, DateTime, Integer, and_, cast, column, delete, exists, func, select, tuple_, values
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .airport_cache import AIRPORT_CACHE
+from .metrics import track_queries
+from .models import Flights, RouteFares
+
+# First key of the transaction level advisory locks taken on (route, day) entries, the second one is a hash of
+# the entry
+LOCK_NAMESPACE = 0x726f7574
+
+ROUTE_DAY_COLUMNS = (RouteFares.departure_airport_id, RouteFares.arrival_airport_id, RouteFares.departure_day)
+
+
+def departure_day(value) -> Optional[datetime.date]:
+    # Days are UTC days. The API normalizes its inputs to UTC (schemas.flights.as_utc), naive values are taken as
+    # UTC the same way
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc)
+    return value.date()
+
+
+def route_day(flight) -> Optional[tuple[int, int, datetime.date]]:
+    """
+    Get the summary entry a flight counts towards.
+
+    Args:
+        flight: A Flights ORM object or a row mapping.
+
+    Returns:
+        Optional[tuple]: The departure airport id, the arrival airport id and the (UTC) departure day, None if
+            the flight has no route, departure time or fare.
+    """
+    if isinstance(flight, Flights):
+        flight = {key: getattr(flight, key) for key in
+                  ("departure_airport_id", "arrival_airport_id", "departure_date", "fare")}
+    key = (flight["departure_airport_id"], flight["arrival_airport_id"], departure_day(flight["departure_date"]))
+    if None in key or flight["fare"] is None:
+        return None
+    return key
+
+
+def day_start(day):
+    # The first instant of a UTC day, as a timestamptz
+    return func.timezone('UTC', cast(day, DateTime))
+
+
+def fare_aggregates() -> list:
+    return [
+        func.min(Flights.fare).label("min_fare"),
+        func.count().label("flights"),
+        func.array_agg(aggregate_order_by(Flights.id, Flights.fare, Flights.id))[1].label("cheapest_flight_id"),
+    ]
+
+
+def refresh_statements(keys: Iterable[Optional[tuple]]) -> list:
+    """
+    Build the statements that bring summary entries up to date with the flights table.
+
+    Every entry is recomputed from its flights, one range of the (departure_airport_id, arrival_airport_id,
+    departure_date) index, rather than adjusted by the change. A new cheapest fare and the removal of the
+    cheapest flight are handled the same way. The statements are run after the flights were written and
+    before the commit, so the summary changes atomically with them.
+
+    The entries are locked first, in key order. A transaction refreshing the same entry waits for the commit
+    and then aggregates in a new snapshot, so concurrent writes to one route and day are never lost.
+
+    Args:
+        keys (Iterable[Optional[tuple]]): The entries to refresh, as returned by route_day, None is ignored.
+
+    Returns:
+        list: The lock, upsert and delete statements, to be executed in this order, empty without entries.
+    """
+    keys = sorted(set(keys) - {None})
+    if not keys:
+        return []
+    route_days = values(column("departure_airport_id", Integer), column("arrival_airport_id", Integer),
+                        column("departure_day", Date), name="route_days").data(keys)
+    lock = select(func.pg_advisory_xact_lock(
+        LOCK_NAMESPACE,
+        func.hashtext(func.concat_ws("/", *route_days.c)),
+    )).select_from(route_days)
+
+    start = day_start(route_days.c.departure_day)
+    fares = (
+        select(*route_days.c, *fare_aggregates())
+        .join(Flights, and_(Flights.departure_airport_id == route_days.c.departure_airport_id,
+                            Flights.arrival_airport_id == route_days.c.arrival_airport_id,
+                            Flights.departure_date >= start,
+                            Flights.departure_date < start + datetime.timedelta(days=1),
+                            Flights.fare.is_not(None)))
+        .group_by(*route_days.c)
+    )
+    upsert = insert(RouteFares).from_select([selected.name for selected in fares.selected_columns], fares)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[key.name for key in ROUTE_DAY_COLUMNS],
+        set_={name: upsert.excluded[name] for name in ("min_fare", "flights", "cheapest_flight_id")},
+    )
+
+    start = day_start(RouteFares.departure_day)
+    emptied = (
+        delete(RouteFares)
+        .where(tuple_(*ROUTE_DAY_COLUMNS).in_(keys))
+        .where(~exists().where(Flights.departure_airport_id == RouteFares.departure_airport_id,
+                               Flights.arrival_airport_id == RouteFares.arrival_airport_id,
+                               Flights.departure_date >= start,
+                               Flights.departure_date < start + datetime.timedelta(days=1),
+                               Flights.fare.is_not(None)))
+    )
+    return [lock, upsert, emptied]
+
+
+async def refresh(db: AsyncSession, keys: Iterable[Optional[tuple]]):
+    """
+    Bring summary entries up to date inside the current transaction, see refresh_statements.
+
+    Args:
+        db (AsyncSession): The async database session, with the flight writes flushed.
+        keys (Iterable[Optional[tuple]]): The entries to refresh, as returned by route_day.
+    """
+    for statement in refresh_statements(keys):
+        await db.execute(statement)
+
+
+def rebuild_statements() -> list:
+    """
+    Build the statements that recompute the whole summary from the flights table.
+
+    Meant for bulk loads that write the flights table directly, like db_seed.
+
+    Returns:
+        list: The delete and insert statements, to be executed in this order in one transaction.
+    """
+    day = cast(func.timezone('UTC', Flights.departure_date), Date).label("departure_day")
+    fares = (
+        select(Flights.departure_airport_id, Flights.arrival_airport_id, day, *fare_aggregates())
+        .where(Flights.departure_airport_id.is_not(None), Flights.arrival_airport_id.is_not(None),
+               Flights.departure_date.is_not(None), Flights.fare.is_not(None))
+        .group_by(Flights.departure_airport_id, Flights.arrival_airport_id, day)
+    )
+    return [
+        delete(RouteFares),
+        insert(RouteFares).from_select([selected.name for selected in fares.selected_columns], fares),
+    ]
+
+
+@track_queries
+async def get_cheapest_fares(db: AsyncSession,
+                             departure_airport: str,
+                             arrival_airport: str,
+                             departure_from: Optional[datetime.date] = None,
+                             departure_to: Optional[datetime.date] = None,
+                             limit: int = 31) -> list[dict]:
+    """
+    Get the cheapest fare per day on a route from the summary, one range of its primary key.
+
+    Args:
+        db (AsyncSession): The async database session
+        departure_airport (str): The IATA code of the departure airport.
+        arrival_airport (str): The IATA code of the arrival airport.
+        departure_from (datetime.date, optional): The first (UTC) departure day. Defaults to None.
+        departure_to (datetime.date, optional): The last (UTC) departure day. Defaults to None.
+        limit (int, optional): The maximum number of days to return. Defaults to 31.
+
+    Returns:
+        list[dict]: The summary entry of every day with flights, in day order.
+    """
+    await AIRPORT_CACHE.ensure_fresh(db)
+    statement = (
+        select(*RouteFares.__table__.c)
+        .where(RouteFares.departure_airport_id.in_(AIRPORT_CACHE.airport_ids_by_code([departure_airport])),
+               RouteFares.arrival_airport_id.in_(AIRPORT_CACHE.airport_ids_by_code([arrival_airport])))
+    )
+    if departure_from is not None:
+        statement = statement.where(RouteFares.departure_day >= departure_from)
+    if departure_to is not None:
+        statement = statement.where(RouteFares.departure_day <= departure_to)
+    return list(map(dict, (await db.execute(statement.order_by(RouteFares.departure_day).limit(limit))).mappings()))
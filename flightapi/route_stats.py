@@ -0,0 +1,194 @@
+import asyncio
+import datetime
+import os
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .airport_cache import AIRPORT_CACHE
+from .export import columnar_statement, stream_partitions
+from .filters import filter_flights
+from .metrics import track_queries
+from .models import Flights
+
+EARTH_RADIUS_KM = 6371.0088
+# Upper bound on the flights a single request aggregates, wider requests are rejected rather than served slowly
+ROUTE_STATS_MAX_FLIGHTS = int(os.getenv('FLIGHTAPI_ROUTE_STATS_MAX_FLIGHTS', '1000000'))
+# Rows fetched from the server side cursor and converted to an array at a time
+ROUTE_STATS_CHUNK_SIZE = 10000
+
+
+class TooManyFlightsError(ValueError):
+    """Raised when the flights matching a route statistics request are missing filters or over the limit."""
+
+
+def haversine_km(latitude_1, longitude_1, latitude_2, longitude_2):
+    """
+    Great circle distance between two points, element wise over arrays of coordinates in degrees.
+
+    Args:
+        latitude_1: The latitudes of the first points.
+        longitude_1: The longitudes of the first points.
+        latitude_2: The latitudes of the second points.
+        longitude_2: The longitudes of the second points.
+
+    Returns:
+        numpy.ndarray: The distances in kilometers.
+    """
+    latitude_1, longitude_1, latitude_2, longitude_2 = map(np.radians,
+                                                           (latitude_1, longitude_1, latitude_2, longitude_2))
+    a = (np.sin((latitude_2 - latitude_1) / 2) ** 2
+         + np.cos(latitude_1) * np.cos(latitude_2) * np.sin((longitude_2 - longitude_1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def compute_route_stats(departure_airport_ids: np.ndarray,
+                        arrival_airport_ids: np.ndarray,
+                        durations: np.ndarray,
+                        fares: np.ndarray,
+                        latitudes: np.ndarray,
+                        longitudes: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Compute per flight distance metrics and aggregate them per route, in one vectorized pass.
+
+    Flights whose airports have no coordinates, or that have no positive duration, are left out.
+
+    Args:
+        departure_airport_ids (numpy.ndarray): The departure airport id of every flight.
+        arrival_airport_ids (numpy.ndarray): The arrival airport id of every flight.
+        durations (numpy.ndarray): The duration of every flight in minutes.
+        fares (numpy.ndarray): The fare of every flight.
+        latitudes (numpy.ndarray): Airport latitudes indexed by airport id, NaN when unknown.
+        longitudes (numpy.ndarray): Airport longitudes indexed by airport id, NaN when unknown.
+
+    Returns:
+        dict: One array per statistic, one element per route, routes ordered by departure and arrival airport.
+    """
+    distance = haversine_km(latitudes[departure_airport_ids], longitudes[departure_airport_ids],
+                            latitudes[arrival_airport_ids], longitudes[arrival_airport_ids])
+    valid = ~np.isnan(distance) & (durations > 0) & (distance > 0) & ~np.isnan(fares)
+    departure, arrival = departure_airport_ids[valid], arrival_airport_ids[valid]
+    distance, durations, fares = distance[valid], durations[valid], fares[valid]
+    fare_per_km = fares / distance
+    speed_kmh = distance / (durations / 60)
+
+    # Sorting by route makes every route a contiguous run, so each aggregate is a single reduceat
+    route = departure.astype(np.int64) * len(latitudes) + arrival
+    order = np.argsort(route, kind="stable")
+    route = route[order]
+    starts = np.flatnonzero(np.r_[True, route[1:] != route[:-1]]) if len(route) else np.array([], dtype=np.int64)
+    counts = np.diff(np.r_[starts, len(route)])
+
+    def mean(values):
+        return np.add.reduceat(values[order], starts) / counts if len(starts) else values[:0]
+
+    sorted_fares = fares[order]
+    return {
+        "departure_airport_id": departure[order][starts],
+        "arrival_airport_id": arrival[order][starts],
+        "flights": counts,
+        "distance_km": distance[order][starts],
+        "avg_fare": mean(fares),
+        "min_fare": np.minimum.reduceat(sorted_fares, starts) if len(starts) else sorted_fares,
+        "max_fare": np.maximum.reduceat(sorted_fares, starts) if len(starts) else sorted_fares,
+        "avg_fare_per_km": mean(fare_per_km),
+        "avg_duration": mean(durations),
+        "avg_speed_kmh": mean(speed_kmh),
+    }
+
+
+def airport_coordinates(airports: list[dict]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Lay airport coordinates out as arrays indexed by airport id.
+
+    Args:
+        airports (list[dict]): The airports, with id, latitude and longitude.
+
+    Returns:
+        tuple: The latitude and the longitude arrays, NaN for unknown ids and missing coordinates.
+    """
+    size = max((airport["id"] for airport in airports), default=0) + 1
+    latitudes, longitudes = np.full(size, np.nan), np.full(size, np.nan)
+    for airport in airports:
+        if airport["latitude"] is not None and airport["longitude"] is not None:
+            latitudes[airport["id"]] = airport["latitude"]
+            longitudes[airport["id"]] = airport["longitude"]
+    return latitudes, longitudes
+
+
+def _partition_array(partition: list) -> np.ndarray:
+    # numpy reads a Row element by element like any sequence, plain tuples are converted about 40 times faster.
+    # NULL durations and fares become NaN and are left out by compute_route_stats
+    return np.array(list(map(tuple, partition)), dtype=np.float64).reshape(-1, 4)
+
+
+@track_queries
+async def get_route_stats(db: AsyncSession,
+                          departure_airport: [str] = None,
+                          arrival_airport: [str] = None,
+                          departure_from: Optional[datetime.datetime] = None,
+                          departure_to: Optional[datetime.datetime] = None,
+                          limit: int = 100) -> list[dict]:
+    """
+    Get distance, fare per km and speed statistics per route.
+
+    Only the four columns the statistics need are read, through a server side cursor, and every partition is
+    converted to an array in a thread as it arrives, airport coordinates come from the airport cache. At least
+    one filter is required and at most ROUTE_STATS_MAX_FLIGHTS flights are aggregated.
+
+    Args:
+        db (AsyncSession): The async database session
+        departure_airport (list, optional): A list of departure airport IATA codes. Defaults to None.
+        arrival_airport (list, optional): A list of arrival airport IATA codes. Defaults to None.
+        departure_from (datetime, optional): The earliest departure time. Defaults to None.
+        departure_to (datetime, optional): The latest departure time. Defaults to None.
+        limit (int, optional): The maximum number of routes to return, busiest first. Defaults to 100.
+
+    Returns:
+        list[dict]: The statistics of each route.
+
+    Raises:
+        TooManyFlightsError: If no filter is given or more than ROUTE_STATS_MAX_FLIGHTS flights match.
+    """
+    if not (departure_airport or arrival_airport or departure_from or departure_to):
+        raise TooManyFlightsError("Filter by departure airport, arrival airport or departure time")
+    await AIRPORT_CACHE.ensure_fresh(db)
+    statement = filter_flights(
+        select(Flights.departure_airport_id, Flights.arrival_airport_id, Flights.duration, Flights.fare)
+        .where(Flights.departure_airport_id.is_not(None), Flights.arrival_airport_id.is_not(None)),
+        departure_airport, arrival_airport, departure_from=departure_from, departure_to=departure_to,
+        resolve_codes=AIRPORT_CACHE.airport_ids_by_code,
+    )
+    # One row past the limit is enough to tell the request is too wide
+    statement = columnar_statement(statement).limit(ROUTE_STATS_MAX_FLIGHTS + 1)
+    chunks, count = [], 0
+    async for _, partition in stream_partitions(statement, ROUTE_STATS_CHUNK_SIZE):
+        count += len(partition)
+        if count > ROUTE_STATS_MAX_FLIGHTS:
+            raise TooManyFlightsError(f"More than {ROUTE_STATS_MAX_FLIGHTS} flights match, narrow the filters")
+        chunks.append(await asyncio.to_thread(_partition_array, partition))
+    airports = AIRPORT_CACHE.rows()
+    latitudes, longitudes = airport_coordinates(airports)
+
+    def compute():
+        columns = np.concatenate(chunks) if chunks else np.empty((0, 4))
+        ids = columns[:, :2].astype(np.int64)
+        # Flights may reference airports created after the cache was loaded, those have no coordinates yet
+        known = (ids < len(latitudes)).all(axis=1)
+        return compute_route_stats(ids[known, 0], ids[known, 1], columns[known, 2], columns[known, 3],
+                                   latitudes, longitudes)
+
+    # The arrays are built and reduced outside the event loop
+    stats = await asyncio.to_thread(compute)
+    codes = {airport["id"]: airport["code"] for airport in airports}
+    busiest = np.argsort(-stats["flights"], kind="stable")[:limit]
+    return [
+        {
+            **{key: values[index].item() for key, values in stats.items()},
+            "departure_airport_code": codes.get(int(stats["departure_airport_id"][index])),
+            "arrival_airport_code": codes.get(int(stats["arrival_airport_id"][index])),
+        }
+        for index in busiest
+    ]
@@ -1,6 +1,6 @@
 from typing import Optional
 
-from pydantic import BaseModel, Json
+from pydantic import BaseModel, Json, Field
 
 
 class AirportsBase(BaseModel):
@@ -12,11 +12,15 @@ class AirportsBase(BaseModel):
         name (Optional[str]): Airport name.
         city (Optional[str]): City name.
         country (Optional[str]): Country name.
+        latitude (Optional[float]): Latitude in degrees, WGS 84.
+        longitude (Optional[float]): Longitude in degrees, WGS 84.
     """
     code: Optional[str]
     name: Optional[str]
     city: Optional[str]
     country: Optional[str]
+    latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    longitude: Optional[float] = Field(default=None, ge=-180, le=180)
 
 
 class AirportsCreate(AirportsBase):
@@ -33,6 +37,8 @@ class Airports(AirportsBase):
         name (Optional[str]): Airport name.
         city (Optional[str]): City name.
         country (Optional[str]): Country name.
+        latitude (Optional[float]): Latitude in degrees, WGS 84.
+        longitude (Optional[float]): Longitude in degrees, WGS 84.
     """
     id: int
 
@@ -44,3 +50,13 @@ class Airports(AirportsBase):
             from_attributes (bool): Whether to initialize the model from the attributes. Defaults to True.
         """
         from_attributes = True
+
+
+class NearbyAirport(Airports):
+    """
+    An airport returned by a proximity search.
+
+    Args:
+        distance_km (float): The great circle distance from the searched point in kilometers.
+    """
+    distance_km: float
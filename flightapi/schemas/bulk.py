@@ -0,0 +1,29 @@
+from typing import Generic, TypeVar
+
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+
+class BulkCreateError(BaseModel):
+    """
+    A row of a bulk create request that was rejected.
+
+    Args:
+        index (int): The position of the row in the request body.
+        detail (str): Why the row was rejected.
+    """
+    index: int
+    detail: str
+
+
+class BulkCreateResult(BaseModel, Generic[T]):
+    """
+    The outcome of a bulk create request.
+
+    Args:
+        created (list): The created rows, in request order.
+        errors (list[BulkCreateError]): The rejected rows.
+    """
+    created: list[T]
+    errors: list[BulkCreateError]
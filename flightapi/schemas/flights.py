@@ -1,6 +1,28 @@
-from typing import Optional
+import datetime
+from typing import Annotated, Optional
 
-from pydantic import BaseModel, Json
+from pydantic import AfterValidator, BaseModel, Json, Field, field_validator
+
+from .airports import Airports
+from .passengers import Passengers
+
+
+def midnight_if_date_only(value):
+    # Plain YYYY-MM-DD dates were the accepted format before the columns became timestamps
+    if isinstance(value, str) and len(value) == 10:
+        return f"{value}T00:00:00"
+    return value
+
+
+def as_utc(value: datetime.datetime) -> datetime.datetime:
+    # Times without an offset are UTC. Left naive, asyncpg would convert them from the worker's local time zone
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc)
+
+
+# A datetime normalized to an aware UTC datetime, for request bodies and query parameters alike
+UtcDatetime = Annotated[datetime.datetime, AfterValidator(as_utc)]
 
 
 class FlightsBase(BaseModel):
@@ -10,24 +32,26 @@ class FlightsBase(BaseModel):
     Args:
         flight_status (Optional[str]): The current status of the flight.
         flight_number (Optional[str]): The flight number of the flight.
-        available_seats (Optional[str]): The number of available seats on the flight.
+        available_seats (Optional[int]): The number of seats left to book, None if the inventory is not tracked.
         departure_airport_id (int): The ID of the departure airport.
         arrival_airport_id (int): The ID of the arrival airport.
-        departure_date (str): The date of the departure of the flight.
-        arrival_date (str): The date of the arrival of the flight.
+        departure_date (datetime): The departure time of the flight in UTC, plain dates mean midnight.
+        arrival_date (datetime): The arrival time of the flight in UTC, plain dates mean midnight.
         duration (int): The duration of the flight in minutes.
         fare (float): The fare of the flight.
     """
     flight_status: Optional[str]
     flight_number: Optional[str]
-    available_seats: Optional[str]
+    available_seats: Optional[int] = Field(ge=0)
     departure_airport_id: int
     arrival_airport_id: int
-    departure_date: str
-    arrival_date: str
+    departure_date: UtcDatetime
+    arrival_date: UtcDatetime
     duration: int
     fare: float
 
+    _parse_dates = field_validator("departure_date", "arrival_date", mode="before")(midnight_if_date_only)
+
 
 class FlightsCreate(FlightsBase):
     pass
@@ -37,16 +61,42 @@ class Flights(FlightsBase):
     id: int
 
 
+class FlightsWithAirports(Flights):
+    """
+    A flight, with its airports inline when requested with expand=airports.
+
+    Args:
+        departure_airport (Optional[Airports]): The departure airport.
+        arrival_airport (Optional[Airports]): The arrival airport.
+    """
+    departure_airport: Optional[Airports] = None
+    arrival_airport: Optional[Airports] = None
+
+
 class FlightsUpdate(BaseModel):
     flight_status: Optional[str]
     flight_number: Optional[str]
-    available_seats: Optional[str]
+    available_seats: Optional[int] = Field(ge=0)
     departure_airport_id: int
     arrival_airport_id: int
-    departure_date: str
-    arrival_date: str
+    departure_date: UtcDatetime
+    arrival_date: UtcDatetime
     duration: int
     fare: float
 
+    _parse_dates = field_validator("departure_date", "arrival_date", mode="before")(midnight_if_date_only)
+
     class Config:
         from_attributes = True
+
+
+class FlightManifest(BaseModel):
+    """
+    A flight and everyone booked on it.
+
+    Args:
+        flight (Flights): The flight.
+        passengers (list[Passengers]): The passengers of the flight, ordered by id.
+    """
+    flight: Flights
+    passengers: list[Passengers]
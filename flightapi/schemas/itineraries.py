@@ -0,0 +1,40 @@
+import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class ItineraryLeg(BaseModel):
+    """
+    A single flight of an itinerary.
+
+    Args:
+        id (int): The ID of the flight.
+        flight_number (Optional[str]): The flight number of the flight.
+        departure_airport_id (int): The ID of the departure airport.
+        arrival_airport_id (int): The ID of the arrival airport.
+        departure (datetime): The departure time of the flight.
+        arrival (datetime): The arrival time of the flight.
+        fare (float): The fare of the flight.
+    """
+    id: int
+    flight_number: Optional[str]
+    departure_airport_id: int
+    arrival_airport_id: int
+    departure: datetime.datetime
+    arrival: datetime.datetime
+    fare: float
+
+
+class Itinerary(BaseModel):
+    """
+    A route between two airports made of one or more connecting flights.
+
+    Args:
+        legs (list[ItineraryLeg]): The flights, in travel order.
+        total_fare (float): The sum of the fares of all legs.
+        total_duration (int): Minutes from the first departure to the last arrival, layovers included.
+    """
+    legs: list[ItineraryLeg]
+    total_fare: float
+    total_duration: int
@@ -0,0 +1,17 @@
+from typing import Generic, Optional, TypeVar
+
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    """
+    A single keyset page of results.
+
+    Args:
+        items (list): The rows of the page.
+        next_cursor (Optional[str]): Opaque token to pass as cursor to get the next page, None on the last page.
+    """
+    items: list[T]
+    next_cursor: Optional[str] = None
@@ -1,3 +1,4 @@
+import datetime
 from typing import Optional
 
 from pydantic import BaseModel, Json
@@ -11,13 +12,13 @@ class PassengersBase(BaseModel):
         flight_id (int): Flight ID.
         first_name (str): First name.
         last_name (str): Last name.
-        date_of_birth (str): Date of birth.
+        date_of_birth (date): Date of birth.
         passport_number (str): Passport number.
     """
     flight_id: int
     first_name: str
     last_name: str
-    date_of_birth: str
+    date_of_birth: datetime.date
     passport_number: str
 
 
@@ -33,7 +34,7 @@ class PassengersUpdate(BaseModel):
     flight_id: int
     first_name: str
     last_name: str
-    date_of_birth: str
+    date_of_birth: datetime.date
     passport_number: str
 
     class Config:
@@ -0,0 +1,56 @@
+import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class RouteStats(BaseModel):
+    """
+    Distance based statistics of the flights on one route.
+
+    Args:
+        departure_airport_id (int): The ID of the departure airport.
+        arrival_airport_id (int): The ID of the arrival airport.
+        departure_airport_code (Optional[str]): The IATA code of the departure airport.
+        arrival_airport_code (Optional[str]): The IATA code of the arrival airport.
+        flights (int): The number of flights the statistics are computed from.
+        distance_km (float): The great circle distance between the airports.
+        avg_fare (float): The average fare.
+        min_fare (float): The lowest fare.
+        max_fare (float): The highest fare.
+        avg_fare_per_km (float): The average fare per kilometer.
+        avg_duration (float): The average duration in minutes.
+        avg_speed_kmh (float): The average speed implied by distance and duration, in km/h.
+    """
+    departure_airport_id: int
+    arrival_airport_id: int
+    departure_airport_code: Optional[str]
+    arrival_airport_code: Optional[str]
+    flights: int
+    distance_km: float
+    avg_fare: float
+    min_fare: float
+    max_fare: float
+    avg_fare_per_km: float
+    avg_duration: float
+    avg_speed_kmh: float
+
+
+class RouteFare(BaseModel):
+    """
+    The cheapest fare on one route and day.
+
+    Args:
+        departure_airport_id (int): The ID of the departure airport.
+        arrival_airport_id (int): The ID of the arrival airport.
+        departure_day (date): The UTC day the flights depart on.
+        min_fare (float): The lowest fare of the flights.
+        flights (int): The number of flights with a fare.
+        cheapest_flight_id (int): The ID of the flight with the lowest fare, the lowest ID on a tie.
+    """
+    departure_airport_id: int
+    arrival_airport_id: int
+    departure_day: datetime.date
+    min_fare: float
+    flights: int
+    cheapest_flight_id: int
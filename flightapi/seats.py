@@ -0,0 +1,51 @@
+from sqlalchemy import update, or_
+
+from .models import Flights
+
+
+class SeatsUnavailableError(ValueError):
+    """Raised when a flight does not have enough available seats left for a booking"""
+
+    pass
+
+
+def reserve_seats(flight_id: int, seats: int = 1):
+    """
+    Build the conditional UPDATE that takes seats from a flight's inventory.
+
+    The check and the decrement are one statement, so concurrent bookings queue on the flight's row lock and
+    each one re-evaluates the condition against the committed count, the inventory can never go negative.
+    A NULL available_seats means the inventory of the flight is not tracked and always matches.
+
+    Args:
+        flight_id (int): The ID of the flight.
+        seats (int, optional): The number of seats to take. Defaults to 1.
+
+    Returns:
+        Update: The statement, returning the flight id only if the seats were taken.
+    """
+    return (
+        update(Flights.__table__)
+        .where(Flights.id == flight_id,
+               or_(Flights.available_seats.is_(None), Flights.available_seats >= seats))
+        .values(available_seats=Flights.available_seats - seats)
+        .returning(Flights.id)
+    )
+
+
+def release_seats(flight_id: int, seats: int = 1):
+    """
+    Build the UPDATE that gives seats back to a flight's inventory.
+
+    Args:
+        flight_id (int): The ID of the flight.
+        seats (int, optional): The number of seats to give back. Defaults to 1.
+
+    Returns:
+        Update: The statement.
+    """
+    return (
+        update(Flights.__table__)
+        .where(Flights.id == flight_id)
+        .values(available_seats=Flights.available_seats + seats)
+    )
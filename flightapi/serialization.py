@@ -0,0 +1,76 @@
+import decimal
+import os
+from functools import lru_cache
+from typing import Optional
+
+import orjson
+from pydantic import BaseModel, TypeAdapter
+from starlette.responses import JSONResponse
+
+# Rows read from the database already have the types of their columns, so list responses are not validated
+# against their response model again. Meant for development and the test suite: validate them anyway, with
+# errors raised rather than a malformed response sent
+VALIDATE_RESPONSES = os.getenv('FLIGHTAPI_VALIDATE_RESPONSES', 'false').lower() in ('1', 'true', 'yes')
+
+
+def _orjson_default(value):
+    # Numeric columns, the response models declare them as float
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    # UTC as Z, like pydantic
+    return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_UTC_Z)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, which encodes dates, datetimes and decimals itself."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def schema_columns(model, schema: type[BaseModel]) -> list:
+    """
+    Get the table columns of a model that make up a response schema, in the order of the schema fields.
+
+    Args:
+        model: The ORM model to select from.
+        schema (type[BaseModel]): The response schema.
+
+    Returns:
+        list: The columns to select, the rows then serialize the same way as the schema.
+    """
+    columns = model.__table__.c
+    return [columns[name] for name in schema.model_fields]
+
+
+@lru_cache(maxsize=None)
+def list_adapter(schema: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[schema])
+
+
+def page_response(schema: type[BaseModel], items: list[dict], next_cursor: Optional[str]) -> FastJSONResponse:
+    """
+    Render a page of rows without building a model per row.
+
+    FastAPI would validate every row against the response model and encode the result with the stdlib json
+    module, both a full pass over the page. The endpoints keep their response_model for the OpenAPI schema,
+    returning a response directly bypasses both passes.
+
+    Args:
+        schema (type[BaseModel]): The model of the items, only used when VALIDATE_RESPONSES is set.
+        items (list[dict]): The rows of the page, with the fields of the schema.
+        next_cursor (Optional[str]): The cursor of the next page.
+
+    Returns:
+        FastJSONResponse: The page, shaped like schemas.pagination.Page.
+
+    Raises:
+        ValidationError: If VALIDATE_RESPONSES is set and a row does not match the schema.
+    """
+    if VALIDATE_RESPONSES:
+        list_adapter(schema).validate_python(items)
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
@@ -0,0 +1,139 @@
+import asyncio
+from collections import defaultdict
+from typing import Callable, Optional
+
+import asyncpg
+
+from .db_config import DATABASE_URL
+from .log_config import get_logger
+
+LOGGER = get_logger(__name__)
+
+# The triggers publish the name of the written table on this channel, optionally followed by a colon and the
+# comma separated ids of the written rows
+CHANNEL = "flightapi_table_changed"
+RECONNECT_DELAY = 5
+
+_versions: dict[str, int] = defaultdict(int)
+_subscribers: dict[str, list[Callable[[Optional[list[int]]], None]]] = defaultdict(list)
+_connection: Optional[asyncpg.Connection] = None
+_reconnect_task: Optional[asyncio.Task] = None
+_stopping = False
+
+
+def version(table: str) -> int:
+    """
+    Return the local version stamp of a table, it changes every time the table is written by any worker.
+
+    Args:
+        table (str): The table name.
+
+    Returns:
+        int: The version stamp.
+    """
+    return _versions[table]
+
+
+def bump(table: str):
+    """
+    Mark a table as changed in this worker.
+
+    Crud functions call this right after their commit so that the writing worker never serves stale data, the
+    notification coming back from Postgres bumps the version once more, which is harmless.
+
+    Args:
+        table (str): The table name.
+    """
+    _versions[table] += 1
+
+
+def subscribe(table: str, callback: Callable[[Optional[list[int]]], None]):
+    """
+    Get called, on the event loop, whenever another connection writes a table.
+
+    Args:
+        table (str): The table name.
+        callback: Called with the ids of the written rows, or with None when they are unknown: the statement
+            wrote too many rows to list them, or notifications may have been missed.
+    """
+    _subscribers[table].append(callback)
+
+
+def _publish(table: str, ids: Optional[list[int]]):
+    for callback in _subscribers.get(table, ()):
+        try:
+            callback(ids)
+        except Exception:
+            LOGGER.exception(f"Table change subscriber for {table} failed")
+
+
+def _publish_all_unknown():
+    for table in list(_versions):
+        bump(table)
+    for table in list(_subscribers):
+        _publish(table, None)
+
+
+def listening() -> bool:
+    return _connection is not None and not _connection.is_closed()
+
+
+def _on_notification(connection, pid, channel, payload):
+    table, _, ids = payload.partition(":")
+    bump(table)
+    _publish(table, [int(row_id) for row_id in ids.split(",")] if ids else None)
+
+
+def _on_termination(connection):
+    global _connection
+    _connection = None
+    # Notifications may have been missed, so everything cached from any table is suspect
+    _publish_all_unknown()
+    if not _stopping:
+        LOGGER.warning("Lost the table change listener connection, reconnecting")
+        _schedule_reconnect()
+
+
+def _schedule_reconnect():
+    global _reconnect_task
+    if _reconnect_task is None or _reconnect_task.done():
+        _reconnect_task = asyncio.get_running_loop().create_task(_reconnect())
+
+
+async def _reconnect():
+    while not _stopping and not listening():
+        await asyncio.sleep(RECONNECT_DELAY)
+        await start_listener()
+
+
+async def start_listener():
+    """
+    Open a dedicated connection that LISTENs for table change notifications.
+
+    Failing to connect is not fatal, the caches then fall back to their maximum age.
+    """
+    global _connection, _stopping
+    _stopping = False
+    if listening():
+        return
+    try:
+        connection = await asyncpg.connect(DATABASE_URL)
+        await connection.add_listener(CHANNEL, _on_notification)
+    except (OSError, asyncpg.PostgresError) as error:
+        LOGGER.warning(f"Could not listen for table changes: {error}")
+        _schedule_reconnect()
+        return
+    connection.add_termination_listener(_on_termination)
+    _connection = connection
+    # Anything written while nobody was listening is unknown
+    _publish_all_unknown()
+
+
+async def stop_listener():
+    global _connection, _stopping
+    _stopping = True
+    if _reconnect_task is not None:
+        _reconnect_task.cancel()
+    if _connection is not None:
+        connection, _connection = _connection, None
+        await connection.close()
@@ -0,0 +1,70 @@
+import datetime
+import decimal
+import io
+
+import pytest
+
+from flightapi import export
+from flightapi.async_crud import FLIGHTS_LIST_COLUMNS
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+DEPARTURE = datetime.datetime(2026, 10, 18, 9, 30, tzinfo=datetime.timezone.utc)
+FARE = decimal.Decimal("199.99")
+
+
+def flight(flight_id, fare=FARE, seats=12) -> dict:
+    return {"flight_status": "scheduled", "flight_number": f"FT{flight_id}", "available_seats": seats,
+            "departure_airport_id": 1, "arrival_airport_id": 2, "departure_date": DEPARTURE,
+            "arrival_date": DEPARTURE + datetime.timedelta(hours=7), "duration": 420, "fare": fare, "id": flight_id}
+
+
+def as_tuple(row: dict) -> tuple:
+    return tuple(row[column.key] for column in FLIGHTS_LIST_COLUMNS)
+
+
+def test_arrow_schema_follows_the_column_types():
+    schema = export.arrow_schema(FLIGHTS_LIST_COLUMNS)
+    types = {field.name: field.type for field in schema}
+
+    assert schema.names == [column.key for column in FLIGHTS_LIST_COLUMNS]
+    assert types["id"] == pa.int32()
+    assert types["fare"] == pa.float64()
+    assert types["departure_date"] == pa.timestamp("us", tz="UTC")
+    assert types["flight_number"] == pa.string()
+
+
+def test_record_batch_converts_decimals_and_keeps_nulls():
+    schema = export.arrow_schema(FLIGHTS_LIST_COLUMNS)
+    rows = [as_tuple(flight(1)), as_tuple(flight(2, fare=None, seats=None))]
+
+    batch = export.record_batch(schema, FLIGHTS_LIST_COLUMNS, list(zip(*rows)))
+
+    assert batch.num_rows == 2
+    assert batch.column(batch.schema.get_field_index("fare")).to_pylist() == [199.99, None]
+    assert batch.column(batch.schema.get_field_index("available_seats")).to_pylist() == [12, None]
+    assert batch.column(batch.schema.get_field_index("departure_date")).to_pylist() == [DEPARTURE, DEPARTURE]
+
+
+@pytest.mark.parametrize("table_format", ["arrow", "parquet"])
+def test_table_response_round_trip(table_format):
+    response = export.table_response(FLIGHTS_LIST_COLUMNS, [as_tuple(flight(1)), as_tuple(flight(2))],
+                                     table_format, "next")
+
+    if table_format == "arrow":
+        table = pa.ipc.open_stream(response.body).read_all()
+    else:
+        table = pq.read_table(io.BytesIO(response.body))
+    assert table.column("id").to_pylist() == [1, 2]
+    assert response.headers["x-next-cursor"] == "next"
+    assert response.media_type == export.MEDIA_TYPES[table_format]
+
+
+def test_empty_table_response_is_typed():
+    response = export.table_response(FLIGHTS_LIST_COLUMNS, [], "arrow", None)
+
+    table = pa.ipc.open_stream(response.body).read_all()
+    assert table.num_rows == 0
+    assert table.schema == export.arrow_schema(FLIGHTS_LIST_COLUMNS)
+    assert "x-next-cursor" not in response.headers
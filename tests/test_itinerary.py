@@ -0,0 +1,160 @@
+import asyncio
+import datetime
+
+import pytest
+
+from flightapi import itinerary, table_events
+from flightapi.itinerary import FlightIndex
+
+NOW = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+LEG_KEYS = [column.key for column in itinerary.LEG_COLUMNS]
+
+
+def flight_row(flight_id, departure_airport_id, arrival_airport_id, departure, duration=60, fare=100):
+    return (flight_id, f"FT{flight_id}", departure_airport_id, arrival_airport_id, departure, duration, fare)
+
+
+def loaded_index(rows) -> FlightIndex:
+    index = FlightIndex()
+    legs = itinerary._legs_from_partition(LEG_KEYS, rows)
+    index._legs, index._departures = {leg.id: leg for leg in legs}, itinerary._build_departures(legs)
+    index._loaded_at = 0
+    return index
+
+
+def itinerary_ids(itineraries) -> list[tuple[int, ...]]:
+    return [tuple(leg.id for leg in legs) for legs in itineraries]
+
+
+class FailingEngine:
+    # Stands in for async_engine when the database can not be reached
+    def connect(self):
+        return self
+
+    async def __aenter__(self):
+        raise OSError("connection refused")
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def stream_failing_once(rows):
+    calls = []
+
+    async def stream_partitions(statement):
+        calls.append(statement)
+        if len(calls) == 1:
+            raise OSError("connection reset")
+        yield LEG_KEYS, rows
+    return stream_partitions, calls
+
+
+async def wait_until(predicate, timeout: float = 5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_failed_load_is_retried(monkeypatch):
+    stream_partitions, calls = stream_failing_once([flight_row(1, 10, 20, NOW + datetime.timedelta(hours=2))])
+    monkeypatch.setattr(itinerary, "stream_partitions", stream_partitions)
+    monkeypatch.setattr(itinerary, "FLIGHT_INDEX_RETRY_DELAY", 0)
+    monkeypatch.setattr(table_events, "listening", lambda: True)
+
+    async def run():
+        index = FlightIndex()
+        index._changed.set()
+        task = asyncio.create_task(index._maintain())
+        try:
+            await wait_until(lambda: index.loaded)
+        finally:
+            task.cancel()
+        return index
+
+    index = asyncio.run(run())
+
+    assert len(calls) == 2
+    assert len(index) == 1
+
+
+def test_failed_refetch_keeps_the_changed_flights(monkeypatch):
+    monkeypatch.setattr(itinerary, "async_engine", FailingEngine())
+    index = FlightIndex()
+    index._reload = False
+    index._changed_ids = {3, 1, 2}
+
+    with pytest.raises(OSError):
+        asyncio.run(index.apply_changes())
+
+    assert index._changed_ids == {1, 2, 3}
+    assert not index._reload
+
+
+def test_departed_flights_are_not_offered():
+    index = loaded_index([flight_row(1, 10, 20, NOW - datetime.timedelta(hours=2), fare=50),
+                          flight_row(2, 10, 20, NOW + datetime.timedelta(hours=2), fare=150)])
+
+    assert itinerary_ids(index.search(10, 20)) == [(2,)]
+    assert itinerary_ids(index.search(10, 20, earliest_departure=NOW - datetime.timedelta(hours=3))) == [(1,), (2,)]
+
+
+def test_departure_day_starts_at_the_earliest_departure():
+    day = datetime.datetime(2026, 10, 18, tzinfo=datetime.timezone.utc)
+    index = loaded_index([flight_row(1, 10, 20, day + datetime.timedelta(hours=8), fare=50),
+                          flight_row(2, 10, 20, day + datetime.timedelta(hours=14), fare=150),
+                          flight_row(3, 10, 20, day + datetime.timedelta(hours=26), fare=10)])
+
+    assert itinerary_ids(index.search(10, 20, departure_date=day.date(),
+                                      earliest_departure=day + datetime.timedelta(hours=12))) == [(2,)]
+
+
+BASE = datetime.datetime(2026, 10, 18, tzinfo=datetime.timezone.utc)
+
+
+def at(hours: float) -> datetime.datetime:
+    return BASE + datetime.timedelta(hours=hours)
+
+
+# Airport 10 is the origin and 20 the destination, connections go through 30 and 40
+NETWORK = [
+    flight_row(1, 10, 20, at(1), fare=500),
+    flight_row(2, 10, 30, at(1), fare=100),
+    flight_row(3, 30, 20, at(3), fare=100),
+    flight_row(4, 30, 20, at(2 + 20 / 60), fare=50),  # 20 minutes after flight 2 lands
+    flight_row(5, 30, 20, at(16), fare=60),  # 14 hours after flight 2 lands
+    flight_row(6, 30, 40, at(3), fare=10),
+    flight_row(7, 40, 20, at(5), fare=10),
+    flight_row(8, 30, 10, at(3), fare=1),  # back to the origin
+]
+
+
+@pytest.mark.parametrize("kwargs, expected", [
+    ({}, [(2, 6, 7), (2, 3), (1,)]),
+    ({"max_legs": 2}, [(2, 3), (1,)]),
+    ({"max_legs": 1}, [(1,)]),
+    ({"min_layover": 15}, [(2, 6, 7), (2, 4), (2, 3), (1,)]),
+    ({"max_layover": 900}, [(2, 6, 7), (2, 5), (2, 3), (1,)]),
+    ({"sort": "duration"}, [(1,), (2, 3), (2, 6, 7)]),
+    ({"limit": 1}, [(2, 6, 7)]),
+])
+def test_search(kwargs, expected):
+    index = loaded_index(NETWORK)
+
+    assert itinerary_ids(index.search(10, 20, earliest_departure=BASE, **kwargs)) == expected
+
+
+def test_search_without_route():
+    index = loaded_index(NETWORK)
+
+    assert index.search(20, 10, earliest_departure=BASE) == []
+    assert index.search(10, 99, earliest_departure=BASE) == []
+
+
+def test_upsert_and_remove_update_the_search():
+    index = loaded_index(NETWORK)
+
+    index.upsert(dict(zip(LEG_KEYS, flight_row(9, 10, 20, at(2), fare=90))))
+    index.remove(6)
+
+    assert itinerary_ids(index.search(10, 20, earliest_departure=BASE)) == [(9,), (2, 3), (1,)]
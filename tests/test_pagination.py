@@ -0,0 +1,91 @@
+import base64
+import datetime
+import decimal
+import json
+
+import pytest
+
+from flightapi.models import Airports, Flights
+from flightapi.pagination import InvalidCursorError, decode_cursor, encode_cursor, page_rows
+
+
+def raw_cursor(payload) -> str:
+    # A token built by hand, the way a client tampering with a cursor would
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("sort, column, value", [
+    ("id", Flights.id, 42),
+    ("departure_date", Flights.departure_date,
+     datetime.datetime(2026, 10, 18, 9, 30, tzinfo=datetime.timezone.utc)),
+    ("fare", Flights.fare, decimal.Decimal("199.99")),
+    ("code", Airports.code, "JFK"),
+    ("fare", Flights.fare, None),
+])
+def test_cursor_round_trip(sort, column, value):
+    cursor = encode_cursor(sort, value, 7)
+
+    assert decode_cursor(cursor, sort, column) == (value, 7)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor("code", "???>>>", 1)
+
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+
+
+def test_cursor_for_another_sort_is_rejected():
+    cursor = encode_cursor("fare", decimal.Decimal("10"), 1)
+
+    with pytest.raises(InvalidCursorError, match="sort=fare"):
+        decode_cursor(cursor, "departure_date", Flights.departure_date)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    "e30",  # {}
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+    raw_cursor(["fare", 1, 2]),
+    raw_cursor({"s": "fare", "v": "10"}),
+    raw_cursor({"s": "fare", "v": "ten", "id": 1}),
+    raw_cursor({"s": "fare", "v": "10", "id": "one"}),
+    raw_cursor({"s": "fare", "v": [10], "id": 1}),
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, "fare", Flights.fare)
+
+
+@pytest.mark.parametrize("value", ["yesterday", 20261018])
+def test_tampered_datetime_cursor_is_rejected(value):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(raw_cursor({"s": "departure_date", "v": value, "id": 1}), "departure_date",
+                      Flights.departure_date)
+
+
+def test_page_rows_walks_all_rows_once_with_nulls_last():
+    rows = [{"id": row_id, "fare": fare} for row_id, fare in
+            enumerate([decimal.Decimal("5"), None, decimal.Decimal("1"), decimal.Decimal("5"), None])]
+
+    pages, cursor = [], None
+    while True:
+        page, cursor = page_rows(rows, "fare", Flights.fare, Flights.id, cursor=cursor, limit=2)
+        pages.append([row["id"] for row in page])
+        if cursor is None:
+            break
+
+    assert pages == [[2, 0], [3, 1], [4]]
+
+
+def test_page_rows_rejects_a_cursor_for_another_sort():
+    cursor = encode_cursor("id", 1, 1)
+
+    with pytest.raises(InvalidCursorError):
+        page_rows([{"id": 1, "fare": None}], "fare", Flights.fare, Flights.id, cursor=cursor)
+
+
+def test_naive_datetime_cursor_is_utc():
+    cursor = raw_cursor({"s": "departure_date", "v": "2026-10-18T09:30:00", "id": 1})
+
+    assert decode_cursor(cursor, "departure_date", Flights.departure_date) == (
+        datetime.datetime(2026, 10, 18, 9, 30, tzinfo=datetime.timezone.utc), 1)
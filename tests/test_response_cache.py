@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from flightapi import response_cache, table_events
+from flightapi.response_cache import CachedResponse, ResponseCache, ResponseCacheMiddleware, etag_matches
+
+
+def entry(versions=(1,), created_at=0.0, body=b"[]") -> CachedResponse:
+    return CachedResponse(versions=versions, created_at=created_at, etag='"abc"', headers=[], body=body)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_key_ignores_parameter_order():
+    assert ResponseCache.key("/flights/list", b"b=2&a=1&a=0") == ResponseCache.key("/flights/list", b"a=0&b=2&a=1")
+    assert ResponseCache.key("/flights/list", b"a=1") != ResponseCache.key("/airports/list", b"a=1")
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.put("a", entry(created_at=clock[0]))
+    cache.put("b", entry(created_at=clock[0]))
+    assert cache.get("a", (1,)) is not None
+
+    cache.put("c", entry(created_at=clock[0]))
+
+    assert cache.get("b", (1,)) is None
+    assert cache.get("a", (1,)) is not None
+    assert cache.get("c", (1,)) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_changed_versions_are_a_miss(clock):
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.put("a", entry(versions=(1, 1), created_at=clock[0]))
+
+    assert cache.get("a", (1, 2)) is None
+    assert cache.get("a", (1, 1)) is not None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.put("a", entry(created_at=clock[0]))
+
+    clock[0] += 59.9
+    assert cache.get("a", (1,)) is not None
+    clock[0] += 0.1
+    assert cache.get("a", (1,)) is None
+
+
+@pytest.mark.parametrize("if_none_match, matches", [
+    (None, False),
+    ('"abc"', True),
+    ('"xyz"', False),
+    ('"xyz", "abc"', True),
+    ('W/"abc"', True),
+    ("*", True),
+])
+def test_etag_matches(if_none_match, matches):
+    assert etag_matches(if_none_match, '"abc"') is matches
+
+
+def test_middleware_serves_revalidates_and_invalidates():
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"items":[]}'})
+
+    middleware = ResponseCacheMiddleware(app, paths={"/airports/list": ("airports",)},
+                                         cache=ResponseCache(max_entries=8, ttl=60))
+
+    async def get(headers=()):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+        scope = {"type": "http", "method": "GET", "path": "/airports/list", "query_string": b"limit=10",
+                 "headers": list(headers)}
+        await middleware(scope, None, send)
+        response_headers = dict(messages[0].get("headers", []))
+        return messages[0]["status"], response_headers, b"".join(m.get("body", b"") for m in messages[1:])
+
+    async def run():
+        status, headers, body = await get()
+        assert (status, body) == (200, b'{"items":[]}')
+        etag = headers[b"etag"]
+
+        assert (await get())[0] == 200
+        assert len(calls) == 1
+        status, _, body = await get([(b"if-none-match", etag)])
+        assert (status, body) == (304, b"")
+
+        table_events.bump("airports")
+        assert (await get())[0] == 200
+        assert len(calls) == 2
+
+    asyncio.run(run())
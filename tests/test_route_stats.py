@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from flightapi.route_stats import airport_coordinates, compute_route_stats, haversine_km
+
+# Airport ids 1 to 3, id 4 has no coordinates
+AIRPORTS = [
+    {"id": 1, "latitude": 40.6413, "longitude": -73.7781},  # JFK
+    {"id": 2, "latitude": 51.4700, "longitude": -0.4543},  # LHR
+    {"id": 3, "latitude": 0.0, "longitude": 0.0},
+    {"id": 4, "latitude": None, "longitude": None},
+]
+
+
+def test_haversine_known_distances():
+    distances = haversine_km(np.array([40.6413, 0.0, 10.0]), np.array([-73.7781, 0.0, 20.0]),
+                             np.array([51.4700, 0.0, 10.0]), np.array([-0.4543, 1.0, 20.0]))
+
+    assert distances[0] == pytest.approx(5540, abs=5)
+    assert distances[1] == pytest.approx(111.195, abs=0.01)
+    assert distances[2] == 0
+
+
+def test_airport_coordinates_are_indexed_by_id():
+    latitudes, longitudes = airport_coordinates(AIRPORTS)
+
+    assert len(latitudes) == 5
+    assert latitudes[2] == 51.47 and longitudes[1] == -73.7781
+    assert np.isnan(latitudes[0]) and np.isnan(latitudes[4])
+
+
+def test_compute_route_stats_aggregates_per_route():
+    latitudes, longitudes = airport_coordinates(AIRPORTS)
+    stats = compute_route_stats(
+        departure_airport_ids=np.array([2, 1, 1, 1, 1, 1, 4]),
+        arrival_airport_ids=np.array([1, 2, 2, 2, 2, 3, 1]),
+        durations=np.array([480.0, 420.0, 460.0, 0.0, 420.0, 600.0, 300.0]),
+        fares=np.array([300.0, 500.0, 700.0, 100.0, np.nan, 200.0, 100.0]),
+        latitudes=latitudes,
+        longitudes=longitudes,
+    )
+
+    # No duration, no fare and no coordinates are left out, routes come in airport id order
+    assert stats["departure_airport_id"].tolist() == [1, 1, 2]
+    assert stats["arrival_airport_id"].tolist() == [2, 3, 1]
+    assert stats["flights"].tolist() == [2, 1, 1]
+    assert stats["avg_fare"][0] == 600
+    assert (stats["min_fare"][0], stats["max_fare"][0]) == (500, 700)
+    assert stats["avg_duration"][0] == 440
+    distance = stats["distance_km"][0]
+    assert stats["distance_km"][2] == pytest.approx(distance)
+    assert stats["avg_fare_per_km"][0] == pytest.approx((500 / distance + 700 / distance) / 2)
+    assert stats["avg_speed_kmh"][0] == pytest.approx((distance / 7 + distance / (460 / 60)) / 2)
+
+
+def test_compute_route_stats_without_flights():
+    latitudes, longitudes = airport_coordinates(AIRPORTS)
+    empty = np.array([], dtype=np.int64)
+
+    stats = compute_route_stats(empty, empty, np.array([]), np.array([]), latitudes, longitudes)
+
+    assert all(len(values) == 0 for values in stats.values())